@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+# リポジトリ直下をimportパスに入れる(tests/ から mmd を読み込めるようにする)
@@ -31,6 +31,25 @@ if __name__ == "__main__":
     parser.add_argument('--audio-file', type=str, dest='audio_file', default='', help='Audio file path')
     parser.add_argument('--lyrics-file', type=str, dest='lyrics_file', default='', help='Audio file path')
     parser.add_argument('--threshold', type=float, dest='threshold', default=0.2, help='threshold')
+    parser.add_argument('--jobs', type=int, dest='jobs', default=0, help='Number of parallel alignment jobs (0: CPU count)')
+    parser.add_argument('--julius-path', type=str, dest='julius_path', default='', help='Julius executable path')
+    parser.add_argument('--julius-server', type=int, dest='julius_server', default=0, help='Julius mode (0: one-shot, 1: resident module server)')
+    parser.add_argument('--cache-dir', type=str, dest='cache_dir', default='', help='Alignment cache dir (default: <audio-dir>/cache)')
+    parser.add_argument('--separator', type=str, dest='separator', default='spleeter:2stems', help='Vocal separator (spleeter model name, or identity)')
+    parser.add_argument('--chunk-sec', type=float, dest='chunk_sec', default=0, help='Separate audio in chunks of this length (0: whole audio at once)')
+    parser.add_argument('--chunk-overlap-sec', type=float, dest='chunk_overlap_sec', default=2, help='Cross-fade length between separation chunks')
+    parser.add_argument('--vocals-full', type=int, dest='vocals_full', default=0, help='Also save the vocal stem at the original sample rate (1: save)')
+    parser.add_argument('--audio-batch', type=str, dest='audio_batch', default='', help='Audio dir or list file (one path per line) to separate with one separator')
+    parser.add_argument('--separator-warmup', type=int, dest='separator_warmup', default=1, help='Warm up the separator on a short silent buffer before batch runs (0: off)')
+    parser.add_argument('--manifest', type=str, dest='manifest', default='', help='CSV/JSONL list of songs (audio, lyrics, output) to process in one run')
+    parser.add_argument('--audio-dir-glob', type=str, dest='audio_dir_glob', default='', help='Glob of audio files to process in one run (lyrics: same name .txt)')
+    parser.add_argument('--audio-adapter', type=str, dest='audio_adapter', default='ffmpeg', help='Audio I/O (ffmpeg, or numpy: WAV read/write/resample without ffmpeg)')
+    parser.add_argument('--vad-threshold-db', type=float, dest='vad_threshold_db', default=-35, help='Segment: silence level relative to the loud (95th percentile) frames in dB')
+    parser.add_argument('--vad-min-silence', type=float, dest='vad_min_silence', default=0.3, help='Segment: shortest silence (sec) used as a block boundary')
+    parser.add_argument('--block-max-len', type=int, dest='block_max_len', default=100, help='Segment: maximum characters per lyrics block')
+    parser.add_argument('--vmd-file', type=str, dest='vmd_file', default='', help='Exo: regenerate from this lip VMD instead of the .lab files')
+    parser.add_argument('--morph-smooth', type=int, dest='morph_smooth', default=0, help='Lip: smooth the vowel morph keys with a OneEuro filter (1: on)')
+    parser.add_argument('--morph-exclusive', type=int, dest='morph_exclusive', default=0, help='Lip: keep only the strongest vowel morph at each frame (1: on)')
     parser.add_argument('--verbose', type=int, dest='verbose', default=20, help='Log level')
     parser.add_argument("--log-mode", type=int, dest='log_mode', default=0, help='Log output mode')
 
@@ -42,16 +61,34 @@ if __name__ == "__main__":
 
     logger.info("MMD自動トレース（リップ）開始\n　処理対象映像ファイル: {0}\n　処理内容: {1}", args.audio_file, args.process, decoration=MLogger.DECORATION_BOX)
 
-    if result and "vocals" in args.process:
-        # リップモーション生成
+    if args.manifest or args.audio_dir_glob:
+        # 複数曲を1プロセスで一括処理
+        import mmd.batch
+        result = mmd.batch.execute(args)
+    elif result and "vocals" in args.process:
+        # 音声分離
         import mmd.vocals
-        result, args.audio_dir = mmd.vocals.execute(args)
-
-    if result and "lip" in args.process:
+        if args.audio_batch:
+            # 複数の音声を同じ分離器で一括分離(歌詞は曲ごとなのでリップ生成は行わない)
+            result, _ = mmd.vocals.execute_batch(args)
+        else:
+            result, args.audio_dir = mmd.vocals.execute(args)
+
+    if result and "segment" in args.process and not (args.audio_batch or args.manifest or args.audio_dir_glob):
+        # 無音区間から歌詞のブロック区間を推定
+        import mmd.segment
+        result = mmd.segment.execute(args)
+
+    if result and "lip" in args.process and not (args.audio_batch or args.manifest or args.audio_dir_glob):
         # リップモーション生成
         import mmd.lip
         result = mmd.lip.execute(args)
 
+    if result and "exo" in args.process and not (args.audio_batch or args.manifest or args.audio_dir_glob):
+        # 音素解析結果(もしくはリップモーション)からexoだけを作り直す
+        import mmd.exo
+        result = mmd.exo.execute(args)
+
     elapsed_time = time.time() - start
 
     logger.info("MMD自動トレース（リップ）終了\n　処理対象映像ファイル: {0}\n　処理内容: {1}\n　トレース結果: {2}\n　処理時間: {3}", \
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# OneEuroFilter を1サンプルずつ呼ぶ場合と、配列版(one_euro)でまとめて処理する場合の処理速度を比べる
+# 例: python filter_benchmark.py --samples 1000000 --tracks 6
+import argparse
+import time
+
+import numpy as np
+
+from mmd.mmd.VmdData import OneEuroFilter, one_euro
+
+# VmdMotion.smooth_filter_mf / smooth_filter_bf と同じ設定
+CONFIG = {"freq": 30, "mincutoff": 0.3, "beta": 0.01, "dcutoff": 0.25}
+
+
+def run_objects(values: np.ndarray, timestamps: np.ndarray):
+    out = np.empty_like(values)
+    for tidx in range(values.shape[0]):
+        xfilter = OneEuroFilter(**CONFIG)
+        for idx in range(values.shape[1]):
+            out[tidx, idx] = xfilter(float(values[tidx, idx]), int(timestamps[idx]))
+
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, dest='samples', default=1000000, help='Total number of samples (split over the tracks)')
+    parser.add_argument('--tracks', type=int, dest='tracks', default=1, help='Number of tracks filtered in one call')
+    parser.add_argument('--object-samples', type=int, dest='object_samples', default=100000, help='Samples for the per-sample object version (0: skip)')
+
+    args = parser.parse_args()
+
+    try:
+        import numba
+        print(f"numba: {numba.__version__}")
+    except ImportError:
+        print("numba: not installed (pure Python kernel)")
+
+    rng = np.random.default_rng(0)
+    track_len = max(1, args.samples // args.tracks)
+    values = rng.random((args.tracks, track_len))
+    # キーの間隔はまばら(1～5フレーム)
+    timestamps = np.cumsum(rng.integers(1, 6, track_len)).astype(np.float64)
+
+    # 初回はJITコンパイルを含むので、短い配列で済ませておく
+    one_euro(values[:, :10], timestamps[:10], **CONFIG)
+
+    start = time.time()
+    out = one_euro(values, timestamps, **CONFIG)
+    elapsed_sec = time.time() - start
+    print(f"one_euro: {values.size} samples ({args.tracks} tracks): {elapsed_sec:.3f}s, {values.size / max(elapsed_sec, 1e-9) / 1000000:.2f}M samples/s")
+
+    if args.object_samples > 0:
+        object_len = max(1, min(track_len, args.object_samples // args.tracks))
+        start = time.time()
+        expected = run_objects(values[:, :object_len], timestamps[:object_len])
+        elapsed_sec = time.time() - start
+        print(f"OneEuroFilter: {expected.size} samples: {elapsed_sec:.3f}s, {expected.size / max(elapsed_sec, 1e-9) / 1000000:.2f}M samples/s")
+        print(f"max diff: {np.max(np.abs(expected - out[:, :object_len]))}")
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# 各処理の起動時に読み込まれるモジュールと、その読み込み時間を計測する(python -X importtime)
+# 例: python import_benchmark.py --stage lip --top 15
+import argparse
+import subprocess
+import sys
+import time
+
+# 処理ごとに executor.py が読み込むモジュール
+STAGE_MODULES = {
+    "vocals": "mmd.vocals",
+    "segment": "mmd.segment",
+    "lip": "mmd.lip",
+    "exo": "mmd.exo",
+    "batch": "mmd.batch",
+}
+
+# 読み込まれていれば起動が遅くなるモジュール
+HEAVY_MODULES = ["tensorflow", "spleeter", "cv2", "librosa", "numba", "ffmpeg", "tqdm"]
+
+
+def measure(module_name: str):
+    start = time.time()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    elapsed_sec = time.time() - start
+
+    imports = []
+    errors = []
+    for line in process.stderr.decode('utf-8', errors='replace').splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+
+        cols = line[len("import time:"):].split("|")
+        if len(cols) != 3 or not cols[0].strip().isdigit():
+            # 見出し行
+            continue
+
+        # 区切りの後の空白1つを除く(残りの字下げは入れ子の深さ)
+        imports.append((cols[2][1:].rstrip(), int(cols[0]), int(cols[1])))
+
+    return process.returncode, elapsed_sec, imports, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stage', type=str, dest='stage', default='vocals,segment,lip,batch', help='Stages to measure (comma separated)')
+    parser.add_argument('--top', type=int, dest='top', default=10, help='Number of slowest imports to show')
+
+    args = parser.parse_args()
+
+    for stage in args.stage.split(","):
+        module_name = STAGE_MODULES[stage.strip()]
+        returncode, elapsed_sec, imports, errors = measure(module_name)
+
+        print(f"[{stage}] import {module_name}: {elapsed_sec:.3f}s (process), {len(imports)} modules")
+        if returncode != 0:
+            # 依存パッケージが入っていない環境など
+            print("  import failed: " + (errors[-1] if errors else f"returncode={returncode}"))
+
+        loaded = set(name.strip().split(".")[0] for name, _, _ in imports)
+        print("  heavy modules: " + (", ".join(m for m in HEAVY_MODULES if m in loaded) or "none"))
+
+        # 入れ子の最上位(先頭に空白がないもの)が実際に呼び出し元から読み込まれたモジュール
+        top_imports = sorted([(name, cumulative) for name, _, cumulative in imports if not name.startswith(" ")], key=lambda x: -x[1])
+        for name, cumulative in top_imports[:args.top]:
+            print(f"  {cumulative / 1000000:8.3f}s  {name}")
@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+#
+# Julius による強制アライメント(segment_julius.pl のPython版)
+#
+import os
+import re
+import hashlib
+import queue
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+from mmd.utils.MLogger import MLogger
+from mmd.kana import yomi2voca
+
+logger = MLogger(__name__)
+
+# Julius実行ファイル
+if os.name == "nt":
+    JULIUS_PATH = os.path.join("bin", "julius-4.6.exe")
+else:
+    JULIUS_PATH = "/content/julius/julius/julius"
+
+# 音響モデル(monophone)
+HMMDEFS_PATH = os.path.join("models", "hmmdefs_monof_mix16_gid.binhmm")
+
+# Juliusへのその他オプション
+JULIUS_OPTIONS = ["-palign", "-input", "file"]
+
+# 結果のオフセット(ms): 25ms / 2
+OFFSET_ALIGN = 0.0125
+
+# モジュールモードの待ち受けポート(0: 起動毎に空いているポートを選ぶ)
+JULIUS_MODULE_PORT = 0
+
+RE_PALIGN = re.compile(r"\[ *(\d+) *(\d+)\] *[0-9\.-]+ *(.*)$")
+RE_WORD_ID = re.compile(r"\[(w_\d+)\]")
+RE_MODULE_ATTR = re.compile(r'(\w+)="([^"]*)"')
+
+
+class PhonemeSegment:
+    def __init__(self, start_s: float, end_s: float, unit: str):
+        self.start_s = start_s
+        self.end_s = end_s
+        self.unit = unit
+
+    def __iter__(self):
+        return iter((self.start_s, self.end_s, self.unit))
+
+    def __str__(self):
+        return "<PhonemeSegment start_s:{0}, end_s:{1}, unit:{2}>".format(self.start_s, self.end_s, self.unit)
+
+
+# 単語(音素列)を順番に並べるだけのDFA文法
+def build_dfa(words: list):
+    num = len(words) - 1
+    lines = []
+    for i in range(num + 1):
+        lines.append("{0} {1} {2} 0 {3}\n".format(i, num - i, i + 1, 1 if i == 0 else 0))
+    lines.append("{0} -1 -1 1 0\n".format(num + 1))
+
+    return "".join(lines)
+
+
+# DFA文法に対応する辞書
+def build_dict(words: list):
+    return "".join(["{0} [w_{0}] {1}\n".format(i, w) for i, w in enumerate(words)])
+
+
+# 歌詞(ひらがな)から単語リストを生成する(空行は無視)
+def build_words(hira_text: str):
+    return [yomi2voca(v) for v in hira_text.splitlines() if v.strip()]
+
+
+# -palign の出力を音素区間に変換する
+def parse_palign(lines, words: list):
+    segments = []
+    is_align = False
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.rstrip("\r\n")
+
+        if "begin forced alignment" in line:
+            is_align = True
+            continue
+
+        if "end forced alignment" in line:
+            return segments
+
+        if is_align and line.startswith("["):
+            if len(words) > 1:
+                m = RE_WORD_ID.search(line)
+                if m:
+                    line = line.replace(m.group(1), words[int(m.group(1)[2:])], 1)
+
+            m = RE_PALIGN.search(line)
+            if not m:
+                continue
+
+            segments.append(frame2segment(int(m.group(1)), int(m.group(2)), m.group(3)))
+
+    # 終了まで出力されなかった場合は失敗扱い
+    return None
+
+
+# モジュールモードのアライメント結果(<ALIGN>～</ALIGN>)を音素区間に変換する
+def parse_module_align(lines: list):
+    segments = []
+    for line in lines:
+        attrs = dict(RE_MODULE_ATTR.findall(line))
+        if "BEGINFRAME" not in attrs or "ENDFRAME" not in attrs:
+            continue
+
+        unit = attrs.get("PHONE", attrs.get("WORD", ""))
+        segments.append(frame2segment(int(attrs["BEGINFRAME"]), int(attrs["ENDFRAME"]), unit))
+
+    return segments
+
+
+# フレーム番号(10ms単位)から音素区間を生成する
+def frame2segment(begin_frame: int, end_frame: int, unit: str):
+    start_s = begin_frame * 0.01
+    if begin_frame != 0:
+        start_s += OFFSET_ALIGN
+    end_s = (end_frame + 1) * 0.01 + OFFSET_ALIGN
+
+    return PhonemeSegment(round(start_s, 7), round(end_s, 7), unit)
+
+
+# WaveSurfer形式のラベルファイルを出力する
+def write_lab(path: str, segments: list):
+    with open(path, "w") as f:
+        for start_s, end_s, unit in segments:
+            f.write("%.7f %.7f %s\n" % (start_s, end_s, unit))
+
+
+# WaveSurfer形式のラベルファイルを読み込む
+def read_lab(path: str):
+    segments = []
+    with open(path, "r") as f:
+        for v in f.readlines():
+            if not v.strip():
+                continue
+            start_s, end_s, unit = v.split()
+            segments.append(PhonemeSegment(float(start_s), float(end_s), unit))
+
+    return segments
+
+
+class JuliusAligner:
+    def __init__(self, julius_path=None, hmmdefs=HMMDEFS_PATH, hlist=None, options=None, timeout=30):
+        self.julius_path = julius_path if julius_path else JULIUS_PATH
+        self.hmmdefs = hmmdefs
+        self.hlist = hlist
+        self.options = list(JULIUS_OPTIONS if options is None else options)
+        self.timeout = timeout
+
+    # 文法・辞書以外のJulius起動引数
+    def base_command(self):
+        command = [self.julius_path, "-h", self.hmmdefs]
+        if self.hlist:
+            command.extend(["-hlist", self.hlist])
+        command.extend(self.options)
+
+        return command
+
+    # 1ブロック分の強制アライメント
+    # 並列実行されるため、ここではログを出さずに結果のみ返す(失敗時はNone)
+    def align(self, wav_path: str, hira_text: str):
+        words = build_words(hira_text)
+        if len(words) == 0:
+            return None
+
+        with GrammarFiles(words) as (dfa_path, dict_path):
+            command = self.base_command() + ["-dfa", dfa_path, "-v", dict_path]
+            return self.run(command, wav_path, words)
+
+    def close(self):
+        pass
+
+    def run(self, command: list, wav_path: str, words: list):
+        try:
+            popen = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except OSError:
+            return None
+
+        # タイムアウトしたら強制終了(標準出力が閉じて解析が終わる)
+        timer = threading.Timer(self.timeout, popen.kill)
+        timer.start()
+        try:
+            popen.stdin.write("{0}\n".format(wav_path).encode("utf-8"))
+            popen.stdin.close()
+
+            # ログファイルを経由せず、標準出力をそのまま解析する
+            return parse_palign(popen.stdout, words)
+        except (OSError, ValueError):
+            return None
+        finally:
+            timer.cancel()
+            if popen.poll() is None:
+                popen.kill()
+            popen.stdout.close()
+            popen.wait()
+
+
+# Juliusにはファイルで渡す必要があるため、文法・辞書を一時ファイルにだけ書き出す
+class GrammarFiles:
+    def __init__(self, words: list):
+        self.words = words
+        self.paths = []
+
+    def __enter__(self):
+        for suffix, txt in [(".dfa", build_dfa(self.words)), (".dict", build_dict(self.words))]:
+            fd, path = tempfile.mkstemp(suffix=suffix)
+            self.paths.append(path)
+            with os.fdopen(fd, "w") as f:
+                f.write(txt)
+
+        return self.paths
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for path in self.paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# モジュールモードで常駐させたJulius
+# 音響モデルは起動時に一度だけ読み込み、以降はブロック毎に文法(CHANGEGRAM)と音声ファイル(標準入力)を送る
+class JuliusServer:
+    def __init__(self, aligner: JuliusAligner, port=JULIUS_MODULE_PORT):
+        self.aligner = aligner
+        self.port = port
+        self.popen = None
+        self.sock = None
+        self.reader = None
+        # 起動に失敗した場合は以降ワンショットで処理する
+        self.is_available = True
+
+    def align(self, wav_path: str, hira_text: str):
+        words = build_words(hira_text)
+        if len(words) == 0:
+            return None
+
+        if self.is_available:
+            try:
+                segments = self.run(wav_path, words)
+                if segments is not None:
+                    return segments
+            except (OSError, ValueError):
+                pass
+
+            # 通信できなかったプロセスは捨てる(次のブロックで再起動)
+            self.close()
+
+        # 常駐プロセスで処理できなかった場合、ワンショットで処理する
+        return self.aligner.align(wav_path, hira_text)
+
+    def run(self, wav_path: str, words: list):
+        if self.popen is None:
+            # 起動時の文法はそのまま今回のブロックに使う
+            with GrammarFiles(words) as (dfa_path, dict_path):
+                if not self.start(dfa_path, dict_path):
+                    self.is_available = False
+                    return None
+        else:
+            # 文法を差し替える
+            self.send("CHANGEGRAM block\n{0}DFAEND\n{1}DICEND\n".format(build_dfa(words), build_dict(words)))
+
+        # 音声ファイル名を渡すと認識が始まる
+        self.popen.stdin.write("{0}\n".format(wav_path).encode("utf-8"))
+        self.popen.stdin.flush()
+
+        while True:
+            message = self.receive()
+            if message is None:
+                return None
+
+            if any(["<RECOGFAIL" in v or "<REJECTED" in v for v in message]):
+                # 認識失敗はプロセスを残したまま失敗扱い
+                return []
+
+            if any(["<ALIGN" in v for v in message]):
+                return parse_module_align(message)
+
+    def start(self, dfa_path: str, dict_path: str):
+        port = self.port if self.port > 0 else find_free_port()
+        if is_port_in_use(port):
+            # 他のJulius(別のリップ生成など)が待ち受けているポートには繋がない(結果が入れ替わる)
+            return False
+
+        command = self.aligner.base_command() + ["-dfa", dfa_path, "-v", dict_path, "-module", str(port)]
+        try:
+            self.popen = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError:
+            self.popen = None
+            return False
+
+        # 音響モデルの読み込みが終わると待ち受けが始まる
+        deadline = time.time() + self.aligner.timeout
+        while time.time() < deadline and self.popen.poll() is None:
+            try:
+                self.sock = socket.create_connection(("localhost", port), timeout=self.aligner.timeout)
+                self.reader = self.sock.makefile("r", encoding="utf-8", errors="replace")
+            except OSError:
+                time.sleep(0.1)
+                continue
+
+            if self.popen.poll() is None:
+                return True
+
+            # 起動したJuliusが待ち受けられずに終了していた場合、繋がった先は別のプロセス
+            break
+
+        self.close()
+        return False
+
+    def send(self, txt: str):
+        self.sock.sendall(txt.encode("utf-8"))
+
+    # モジュールのメッセージは "." だけの行で区切られる
+    def receive(self):
+        message = []
+        for line in self.reader:
+            line = line.rstrip("\r\n")
+            if line == ".":
+                return message
+            message.append(line)
+
+        # 切断された
+        return None
+
+    def close(self):
+        if self.sock:
+            try:
+                self.send("DIE\n")
+            except OSError:
+                pass
+            try:
+                self.reader.close()
+                self.sock.close()
+            except OSError:
+                pass
+        if self.popen:
+            try:
+                self.popen.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.popen.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                self.popen.kill()
+                self.popen.wait()
+
+        self.popen = None
+        self.sock = None
+        self.reader = None
+
+
+# 並列ワーカー数分の常駐Julius
+# base_port を指定した場合はワーカー毎に+1したポート、0の場合はサーバー毎に空いているポートを使う
+class JuliusServerPool:
+    def __init__(self, aligner: JuliusAligner, size: int, base_port=JULIUS_MODULE_PORT):
+        self.servers = queue.Queue()
+        for n in range(size):
+            self.servers.put(JuliusServer(aligner, base_port + n if base_port > 0 else 0))
+
+    def align(self, wav_path: str, hira_text: str):
+        server = self.servers.get()
+        try:
+            return server.align(wav_path, hira_text)
+        finally:
+            self.servers.put(server)
+
+    def close(self):
+        while not self.servers.empty():
+            self.servers.get().close()
+
+
+# 空いているポート(一度バインドして、OSが割り当てた番号を返す)
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+# 既に待ち受けているプロセスがあるか
+def is_port_in_use(port: int):
+    try:
+        with socket.create_connection(("localhost", port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+# 音響モデルのハッシュ値(ファイル更新時のみ再計算)
+_model_digests = {}
+_model_digest_lock = threading.Lock()
+
+
+def get_model_digest(path: str):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    with _model_digest_lock:
+        if key not in _model_digests:
+            _model_digests[key] = get_file_digest(path)
+
+        return _model_digests[key]
+
+
+def get_file_digest(path: str):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+# ブロック音声・音素列・音響モデル・Juliusオプションをキーにしたアライメント結果のキャッシュ
+# 歌詞の一部だけを直して再実行した場合、変更のないブロックはJuliusを実行しない
+class CachedAligner:
+    def __init__(self, backend, julius: JuliusAligner, cache_dir: str):
+        self.backend = backend
+        self.julius = julius
+        self.cache_dir = cache_dir
+        self.hit_cnt = 0
+        self.miss_cnt = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def cache_key(self, wav_path: str, words: list):
+        digest = hashlib.sha1()
+        # ブロック音声(PCM)
+        with open(wav_path, "rb") as f:
+            digest.update(f.read())
+        # 音素列
+        digest.update(b"\0")
+        digest.update("|".join(words).encode("utf-8"))
+        # 音響モデル
+        digest.update(b"\0")
+        for path in [self.julius.hmmdefs, self.julius.hlist]:
+            if path:
+                digest.update(get_model_digest(path).encode("utf-8"))
+        # Juliusオプション
+        digest.update(b"\0")
+        digest.update(" ".join(self.julius.options).encode("utf-8"))
+
+        return digest.hexdigest()
+
+    def cache_path(self, key: str):
+        return os.path.join(self.cache_dir, key[:2], "{0}.lab".format(key))
+
+    def align(self, wav_path: str, hira_text: str):
+        words = build_words(hira_text)
+        if len(words) == 0:
+            return None
+
+        try:
+            key = self.cache_key(wav_path, words)
+        except OSError:
+            # キーが作れない場合はキャッシュを使わない
+            return self.backend.align(wav_path, hira_text)
+
+        path = self.cache_path(key)
+        if os.path.exists(path):
+            try:
+                segments = read_lab(path)
+                with self.lock:
+                    self.hit_cnt += 1
+                return segments
+            except (OSError, ValueError):
+                # 壊れたキャッシュは作り直す
+                pass
+
+        with self.lock:
+            self.miss_cnt += 1
+
+        segments = self.backend.align(wav_path, hira_text)
+
+        if segments:
+            # 失敗結果はキャッシュしない
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = "{0}.{1}.tmp".format(path, threading.get_ident())
+            write_lab(tmp_path, segments)
+            os.replace(tmp_path, path)
+
+        return segments
+
+    def close(self):
+        self.backend.close()
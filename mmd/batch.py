@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+import os
+import csv
+import json
+import glob
+import time
+import argparse
+import pathlib
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from mmd.utils.MLogger import MLogger
+
+logger = MLogger(__name__)
+
+
+# 1曲分の処理対象
+class BatchJob:
+    def __init__(self, audio_file: str, lyrics_file: str, audio_dir: str):
+        self.audio_file = audio_file
+        self.lyrics_file = lyrics_file
+        self.audio_dir = audio_dir
+        # 処理時間(秒)
+        self.separate_sec = 0
+        self.lip_sec = 0
+        # 分離した音声の長さ(秒)
+        self.audio_sec = 0
+        self.result = True
+
+
+# 一覧ファイル(CSV/JSONL)もしくはglobで指定された複数曲を、1プロセスで続けて処理する
+# 音声分離(N+1曲目)とリップ生成(N曲目)は並行して行う
+def execute(args):
+    try:
+        jobs = list_jobs(args)
+        logger.info('一括処理開始: {0}曲', len(jobs), decoration=MLogger.DECORATION_BOX)
+
+        if not jobs:
+            logger.error("一括処理対象の曲がありません。\n{0}", args.manifest or args.audio_dir_glob, decoration=MLogger.DECORATION_BOX)
+            return False
+
+        start = time.time()
+        setup_sec = 0
+        separator = None
+        is_vocals = "vocals" in args.process
+        is_segment = "segment" in args.process
+        is_lip = "lip" in args.process
+
+        if not is_vocals:
+            # 音声分離しない場合、分離済みの音声がない曲は処理しない
+            preflight_audio_dirs(jobs)
+
+        if is_segment or is_lip:
+            # 音声分離の前に全曲の歌詞を検証し、誤りのある曲は処理しない
+            preflight_lyrics(jobs, is_timed=not is_segment)
+
+        if is_vocals:
+            import mmd.vocals
+
+            # 分離器(TFのグラフと重み)は1回だけ生成する
+            separator = mmd.vocals.create_separator(args.separator)
+            if args.separator_warmup:
+                mmd.vocals.warmup_separator(separator)
+            setup_sec = time.time() - start
+            logger.info("分離器準備完了: {0:.2f}秒", setup_sec)
+
+        if is_segment:
+            import mmd.segment
+
+        if is_lip:
+            import mmd.lip
+
+        def separate(job: BatchJob):
+            if not job.result:
+                return
+
+            separate_start = time.time()
+            try:
+                job.audio_sec = mmd.vocals.separate_file(make_job_args(args, job), separator, job.audio_file, job.audio_dir)
+            except Exception as e:
+                logger.error("音声分離に失敗しました。\n{0}\n{1}", job.audio_file, e, decoration=MLogger.DECORATION_BOX)
+                job.result = False
+            job.separate_sec = time.time() - separate_start
+
+        # 音声分離は1本のスレッドで、1曲先まで進めておく
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(separate, jobs[0]) if is_vocals else None
+
+            for jidx, job in enumerate(jobs):
+                if future:
+                    future.result()
+                    future = pool.submit(separate, jobs[jidx + 1]) if jidx + 1 < len(jobs) else None
+
+                job_args = make_job_args(args, job)
+
+                if job.result and is_segment:
+                    # 推定した区間付きの歌詞ファイルでリップ生成する
+                    job.result = mmd.segment.execute(job_args)
+
+                if job.result and is_lip:
+                    lip_start = time.time()
+                    job.result = mmd.lip.execute(job_args)
+                    job.lip_sec = time.time() - lip_start
+
+                logger.info("【No.{0}】{1}: {2}", f'{jidx:03}', "成功" if job.result else "失敗", job.audio_dir)
+
+        show_summary(jobs, setup_sec, time.time() - start)
+
+        return all(job.result for job in jobs)
+    except Exception as e:
+        logger.critical("一括処理で予期せぬエラーが発生しました。", e, decoration=MLogger.DECORATION_BOX)
+        return False
+
+
+# 処理対象の曲一覧
+def list_jobs(args):
+    rows = []
+
+    if args.manifest:
+        base_dir = os.path.dirname(os.path.abspath(args.manifest))
+
+        with open(args.manifest, "r", encoding='utf-8') as f:
+            if os.path.splitext(args.manifest)[1].lower() == ".csv":
+                # 列名: audio, lyrics, output
+                rows = [row for row in csv.DictReader(f)]
+            else:
+                # 1行1曲のJSON
+                rows = [json.loads(line) for line in f.readlines() if line.strip()]
+
+        # 相対パスは一覧ファイルからの位置
+        for row in rows:
+            for key in ["audio", "lyrics", "output"]:
+                if row.get(key):
+                    row[key] = os.path.join(base_dir, row[key].strip())
+    else:
+        # 歌詞は音声ファイルと同じ名前のtxt
+        for audio_file in sorted(glob.glob(args.audio_dir_glob)):
+            rows.append({"audio": audio_file, "lyrics": os.path.splitext(audio_file)[0] + ".txt"})
+
+    is_vocals = "vocals" in args.process
+
+    jobs = []
+    for row in rows:
+        audio_file = row.get("audio") or ""
+        audio_dir = row.get("output") or ""
+
+        if not audio_dir:
+            # 出力先の指定がない場合、単体処理と同じ命名(親パス指定があればその下)
+            base_path = args.parent_dir if args.parent_dir else str(pathlib.Path(audio_file).parent)
+            if is_vocals:
+                audio_dir = os.path.join(base_path, "{0}_{1:%Y%m%d_%H%M%S}".format(os.path.basename(audio_file).replace('.', '_'), datetime.datetime.now()))
+            else:
+                # 音声分離しない場合は、以前に分離したディレクトリを使う(見つからなければ空)
+                audio_dir = find_separated_dir(base_path, audio_file)
+
+        jobs.append(BatchJob(audio_file, row.get("lyrics") or "", audio_dir))
+
+    return jobs
+
+
+# 単体処理と同じ命名で分離済みのディレクトリのうち、一番新しいもの
+def find_separated_dir(base_path: str, audio_file: str):
+    dir_prefix = "{0}_".format(os.path.basename(audio_file).replace('.', '_'))
+    dir_pattern = os.path.join(glob.escape(base_path), glob.escape(dir_prefix) + "[0-9]" * 8 + "_" + "[0-9]" * 6)
+
+    # 日時は名前順に並ぶ
+    for audio_dir in sorted(glob.glob(dir_pattern), reverse=True):
+        if os.path.exists(os.path.join(audio_dir, "vocals.wav")):
+            return audio_dir
+
+    return ""
+
+
+# 分離済みの音声がない曲をまとめて表示する
+def preflight_audio_dirs(jobs: list):
+    for jidx, job in enumerate(jobs):
+        if not job.audio_dir:
+            logger.error("【No.{0}】出力先(output)の指定がなく、分離済みの音声ディレクトリも見つかりません。\n{1}", f'{jidx:03}', job.audio_file, decoration=MLogger.DECORATION_BOX)
+            job.result = False
+        elif not os.path.exists(os.path.join(job.audio_dir, "vocals.wav")):
+            logger.error("【No.{0}】音声ディレクトリに分離済みの音声(vocals.wav)がありません。\n{1}", f'{jidx:03}', job.audio_dir, decoration=MLogger.DECORATION_BOX)
+            job.result = False
+
+    logger.info("音声ディレクトリ検証終了: 分離済み {0}/{1}曲", len([job for job in jobs if job.result]), len(jobs))
+
+
+# 歌詞ファイルの誤りをまとめて表示する
+def preflight_lyrics(jobs: list, is_timed: bool):
+    from mmd.lyrics import read_lyrics
+
+    for jidx, job in enumerate(jobs):
+        if not os.path.exists(job.lyrics_file):
+            logger.error("【No.{0}】歌詞ファイルが存在しません。\n{1}", f'{jidx:03}', job.lyrics_file, decoration=MLogger.DECORATION_BOX)
+            job.result = False
+            continue
+
+        _, errors = read_lyrics(job.lyrics_file, is_timed=is_timed)
+        if errors:
+            logger.error("【No.{0}】歌詞ファイルに誤りがあります。\n{1}\n{2}", f'{jidx:03}', "\n".join([str(e) for e in errors]), job.lyrics_file, decoration=MLogger.DECORATION_BOX)
+            job.result = False
+
+    logger.info("歌詞検証終了: 誤りなし {0}/{1}曲", len([job for job in jobs if job.result]), len(jobs))
+
+
+# 1曲分の引数(元の引数はそのまま)
+def make_job_args(args, job: BatchJob):
+    job_args = argparse.Namespace(**vars(args))
+    job_args.audio_file = job.audio_file
+    job_args.lyrics_file = job.lyrics_file
+    job_args.audio_dir = job.audio_dir
+
+    return job_args
+
+
+def show_summary(jobs: list, setup_sec: float, elapsed_sec: float):
+    lines = []
+    for jidx, job in enumerate(jobs):
+        lines.append("【No.{0}】{1} 音声長: {2:.1f}秒, 音声分離: {3:.1f}秒, リップ生成: {4:.1f}秒 {5}".format( \
+                     f'{jidx:03}', "成功" if job.result else "失敗", job.audio_sec, job.separate_sec, job.lip_sec, os.path.basename(job.audio_file)))
+
+    separate_sec = sum(job.separate_sec for job in jobs)
+    lip_sec = sum(job.lip_sec for job in jobs)
+
+    # 並行処理できた分、各工程の合計より全体の処理時間が短くなる
+    logger.info('一括処理終了: 成功 {0}/{1}曲\n{2}\n　分離器準備: {3:.1f}秒, 音声分離合計: {4:.1f}秒, リップ生成合計: {5:.1f}秒\n　全体: {6:.1f}秒(並行処理による短縮: {7:.1f}秒)', \
+                len([job for job in jobs if job.result]), len(jobs), "\n".join(lines), setup_sec, separate_sec, lip_sec, \
+                elapsed_sec, setup_sec + separate_sec + lip_sec - elapsed_sec, decoration=MLogger.DECORATION_BOX)
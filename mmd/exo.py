@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+#
+# AviUtl 拡張編集のオブジェクトファイル(exo)出力
+#
+import os
+import re
+import math
+import datetime
+
+from mmd.utils.MLogger import MLogger
+
+logger = MLogger(__name__)
+
+# exoテンプレート
+EXO_HEAD_PATH = os.path.join("config", "exo.head.txt")
+EXO_CHARA_PATH = os.path.join("config", "exo.chara.txt")
+
+# テキストオブジェクトの文字列(UTF-16LEの16進)の長さ
+EXO_TEXT_LEN = 4096
+# 書き込みバッファのサイズ
+EXO_BUFFER_SIZE = 1024 * 1024
+
+# テンプレートの差し込み位置(<<名前>>)
+RE_SLOT = re.compile(r'<<(\w+)>>')
+
+VOWELS = ["a", "i", "u", "e", "o", "a:", "i:", "u:", "e:", "o:"]
+ENDS = ["N"]
+
+
+class ExoTemplate:
+    """ Template parsed once into literal segments and named slots.
+    """
+
+    def __init__(self, txt: str):
+        # 文字列と差し込み位置を交互に並べる(奇数番目が差し込み位置の名前)
+        self.segments = RE_SLOT.split(txt)
+        self.slots = [(sidx, name) for sidx, name in enumerate(self.segments) if sidx % 2 == 1]
+
+    def render(self, values: dict):
+        parts = list(self.segments)
+        for sidx, name in self.slots:
+            parts[sidx] = str(values[name])
+
+        return "".join(parts)
+
+
+# テンプレートはファイル毎に1回だけ読み込む
+_templates = {}
+
+
+def load_template(path: str):
+    if path not in _templates:
+        with open(path, "r", encoding='shift-jis') as f:
+            _templates[path] = ExoTemplate(f.read())
+
+    return _templates[path]
+
+
+class ExoWriter:
+    """ Write the exo header and one text object per syllable through a large
+    buffered Shift-JIS stream.
+    """
+
+    def __init__(self, path: str, length: int, head_path=EXO_HEAD_PATH, chara_path=EXO_CHARA_PATH):
+        self.path = path
+        self.chara_template = load_template(chara_path)
+        self.f = open(path, "w", encoding='shift-jis', buffering=EXO_BUFFER_SIZE)
+        self.f.write(load_template(head_path).render({"length": length}))
+
+    def write_chara(self, index: int, start_fno: int, end_fno: int, layer: int, kana: str):
+        self.f.write(self.chara_template.render({"index": index, "start_fno": start_fno, "end_fno": end_fno, "layer": layer, \
+                                                 "encoded_txt": encode_exo_text(kana)}))
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# unicode_escapeで桁が取れない半角英数字は、これまで通り出力しない
+ASCII_DELETE_TABLE = dict.fromkeys(range(0x80))
+
+
+# 一度作った文字列は使い回す(音節の種類は限られている)
+_exo_texts = {}
+
+
+# テキストオブジェクト用の文字列(UTF-16LEの16進)を、exoの桁数まで0で埋めたもの
+def encode_exo_text(txt: str):
+    encoded_txt = _exo_texts.get(txt)
+    if encoded_txt is None:
+        # 0埋めはバイト列のまま行う(16進にすると1バイトが"00"になる)
+        encoded_txt = _exo_texts[txt] = txt.translate(ASCII_DELETE_TABLE).encode('utf-16-le').ljust(EXO_TEXT_LEN // 2, b'\x00').hex()
+
+    return encoded_txt
+
+
+# 音声の長さ(サンプル数)からexoの長さ(30fps)
+# 横軸（時間）の最後の値(np.arange(0, 長さ/rate, 1/rate)[-1]と同じ値を、配列を作らずに求める)
+def calc_end_fno(sample_cnt: int, rate: int):
+    time_cnt = int(math.ceil((sample_cnt / rate) / (1 / rate)))
+    end_time = (time_cnt - 1) * (1 / rate)
+
+    return int(math.ceil(end_time * 30))
+
+
+class LabSyllable:
+    """ One phoneme of an alignment result (.lab), with the range (seconds and
+    frames) that both the lip morphs and the exo text object use.
+    """
+
+    def __init__(self, syllable: str, start_s: float, end_s: float, prev_syllable: str, prev_start_s: float, start_fno: int):
+        self.syllable = syllable
+        # 前後に余白を付けた区間(秒)
+        self.start_s = start_s
+        self.end_s = end_s
+        self.prev_syllable = prev_syllable
+        self.prev_start_s = prev_start_s
+        # キーフレは前の音素の開始から、この音素の終了まで
+        self.start_fno = start_fno + round(prev_start_s * 30)
+        self.end_fno = start_fno + round(end_s * 30)
+        # exoに出す音節の音素(母音もしくは「ん」のみ。前が子音の場合は繋げる)
+        self.chara = ""
+        if syllable in VOWELS or syllable in ENDS:
+            self.chara = prev_syllable + syllable if prev_syllable not in VOWELS else syllable
+
+
+# 音素区間(.lab)を、前の音素と合わせて1つずつ返す
+def iter_lab_syllables(lab_txts: list, start_fno: int):
+    prev_start_s = 0
+    prev_syllable = ""
+
+    for start_s_txt, end_s_txt, syllable in lab_txts:
+        start_s = min(len(lab_txts), max(0, float(start_s_txt) - 0.05))
+        end_s = min(len(lab_txts), max(0, float(end_s_txt) + 0.05))
+
+        yield LabSyllable(syllable, start_s, end_s, prev_syllable, prev_start_s, start_fno)
+
+        prev_start_s = start_s
+        prev_syllable = syllable
+
+
+# 音素区間(.lab)から、exoに出す音節の(開始フレーム, 終了フレーム, 音素)を求める(リップ生成と同じ区間)
+def iter_lab_labels(lab_txts: list, start_fno: int):
+    for lab in iter_lab_syllables(lab_txts, start_fno):
+        if lab.chara:
+            yield lab.start_fno, lab.end_fno, lab.chara
+
+
+# リップモーションの母音モーフから、exoに出す(開始フレーム, 終了フレーム, 音素)を求める
+# 子音は分からないので母音だけになる。0のキーに挟まれた区間をひとつの音節とする
+def iter_vmd_labels(motion):
+    labels = []
+    for vowel, morph_name in [("a", "あ"), ("i", "い"), ("u", "う"), ("e", "え"), ("o", "お")]:
+        if morph_name not in motion.morphs:
+            continue
+
+        start_fno = None
+        is_open = False
+        for fno in sorted(motion.morphs[morph_name].keys()):
+            ratio = motion.calc_mf(morph_name, fno).ratio
+            if ratio == 0:
+                if is_open and start_fno is not None:
+                    labels.append((start_fno, fno, vowel))
+                start_fno = fno
+                is_open = False
+            else:
+                is_open = True
+
+    return sorted(labels)
+
+
+# 音素解析結果(.lab)もしくはリップモーションから、exoだけを作り直す
+def execute(args):
+    try:
+        logger.info('exo再生成処理開始: {0}', args.audio_dir, decoration=MLogger.DECORATION_BOX)
+
+        if not os.path.exists(args.audio_dir):
+            logger.error("指定された音声ディレクトリパスが存在しません。\n{0}", args.audio_dir, decoration=MLogger.DECORATION_BOX)
+            return False
+
+        from mmd.kana import phoneme2kana
+        from mmd.utils.MAudioUtils import load_monaural_16k
+
+        data, org_rate = load_monaural_16k(args.audio_dir, args.audio_adapter)
+        end_fno = calc_end_fno(data.shape[0], org_rate)
+
+        labels = []
+        if args.vmd_file:
+            from mmd.mmd.VmdReader import VmdReader
+            labels = iter_vmd_labels(VmdReader(args.vmd_file).read_data())
+        else:
+            from mmd.lyrics import read_lyrics
+            from mmd.align import read_lab
+
+            lyrics_blocks, lyrics_errors = read_lyrics(args.lyrics_file)
+            if lyrics_errors:
+                logger.error("歌詞ファイルに誤りがあります。\n{0}\n{1}", "\n".join([str(e) for e in lyrics_errors]), args.lyrics_file, decoration=MLogger.DECORATION_BOX)
+                return False
+
+            for tidx, lyrics_block in enumerate(lyrics_blocks):
+                lab_file = os.path.join(args.audio_dir, f"{tidx:03}", 'block.lab')
+                if not os.path.exists(lab_file):
+                    logger.warning("【No.{0}】音素解析結果がないため、スキップします。\n{1}", f'{tidx:03}', lab_file)
+                    continue
+                labels.extend(iter_lab_labels(read_lab(lab_file), int(lyrics_block.start_sec * 30)))
+
+        process_datetime = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        exo_file_path = os.path.join(args.audio_dir, f"{process_datetime}_lyric.exo")
+
+        with ExoWriter(exo_file_path, end_fno) as writer:
+            for fidx, (label_start_fno, label_end_fno, phoneme) in enumerate(labels):
+                writer.write_chara(fidx, label_start_fno, label_end_fno, int(fidx % 3) + 1, phoneme2kana(phoneme))
+
+        logger.info("exoファイル生成終了: {0}件\n{1}", len(labels), exo_file_path, decoration=MLogger.DECORATION_BOX)
+
+        return True
+    except Exception as e:
+        logger.critical("exo再生成で予期せぬエラーが発生しました。", e, decoration=MLogger.DECORATION_BOX)
+        return False
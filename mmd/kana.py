@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+#
+# かな・ローマ字・Julius音素の相互変換
+# 変換規則は表にまとめ、最長一致で1回だけ走査して変換する
+#
+import re
+
+from mmd.utils.MLogger import MLogger
+
+logger = MLogger(__name__)
+
+# カタカナ → ひらがな
+KATA2HIRA = {
+    'ア': 'あ', 'イ': 'い', 'ウ': 'う', 'エ': 'え', 'オ': 'お',
+    'カ': 'か', 'キ': 'き', 'ク': 'く', 'ケ': 'け', 'コ': 'こ',
+    'サ': 'さ', 'シ': 'し', 'ス': 'す', 'セ': 'せ', 'ソ': 'そ',
+    'タ': 'た', 'チ': 'ち', 'ツ': 'つ', 'テ': 'て', 'ト': 'と',
+    'ナ': 'な', 'ニ': 'に', 'ヌ': 'ぬ', 'ネ': 'ね', 'ノ': 'の',
+    'ハ': 'は', 'ヒ': 'ひ', 'フ': 'ふ', 'ヘ': 'へ', 'ホ': 'ほ',
+    'マ': 'ま', 'ミ': 'み', 'ム': 'む', 'メ': 'め', 'モ': 'も',
+    'ヤ': 'や', 'ユ': 'ゆ', 'ヨ': 'よ', 'ラ': 'ら', 'リ': 'り',
+    'ル': 'る', 'レ': 'れ', 'ロ': 'ろ', 'ワ': 'わ', 'ヲ': 'を',
+    'ン': 'ん',
+
+    'ガ': 'が', 'ギ': 'ぎ', 'グ': 'ぐ', 'ゲ': 'げ', 'ゴ': 'ご',
+    'ザ': 'ざ', 'ジ': 'じ', 'ズ': 'ず', 'ゼ': 'ぜ', 'ゾ': 'ぞ',
+    'ダ': 'だ', 'ヂ': 'ぢ', 'ヅ': 'づ', 'デ': 'で', 'ド': 'ど',
+    'バ': 'ば', 'ビ': 'び', 'ブ': 'ぶ', 'ベ': 'べ', 'ボ': 'ぼ',
+    'パ': 'ぱ', 'ピ': 'ぴ', 'プ': 'ぷ', 'ペ': 'ぺ', 'ポ': 'ぽ',
+
+    'ァ': 'ぁ', 'ィ': 'ぃ', 'ゥ': 'ぅ', 'ェ': 'ぇ', 'ォ': 'ぉ',
+    'ャ': 'ゃ', 'ュ': 'ゅ', 'ョ': 'ょ',
+    'ヴ': 'う', 'ッ': 'っ', 'ー': 'ー'
+}
+
+# ひらがな -> Julius 音素変換規則(segment_julius.pl の yomi2voca の適用順)
+YOMI2VOCA_RULES = [
+    # 3文字以上からなる変換規則
+    ('う゛ぁ', ' b a'), ('う゛ぃ', ' b i'), ('う゛ぇ', ' b e'), ('う゛ぉ', ' b o'), ('う゛ゅ', ' by u'),
+
+    # 2文字からなる変換規則
+    ('ぅ゛', ' b u'),
+
+    ('あぁ', ' a a'), ('いぃ', ' i i'), ('いぇ', ' i e'), ('いゃ', ' y a'), ('うぅ', ' u:'),
+    ('えぇ', ' e e'), ('おぉ', ' o:'), ('かぁ', ' k a:'), ('きぃ', ' k i:'), ('くぅ', ' k u:'),
+    ('くゃ', ' ky a'), ('くゅ', ' ky u'), ('くょ', ' ky o'), ('けぇ', ' k e:'), ('こぉ', ' k o:'),
+    ('がぁ', ' g a:'), ('ぎぃ', ' g i:'), ('ぐぅ', ' g u:'), ('ぐゃ', ' gy a'), ('ぐゅ', ' gy u'),
+    ('ぐょ', ' gy o'), ('げぇ', ' g e:'), ('ごぉ', ' g o:'), ('さぁ', ' s a:'), ('しぃ', ' sh i:'),
+    ('すぅ', ' s u:'), ('すゃ', ' sh a'), ('すゅ', ' sh u'), ('すょ', ' sh o'), ('せぇ', ' s e:'),
+    ('そぉ', ' s o:'), ('ざぁ', ' z a:'), ('じぃ', ' j i:'), ('ずぅ', ' z u:'), ('ずゃ', ' zy a'),
+    ('ずゅ', ' zy u'), ('ずょ', ' zy o'), ('ぜぇ', ' z e:'), ('ぞぉ', ' z o:'), ('たぁ', ' t a:'),
+    ('ちぃ', ' ch i:'), ('つぁ', ' ts a'), ('つぃ', ' ts i'), ('つぅ', ' ts u:'), ('つゃ', ' ch a'),
+    ('つゅ', ' ch u'), ('つょ', ' ch o'), ('つぇ', ' ts e'), ('つぉ', ' ts o'), ('てぇ', ' t e:'),
+    ('とぉ', ' t o:'), ('だぁ', ' d a:'), ('ぢぃ', ' j i:'), ('づぅ', ' d u:'), ('づゃ', ' zy a'),
+    ('づゅ', ' zy u'), ('づょ', ' zy o'), ('でぇ', ' d e:'), ('どぉ', ' d o:'), ('なぁ', ' n a:'),
+    ('にぃ', ' n i:'), ('ぬぅ', ' n u:'), ('ぬゃ', ' ny a'), ('ぬゅ', ' ny u'), ('ぬょ', ' ny o'),
+    ('ねぇ', ' n e:'), ('のぉ', ' n o:'), ('はぁ', ' h a:'), ('ひぃ', ' h i:'), ('ふぅ', ' f u:'),
+    ('ふゃ', ' hy a'), ('ふゅ', ' hy u'), ('ふょ', ' hy o'), ('へぇ', ' h e:'), ('ほぉ', ' h o:'),
+    ('ばぁ', ' b a:'), ('びぃ', ' b i:'), ('ぶぅ', ' b u:'), ('ふゃ', ' hy a'), ('ぶゅ', ' by u'),
+    ('ふょ', ' hy o'), ('べぇ', ' b e:'), ('ぼぉ', ' b o:'), ('ぱぁ', ' p a:'), ('ぴぃ', ' p i:'),
+    ('ぷぅ', ' p u:'), ('ぷゃ', ' py a'), ('ぷゅ', ' py u'), ('ぷょ', ' py o'), ('ぺぇ', ' p e:'),
+    ('ぽぉ', ' p o:'), ('まぁ', ' m a:'), ('みぃ', ' m i:'), ('むぅ', ' m u:'), ('むゃ', ' my a'),
+    ('むゅ', ' my u'), ('むょ', ' my o'), ('めぇ', ' m e:'), ('もぉ', ' m o:'), ('やぁ', ' y a:'),
+    ('ゆぅ', ' y u:'), ('ゆゃ', ' y a:'), ('ゆゅ', ' y u:'), ('ゆょ', ' y o:'), ('よぉ', ' y o:'),
+    ('らぁ', ' r a:'), ('りぃ', ' r i:'), ('るぅ', ' r u:'), ('るゃ', ' ry a'), ('るゅ', ' ry u'),
+    ('るょ', ' ry o'), ('れぇ', ' r e:'), ('ろぉ', ' r o:'), ('わぁ', ' w a:'), ('をぉ', ' o:'),
+
+    ('う゛', ' b u'), ('でぃ', ' d i'), ('でぇ', ' d e:'), ('でゃ', ' dy a'), ('でゅ', ' dy u'),
+    ('でょ', ' dy o'), ('てぃ', ' t i'), ('てぇ', ' t e:'), ('てゃ', ' ty a'), ('てゅ', ' ty u'),
+    ('てょ', ' ty o'), ('すぃ', ' s i'), ('ずぁ', ' z u a'), ('ずぃ', ' z i'), ('ずぅ', ' z u'),
+    ('ずゃ', ' zy a'), ('ずゅ', ' zy u'), ('ずょ', ' zy o'), ('ずぇ', ' z e'), ('ずぉ', ' z o'),
+    ('きゃ', ' ky a'), ('きゅ', ' ky u'), ('きょ', ' ky o'), ('しゃ', ' sh a'), ('しゅ', ' sh u'),
+    ('しぇ', ' sh e'), ('しょ', ' sh o'), ('ちゃ', ' ch a'), ('ちゅ', ' ch u'), ('ちぇ', ' ch e'),
+    ('ちょ', ' ch o'), ('とぅ', ' t u'), ('とゃ', ' ty a'), ('とゅ', ' ty u'), ('とょ', ' ty o'),
+    ('どぁ', ' d o a'), ('どぅ', ' d u'), ('どゃ', ' dy a'), ('どゅ', ' dy u'), ('どょ', ' dy o'),
+    ('どぉ', ' d o:'), ('にゃ', ' ny a'), ('にゅ', ' ny u'), ('にょ', ' ny o'), ('ひゃ', ' hy a'),
+    ('ひゅ', ' hy u'), ('ひょ', ' hy o'), ('みゃ', ' my a'), ('みゅ', ' my u'), ('みょ', ' my o'),
+    ('りゃ', ' ry a'), ('りゅ', ' ry u'), ('りょ', ' ry o'), ('ぎゃ', ' gy a'), ('ぎゅ', ' gy u'),
+    ('ぎょ', ' gy o'), ('ぢぇ', ' j e'), ('ぢゃ', ' j a'), ('ぢゅ', ' j u'), ('ぢょ', ' j o'),
+    ('じぇ', ' j e'), ('じゃ', ' j a'), ('じゅ', ' j u'), ('じょ', ' j o'), ('びゃ', ' by a'),
+    ('びゅ', ' by u'), ('びょ', ' by o'), ('ぴゃ', ' py a'), ('ぴゅ', ' py u'), ('ぴょ', ' py o'),
+    ('うぁ', ' u a'), ('うぃ', ' w i'), ('うぇ', ' w e'), ('うぉ', ' w o'), ('ふぁ', ' f a'),
+    ('ふぃ', ' f i'), ('ふぅ', ' f u'), ('ふゃ', ' hy a'), ('ふゅ', ' hy u'), ('ふょ', ' hy o'),
+    ('ふぇ', ' f e'), ('ふぉ', ' f o'),
+
+    # 1音からなる変換規則
+    ('あ', ' a'), ('い', ' i'), ('う', ' u'), ('え', ' e'), ('お', ' o'),
+    ('か', ' k a'), ('き', ' k i'), ('く', ' k u'), ('け', ' k e'), ('こ', ' k o'),
+    ('さ', ' s a'), ('し', ' sh i'), ('す', ' s u'), ('せ', ' s e'), ('そ', ' s o'),
+    ('た', ' t a'), ('ち', ' ch i'), ('つ', ' ts u'), ('て', ' t e'), ('と', ' t o'),
+    ('な', ' n a'), ('に', ' n i'), ('ぬ', ' n u'), ('ね', ' n e'), ('の', ' n o'),
+    ('は', ' h a'), ('ひ', ' h i'), ('ふ', ' f u'), ('へ', ' h e'), ('ほ', ' h o'),
+    ('ま', ' m a'), ('み', ' m i'), ('む', ' m u'), ('め', ' m e'), ('も', ' m o'),
+    ('ら', ' r a'), ('り', ' r i'), ('る', ' r u'), ('れ', ' r e'), ('ろ', ' r o'),
+    ('が', ' g a'), ('ぎ', ' g i'), ('ぐ', ' g u'), ('げ', ' g e'), ('ご', ' g o'),
+    ('ざ', ' z a'), ('じ', ' j i'), ('ず', ' z u'), ('ぜ', ' z e'), ('ぞ', ' z o'),
+    ('だ', ' d a'), ('ぢ', ' j i'), ('づ', ' z u'), ('で', ' d e'), ('ど', ' d o'),
+    ('ば', ' b a'), ('び', ' b i'), ('ぶ', ' b u'), ('べ', ' b e'), ('ぼ', ' b o'),
+    ('ぱ', ' p a'), ('ぴ', ' p i'), ('ぷ', ' p u'), ('ぺ', ' p e'), ('ぽ', ' p o'),
+    ('や', ' y a'), ('ゆ', ' y u'), ('よ', ' y o'), ('わ', ' w a'), ('ゐ', ' i'),
+    ('ゑ', ' e'), ('ん', ' N'), ('っ', ' q'), ('ー', ':'),
+
+    # ここまでに処理されてない ぁぃぅぇぉ はそのまま大文字扱い
+    ('ぁ', ' a'), ('ぃ', ' i'), ('ぅ', ' u'), ('ぇ', ' e'), ('ぉ', ' o'),
+    ('ゎ', ' w a'), ('ぉ', ' o'),
+
+    # その他特別なルール
+    ('を', ' o'),
+]
+
+# ローマ字 → カタカナ
+ROMAJI2KANA = {
+    'la':'ァ', 'li':'ィ', 'lu':'ゥ', 'le':'ェ', 'lo':'ォ',
+    'a'  :'ア', 'i'  :'イ', 'u'  :'ウ', 'e'  :'エ', 'o'  :'オ',
+    'ka' :'カ', 'ki' :'キ', 'ku' :'ク', 'ke' :'ケ', 'ko' :'コ',
+    'sa' :'サ', 'shi':'シ', 'su' :'ス', 'se' :'セ', 'so' :'ソ',
+    'ta' :'タ', 'chi':'チ', 'tsu' :'ツ', 'te' :'テ', 'to' :'ト',
+    'na' :'ナ', 'ni' :'ニ', 'nu' :'ヌ', 'ne' :'ネ', 'no' :'ノ',
+    'ha' :'ハ', 'hi' :'ヒ', 'fu' :'フ', 'he' :'ヘ', 'ho' :'ホ',
+    'ma' :'マ', 'mi' :'ミ', 'mu' :'ム', 'me' :'メ', 'mo' :'モ',
+    'ya' :'ヤ', 'yu' :'ユ', 'yo' :'ヨ',
+    'ra' :'ラ', 'ri' :'リ', 'ru' :'ル', 're' :'レ', 'ro' :'ロ',
+    'wa' :'ワ', 'wo' :'ヲ', 'n'  :'ン', 'vu' :'ヴ',
+    'ga' :'ガ', 'gi' :'ギ', 'gu' :'グ', 'ge' :'ゲ', 'go' :'ゴ',
+    'za' :'ザ', 'ji' :'ジ', 'zu' :'ズ', 'ze' :'ゼ', 'zo' :'ゾ',
+    'da' :'ダ', 'di' :'ヂ', 'du' :'ヅ', 'de' :'デ', 'do' :'ド',
+    'ba' :'バ', 'bi' :'ビ', 'bu' :'ブ', 'be' :'ベ', 'bo' :'ボ',
+    'pa' :'パ', 'pi' :'ピ', 'pu' :'プ', 'pe' :'ペ', 'po' :'ポ',
+
+    'kya':'キャ', 'kyi':'キィ', 'kyu':'キュ', 'kye':'キェ', 'kyo':'キョ',
+    'gya':'ギャ', 'gyi':'ギィ', 'gyu':'ギュ', 'gye':'ギェ', 'gyo':'ギョ',
+    'sha':'シャ',               'shu':'シュ', 'she':'シェ', 'sho':'ショ',
+    'ja' :'ジャ',               'ju' :'ジュ', 'je' :'ジェ', 'jo' :'ジョ',
+    'cha':'チャ',               'chu':'チュ', 'che':'チェ', 'cho':'チョ',
+    'dya':'ヂャ', 'dyi':'ヂィ', 'dyu':'ヂュ', 'dhe':'デェ', 'dyo':'ヂョ',
+    'nya':'ニャ', 'nyi':'ニィ', 'nyu':'ニュ', 'nye':'ニェ', 'nyo':'ニョ',
+    'hya':'ヒャ', 'hyi':'ヒィ', 'hyu':'ヒュ', 'hye':'ヒェ', 'hyo':'ヒョ',
+    'bya':'ビャ', 'byi':'ビィ', 'byu':'ビュ', 'bye':'ビェ', 'byo':'ビョ',
+    'pya':'ピャ', 'pyi':'ピィ', 'pyu':'ピュ', 'pye':'ピェ', 'pyo':'ピョ',
+    'mya':'ミャ', 'myi':'ミィ', 'myu':'ミュ', 'mye':'ミェ', 'myo':'ミョ',
+    'rya':'リャ', 'ryi':'リィ', 'ryu':'リュ', 'rye':'リェ', 'ryo':'リョ',
+    # 'fa' :'ファ', 'fi' :'フィ',               'fe' :'フェ', 'fo' :'フォ',
+    # 'wi' :'ウィ', 'we' :'ウェ',
+    # 'va' :'ヴァ', 'vi' :'ヴィ', 've' :'ヴェ', 'vo' :'ヴォ',
+
+    # 'kwa':'クァ', 'kwi':'クィ', 'kwu':'クゥ', 'kwe':'クェ', 'kwo':'クォ',
+    # 'kha':'クァ', 'khi':'クィ', 'khu':'クゥ', 'khe':'クェ', 'kho':'クォ',
+    # 'gwa':'グァ', 'gwi':'グィ', 'gwu':'グゥ', 'gwe':'グェ', 'gwo':'グォ',
+    # 'gha':'グァ', 'ghi':'グィ', 'ghu':'グゥ', 'ghe':'グェ', 'gho':'グォ',
+    # 'swa':'スァ', 'swi':'スィ', 'swu':'スゥ', 'swe':'スェ', 'swo':'スォ',
+    # 'swa':'スァ', 'swi':'スィ', 'swu':'スゥ', 'swe':'スェ', 'swo':'スォ',
+    # 'zwa':'ズヮ', 'zwi':'ズィ', 'zwu':'ズゥ', 'zwe':'ズェ', 'zwo':'ズォ',
+    # 'twa':'トァ', 'twi':'トィ', 'twu':'トゥ', 'twe':'トェ', 'two':'トォ',
+    # 'dwa':'ドァ', 'dwi':'ドィ', 'dwu':'ドゥ', 'dwe':'ドェ', 'dwo':'ドォ',
+    # 'mwa':'ムヮ', 'mwi':'ムィ', 'mwu':'ムゥ', 'mwe':'ムェ', 'mwo':'ムォ',
+    # 'bwa':'ビヮ', 'bwi':'ビィ', 'bwu':'ビゥ', 'bwe':'ビェ', 'bwo':'ビォ',
+    # 'pwa':'プヮ', 'pwi':'プィ', 'pwu':'プゥ', 'pwe':'プェ', 'pwo':'プォ',
+    # 'phi':'プィ', 'phu':'プゥ', 'phe':'プェ', 'pho':'フォ',
+}
+
+
+# ローマ字 → カタカナ(補助)
+ROMAJI_ASIST = {
+    # 'si' :'シ'  , 'ti' :'チ'  , 'hu' :'フ' , 'zi':'ジ',
+    # 'sya':'シャ', 'syu':'シュ', 'syo':'ショ',
+    # 'tya':'チャ', 'tyu':'チュ', 'tyo':'チョ',
+    # 'cya':'チャ', 'cyu':'チュ', 'cyo':'チョ',
+    # 'jya':'ジャ', 'jyu':'ジュ', 'jyo':'ジョ', 'pha':'ファ',
+    # 'qa' :'クァ', 'qi' :'クィ', 'qu' :'クゥ', 'qe' :'クェ', 'qo':'クォ',
+
+    # 'ca' :'カ', 'ci':'シ', 'cu':'ク', 'ce':'セ', 'co':'コ',
+    # 'la' :'ラ', 'li':'ィ', 'lu':'ル', 'le':'レ', 'lo':'ロ',
+
+    # 'mb' :'ム', 'py':'パイ', 'tho': 'ソ', 'thy':'ティ', 'oh':'オウ',
+    # 'by':'ビィ', 'cy':'シィ', 'dy':'ディ', 'fy':'フィ', 'gy':'ジィ',
+    # 'hy':'シー', 'ly':'リィ', 'ny':'ニィ', 'my':'ミィ', 'ry':'リィ',
+    # 'ty':'ティ', 'vy':'ヴィ', 'zy':'ジィ',
+
+    # 'li':'ィ',
+    # 'b':'ブ', 'c':'ク', 'd':'ド', 'f':'フ'  , 'g':'グ', 'h':'フ', 'j':'ジ',
+    # 'k':'ク', 'l':'ル', 'm':'ム', 'p':'プ'  , 'q':'ク', 'r':'ル', 's':'ス',
+    # 't':'ト', 'v':'ヴ', 'w':'ゥ', 'x':'クス', 'y':'ィ', 'z':'ズ',
+}
+
+# ローマ字 → カタカナ(カタカナ → ローマ字の補助)
+KANA_ASIST = {'la': 'ァ', 'li': 'ィ', 'lu': 'ゥ', 'le': 'ェ', 'lo': 'ォ', }
+
+RE_VOCA_HEAD = re.compile(r"^ ([a-z])")
+RE_VOCA_LONG = re.compile(r":+")
+RE_VOCA_VALID = re.compile(r"^[ a-zA-Z:]+$")
+
+# m の後ろにバ行、パ行のときは "ン" と変換
+RE_ROMAJI_MBA = re.compile("m(b|p)([aiueo])")
+# 子音が続く時は "ッ" と変換
+RE_ROMAJI_XTU = re.compile(r"([bcdfghjklmpqrstvwxyz])\1")
+# 母音が続く時は "ー" と変換
+RE_ROMAJI_LONG = re.compile(r"([aiueo])\1")
+# 小さい "ッ" は直後の文字を２回に変換
+RE_KANA_XTU = re.compile("ッ(.)")
+
+
+class LongestMatchConverter:
+    """ Replace text in a single left-to-right pass, using the longest key of the table
+    that matches at each position. Characters without a matching key are kept as they are.
+    """
+
+    def __init__(self, table: dict):
+        self.table = table
+        # 長い順に試す
+        self.key_lens = sorted(set([len(k) for k in table.keys()]), reverse=True)
+
+    def convert(self, text: str):
+        table = self.table
+        results = []
+        idx = 0
+        text_len = len(text)
+
+        while idx < text_len:
+            for key_len in self.key_lens:
+                value = table.get(text[idx:(idx + key_len)])
+                if value is not None:
+                    results.append(value)
+                    idx += key_len
+                    break
+            else:
+                results.append(text[idx])
+                idx += 1
+
+        return "".join(results)
+
+
+# yomi2vocaの規則(s///gを順番に適用)を、最長一致の表にする
+def _make_yomi2voca_table():
+    table = {}
+    priorities = {}
+    for ridx, (kana, phoneme) in enumerate(YOMI2VOCA_RULES):
+        if kana not in table:
+            # 同じ文字列の規則は先に書かれている方が適用される
+            table[kana] = phoneme
+            priorities[kana] = ridx
+
+    # 後ろの文字と重なる規則が先に適用される場合(例: くぅ゛ は ぅ゛ が先に変換されて く b u になる)は、
+    # 重なった文字列全体の規則を追加して、最長一致でも同じ結果になるようにする
+    base_converter = LongestMatchConverter(dict(table))
+    for head_kana in list(priorities.keys()):
+        for tail_kana in list(priorities.keys()):
+            if priorities[tail_kana] >= priorities[head_kana]:
+                continue
+            for overlap_len in range(1, min(len(head_kana), len(tail_kana))):
+                if head_kana[-overlap_len:] == tail_kana[:overlap_len]:
+                    table[head_kana + tail_kana[overlap_len:]] = base_converter.convert(head_kana[:-overlap_len]) + table[tail_kana]
+
+    return table
+
+
+# ローマ字 → カタカナ
+def _make_romaji2kana_table():
+    table = {}
+    for tbl in ROMAJI2KANA, ROMAJI_ASIST:
+        for k, v in tbl.items():
+            table[k] = v
+
+    return table
+
+
+# カタカナ → ローマ字(同じカナがある場合は後に定義した方)
+def _make_kana2romaji_table():
+    table = {}
+    for tbl in ROMAJI2KANA, KANA_ASIST:
+        for k, v in tbl.items():
+            table[v] = k
+
+    return table
+
+
+# 1文字ずつの置換なので変換表で一度に変換する
+KATA2HIRA_TABLE = str.maketrans(KATA2HIRA)
+# ひらがな → カタカナ(同じひらがなになるカタカナは後に定義した方)
+HIRA2KATA_TABLE = str.maketrans(dict([(v, k) for k, v in KATA2HIRA.items()]))
+
+YOMI2VOCA_CONVERTER = LongestMatchConverter(_make_yomi2voca_table())
+ROMAJI2KANA_CONVERTER = LongestMatchConverter(_make_romaji2kana_table())
+KANA2ROMAJI_CONVERTER = LongestMatchConverter(_make_kana2romaji_table())
+
+
+def katakana2hiragana(text: str):
+    return text.translate(KATA2HIRA_TABLE)
+
+
+def hiragana2katakana(text: str):
+    return text.translate(HIRA2KATA_TABLE)
+
+
+# ひらがな・カタカナを Julius の音素列に変換する
+def yomi2voca(text: str):
+    voca = YOMI2VOCA_CONVERTER.convert(katakana2hiragana(text.strip()))
+
+    voca = RE_VOCA_HEAD.sub(r"\1", voca)
+    voca = RE_VOCA_LONG.sub(":", voca)
+
+    if not RE_VOCA_VALID.fullmatch(voca):
+        logger.warning("音素に変換できない文字が含まれています。\n{0}", voca)
+
+    return voca
+
+
+def romaji2katakana(text: str):
+    result = text.lower()
+    result = RE_ROMAJI_MBA.sub(r"ン\1\2", result)
+    result = RE_ROMAJI_XTU.sub(r"ッ\1", result)
+    result = RE_ROMAJI_LONG.sub(r"\1ー", result)
+    return ROMAJI2KANA_CONVERTER.convert(result)
+
+
+def romaji2hiragana(text: str):
+    return katakana2hiragana(romaji2katakana(text))
+
+
+def kana2romaji(text: str):
+    result = KANA2ROMAJI_CONVERTER.convert(hiragana2katakana(text))
+    return RE_KANA_XTU.sub(r"\1\1", result)
+
+
+# yomi2vocaの変換結果に現れる音素を、子音とそれ以外(母音・ん・っ)に分ける
+def _list_julius_phonemes():
+    phonemes = set()
+    for _, phoneme in YOMI2VOCA_RULES:
+        phonemes |= set(phoneme.split())
+
+    vowels = sorted([p for p in phonemes if p.rstrip(":") in ["a", "i", "u", "e", "o"]])
+    vowels += [v + ":" for v in vowels if not v.endswith(":") and v + ":" not in vowels]
+    consonants = sorted([p for p in phonemes if p not in vowels and p not in ["N", "q", ":"]])
+
+    return vowels, consonants
+
+
+JULIUS_VOWELS, JULIUS_CONSONANTS = _list_julius_phonemes()
+
+
+# Julius音素の音節(子音+母音、母音、ん) → 表示用のひらがな(長音はー)
+def _make_phoneme2kana_table():
+    table = {}
+    for consonant in [""] + JULIUS_CONSONANTS:
+        for syllable in JULIUS_VOWELS + ["N"]:
+            table[consonant + syllable] = romaji2hiragana(consonant + syllable).replace(":", "ー")
+
+    return table
+
+
+PHONEME2KANA = _make_phoneme2kana_table()
+
+
+def phoneme2kana(phoneme: str):
+    kana = PHONEME2KANA.get(phoneme)
+    if kana is None:
+        # 表にない組み合わせは、初回だけ変換して覚えておく
+        kana = PHONEME2KANA[phoneme] = romaji2hiragana(phoneme).replace(":", "ー")
+
+    return kana
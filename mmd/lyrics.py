@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# 歌詞ファイル(区間指定 m:ss.fff-m:ss.fff + 歌詞、空行区切り)の読み込み・検証
+#
+import re
+
+from mmd.utils.MServiceUtils import get_file_encoding
+from mmd.kana import katakana2hiragana
+
+# 区間の書式(m:ss.fff-m:ss.fff)
+RE_SEPARATE = re.compile(r'(\d?\d)\:(\d\d).(\d\d\d)-(\d?\d)\:(\d\d).(\d\d\d)')
+# 区間指定の書き間違い(数字で始まる行)
+RE_DIGIT_HEAD = re.compile(r'\d')
+# ひらがな以外(長音・sp用の文字は許容)
+RE_NOT_HIRA = re.compile(r'[^っぁ-んー\-{10}( sp )]')
+
+# 歌詞から除く記号・空白・改行
+IGNORE_TABLE = str.maketrans("", "", "！!？? 　、。\n")
+
+
+# 1ブロック分の歌詞
+class LyricsBlock:
+    def __init__(self, start_sec, end_sec, separate_txt: str, line_no: int):
+        # 区間(区間指定がない場合はNone)
+        self.start_sec = start_sec
+        self.end_sec = end_sec
+        # 区間指定の文字列
+        self.separate_txt = separate_txt
+        # ブロック先頭の行番号(1始まり)
+        self.line_no = line_no
+        # 歌詞の行(前後の空白を除いたもの)
+        self.lines = []
+        # 記号・空白を除いて結合した歌詞
+        self.text = ""
+        # textのカタカナをひらがなにしたもの
+        self.hira_text = ""
+
+    def is_timed(self):
+        return self.start_sec is not None
+
+
+# 歌詞ファイルの誤り
+class LyricsError:
+    def __init__(self, line_no: int, message: str):
+        self.line_no = line_no
+        self.message = message
+
+    def __str__(self):
+        return "{0}行目: {1}".format(self.line_no, self.message)
+
+
+# 歌詞ファイルを読み込み、ブロックの一覧と誤りの一覧を返す
+def read_lyrics(lyrics_file: str, is_timed=True):
+    with open(lyrics_file, "r", encoding=get_file_encoding(lyrics_file)) as f:
+        return parse_lyrics(f.readlines(), is_timed)
+
+
+# 歌詞の行を1回だけ走査してブロックに分ける。誤りはまとめて返す
+# is_timed: 全ブロックに区間指定が必要か(Falseの場合、区間指定のないブロックも許容する)
+def parse_lyrics(lines: list, is_timed=True):
+    blocks = []
+    errors = []
+    block = None
+
+    def close_block():
+        if block is None:
+            return
+        if not block.lines:
+            errors.append(LyricsError(block.line_no, "区間指定の後に歌詞がありません。\n入力文字列: {0}".format(block.separate_txt)))
+        elif is_timed and not block.is_timed():
+            errors.append(LyricsError(block.line_no, "歌詞の前に区間指定(m:ss.fff-m:ss.fff)がありません。\n入力文字列: {0}".format(block.lines[0])))
+        else:
+            blocks.append(block)
+
+    for line_no, line in enumerate(lines, start=1):
+        v = line.strip()
+
+        if not v:
+            # 空行でブロックを区切る(連続した空行はひとつの区切りとする)
+            close_block()
+            block = None
+            continue
+
+        m = RE_SEPARATE.fullmatch(v)
+        if m:
+            if block is not None:
+                # 区切りの空行がない
+                errors.append(LyricsError(line_no, "区間指定の前に空行がありません。\n入力文字列: {0}".format(v)))
+                close_block()
+
+            block = LyricsBlock(int(m.group(1)) * 60 + int(m.group(2)) + int(m.group(3)) * 0.001, \
+                                int(m.group(4)) * 60 + int(m.group(5)) + int(m.group(6)) * 0.001, v, line_no)
+            continue
+
+        if (block is None or not block.lines) and RE_DIGIT_HEAD.match(v):
+            errors.append(LyricsError(line_no, "秒数区切りの書式が間違っています。\n入力文字列: {0}".format(v)))
+            continue
+
+        if block is None:
+            block = LyricsBlock(None, None, "", line_no)
+
+        text = line.translate(IGNORE_TABLE)
+        hira_text = katakana2hiragana(text)
+
+        not_hira_list = RE_NOT_HIRA.findall(hira_text)
+        if not_hira_list:
+            errors.append(LyricsError(line_no, "全角カナ・ひらがな以外が含まれています。\n入力文字列: {0}\nエラー文字：{1}".format(v, ",".join(not_hira_list))))
+
+        block.lines.append(v)
+        block.text += text
+        block.hira_text += hira_text
+
+    close_block()
+
+    # 区間の前後関係
+    prev_block = None
+    for block in blocks:
+        if not block.is_timed():
+            continue
+
+        if block.start_sec > block.end_sec:
+            errors.append(LyricsError(block.line_no, "終了秒に開始秒より前の値が設定されています。\n終了秒数: {0}, 開始秒数: {1}({2})".format( \
+                                      block.end_sec, block.start_sec, block.separate_txt)))
+
+        if prev_block and block.start_sec < prev_block.start_sec:
+            errors.append(LyricsError(block.line_no, "ひとつ前のブロックの開始秒より前の値が設定されています。\n前回の開始秒数: {0}, 今回の開始秒数: {1}({2})".format( \
+                                      prev_block.start_sec, block.start_sec, block.separate_txt)))
+        prev_block = block
+
+    return blocks, sorted(errors, key=lambda e: e.line_no)
@@ -12,6 +12,9 @@ from mmd.module.MMath import MRect, MVector2D, MVector3D, MVector4D, MQuaternion
 
 logger = MLogger(__name__, level=1)
 
+# キー削減で、まとめて処理する短い区間の長さ
+REDUCE_SHORT_LEN = 256
+
 # OneEuroFilter
 # オリジナル：https://www.cristal.univ-lille.fr/~casiez/1euro/
 # ----------------------------------------------------------------------------
@@ -102,6 +105,156 @@ class OneEuroFilter:
         self.__x.skip(x)
 
 
+# ----------------------------------------------------------------------------
+# フィルタの配列版
+# 1本(1次元)もしくは複数本(トラック数×サンプル数)の値をまとめてフィルタにかける
+# 結果は LowPassFilter / OneEuroFilter に1つずつ渡した場合と一致する
+# numba があればカーネルをJITコンパイルする(初回呼び出し時に読み込む)
+# ----------------------------------------------------------------------------
+
+def _low_pass_kernel(values, alphas, out):
+    for tidx in range(len(values)):
+        y = -1.0
+        s = -1.0
+        for idx in range(len(values[tidx])):
+            value = values[tidx][idx]
+            alpha = max(0.000001, min(1.0, alphas[tidx][idx]))
+            if y < 0:
+                s = value
+            else:
+                s = alpha * value + (1.0 - alpha) * s
+            y = value
+            out[tidx][idx] = s
+
+
+def _one_euro_kernel(values, timestamps, freq, mincutoff, beta, dcutoff, out):
+    for tidx in range(len(values)):
+        now_freq = freq
+        lasttime = -1.0
+        # 値用・変化量用の LowPassFilter の状態(前回の入力値, 前回の出力値)
+        x_y = -1.0
+        x_s = -1.0
+        dx_y = -1.0
+        dx_s = -1.0
+
+        for idx in range(len(values[tidx])):
+            x = values[tidx][idx]
+            timestamp = timestamps[tidx][idx]
+
+            if lasttime != 0 and timestamp != 0:
+                now_freq = 1.0 / (timestamp - lasttime)
+            lasttime = timestamp
+
+            prev_x = x_y
+            dx = 0.0 if prev_x < 0 else (x - prev_x) * now_freq
+
+            alpha = max(0.000001, min(1.0, 1.0 / (1.0 + (1.0 / (2 * math.pi * dcutoff)) / (1.0 / now_freq))))
+            if dx_y < 0:
+                dx_s = dx
+            else:
+                dx_s = alpha * dx + (1.0 - alpha) * dx_s
+            dx_y = dx
+
+            cutoff = mincutoff + beta * math.fabs(dx_s)
+
+            if prev_x == x:
+                # まったく同じ値の場合、スキップ
+                x_s = x
+            else:
+                alpha = max(0.000001, min(1.0, 1.0 / (1.0 + (1.0 / (2 * math.pi * cutoff)) / (1.0 / now_freq))))
+                if x_y < 0:
+                    x_s = x
+                else:
+                    x_s = alpha * x + (1.0 - alpha) * x_s
+            x_y = x
+
+            out[tidx][idx] = x_s
+
+
+_filter_kernels = {}
+
+
+def _get_filter_kernel(kernel):
+    if kernel not in _filter_kernels:
+        try:
+            import numba
+            _filter_kernels[kernel] = numba.njit(cache=True)(kernel)
+        except ImportError:
+            _filter_kernels[kernel] = _as_list_kernel(kernel)
+
+    return _filter_kernels[kernel]
+
+
+# numba がない場合は、要素の読み書きが速いリストにして同じカーネルを実行する
+def _as_list_kernel(kernel):
+    def run(*params):
+        out = params[-1]
+        out_list = out.tolist()
+        kernel(*[p.tolist() if isinstance(p, np.ndarray) else p for p in params[:-1]], out_list)
+        out[:] = out_list
+
+    return run
+
+
+# 1次元はトラック1本として、(トラック数, サンプル数)の配列にする
+def _as_tracks(values, shape=None):
+    values = np.asarray(values, dtype=np.float64)
+    if shape is not None:
+        values = np.broadcast_to(values, shape)
+    elif values.ndim == 1:
+        values = values[np.newaxis, :]
+
+    return np.ascontiguousarray(values)
+
+
+# LowPassFilter(alpha)に順に通した値
+# alpha はスカラーか、values と同じ形の配列
+def low_pass(values, alpha):
+    tracks = _as_tracks(values)
+    out = np.empty_like(tracks)
+    _get_filter_kernel(_low_pass_kernel)(tracks, _as_tracks(alpha, tracks.shape), out)
+
+    return out.reshape(np.shape(values))
+
+
+# OneEuroFilter(freq, mincutoff, beta, dcutoff)に順に通した値
+# timestamps は values と同じ形か、全トラック共通の1次元配列(同じタイムスタンプが続かないこと)
+def one_euro(values, timestamps, freq, mincutoff=1.0, beta=0.0, dcutoff=1.0):
+    if freq <= 0:
+        raise ValueError("freq should be >0")
+    if mincutoff <= 0:
+        raise ValueError("mincutoff should be >0")
+    if dcutoff <= 0:
+        raise ValueError("dcutoff should be >0")
+
+    tracks = _as_tracks(values)
+    out = np.empty_like(tracks)
+    _get_filter_kernel(_one_euro_kernel)(tracks, _as_tracks(timestamps, tracks.shape), float(freq), float(mincutoff), float(beta), float(dcutoff), out)
+
+    return out.reshape(np.shape(values))
+
+
+# 長さの違う複数トラックを1回で OneEuroFilter にかける
+# 後ろを埋めて揃える(フィルタは前からしか値を使わないので、埋めた分は結果に影響しない)
+def one_euro_tracks(values_list: list, timestamps_list: list, freq, mincutoff=1.0, beta=0.0, dcutoff=1.0):
+    if not values_list:
+        return []
+
+    max_len = max(len(values) for values in values_list)
+    values_arr = np.zeros((len(values_list), max_len), dtype=np.float64)
+    # 埋める部分のタイムスタンプも重ならないように増やしておく
+    timestamps_arr = np.tile(np.arange(1, max_len + 1, dtype=np.float64), (len(values_list), 1))
+    for tidx, (values, timestamps) in enumerate(zip(values_list, timestamps_list)):
+        values_arr[tidx, :len(values)] = values
+        if len(timestamps) > 0:
+            timestamps_arr[tidx, :len(timestamps)] = timestamps
+            timestamps_arr[tidx, len(timestamps):] += timestamps[-1]
+
+    out = one_euro(values_arr, timestamps_arr, freq, mincutoff=mincutoff, beta=beta, dcutoff=dcutoff)
+
+    return [out[tidx, :len(values)] for tidx, values in enumerate(values_list)]
+
+
 class VmdBoneFrame:
 
     def __init__(self, fno=0):
@@ -189,6 +342,247 @@ class VmdMorphFrame:
         return "<VmdMorphFrame name:{0}, fno:{1}, ratio:{2}".format(self.name, self.fno, self.ratio)
 
 
+# キーフレ(昇順)の間を線形補間して、複数フレーム番号の値をまとめて求める
+# calc_mf と同じ式で計算するので、結果も1フレームずつ求めた場合と一致する
+def interp_ratios(key_fnos, key_ratios, fnos):
+    key_fnos = np.asarray(key_fnos, dtype=np.float64)
+    key_ratios = np.asarray(key_ratios, dtype=np.float64)
+    fnos = np.asarray(fnos, dtype=np.float64)
+
+    if len(key_fnos) == 0:
+        return np.zeros(len(fnos), dtype=np.float64)
+
+    if len(key_fnos) == 1:
+        return np.full(len(fnos), key_ratios[0], dtype=np.float64)
+
+    # 前後のキー(範囲外は端のキーの値)
+    next_idxs = np.clip(np.searchsorted(key_fnos, fnos), 1, max(1, len(key_fnos) - 1))
+    prev_idxs = next_idxs - 1
+    prev_fnos, next_fnos = key_fnos[prev_idxs], key_fnos[next_idxs]
+    prev_ratios, next_ratios = key_ratios[prev_idxs], key_ratios[next_idxs]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = prev_ratios + ((next_ratios - prev_ratios) * ((fnos - prev_fnos) / (next_fnos - prev_fnos)))
+
+    ratios = np.where(fnos <= key_fnos[0], key_ratios[0], ratios)
+    ratios = np.where(fnos >= key_fnos[-1], key_ratios[-1], ratios)
+    # キーがあるフレームはキーの値そのもの
+    key_idxs = np.clip(np.searchsorted(key_fnos, fnos), 0, len(key_fnos) - 1)
+    is_key = key_fnos[key_idxs] == fnos
+
+    return np.where(is_key, key_ratios[key_idxs], ratios)
+
+
+# モーフ1つ分のキーフレを、昇順のフレーム番号・値の配列で保持する
+# VmdMorphFrameの辞書と同じように扱えるが、フレームはアクセス時にのみ生成する
+class VmdMorphTrack:
+    def __init__(self, name=''):
+        mf = VmdMorphFrame()
+        mf.set_name(name)
+        self.name = mf.name
+        self.bname = mf.bname
+        self.count = 0
+        self.fno_arr = np.zeros(16, dtype=np.int32)
+        self.ratio_arr = np.zeros(16, dtype=np.float32)
+        # まとめて追加したまま、まだ並べていないキーの数(登録済みキーの後ろに置いておく)
+        self.pending_cnt = 0
+
+    # 登録済みフレーム番号(昇順)
+    @property
+    def fnos(self):
+        self.flush()
+        return self.fno_arr[:self.count]
+
+    # 登録済みの値
+    @property
+    def ratios(self):
+        self.flush()
+        return self.ratio_arr[:self.count]
+
+    # 指定フレーム番号が入る位置(二分探索)
+    def index(self, fno: int):
+        return int(np.searchsorted(self.fnos, fno))
+
+    def find(self, fno: int):
+        idx = self.index(fno)
+        return idx if idx < self.count and self.fno_arr[idx] == fno else -1
+
+    def frame(self, idx: int):
+        mf = VmdMorphFrame(int(self.fno_arr[idx]))
+        mf.name = self.name
+        mf.bname = self.bname
+        mf.ratio = float(self.ratio_arr[idx])
+        mf.key = True
+
+        return mf
+
+    # 容量が足りなければ、必要な数が入るまで倍にする
+    def reserve(self, size: int):
+        if size <= len(self.fno_arr):
+            return
+
+        capacity = len(self.fno_arr)
+        while capacity < size:
+            capacity += max(16, capacity)
+
+        self.fno_arr = np.concatenate([self.fno_arr, np.zeros(capacity - len(self.fno_arr), dtype=np.int32)])
+        self.ratio_arr = np.concatenate([self.ratio_arr, np.zeros(capacity - len(self.ratio_arr), dtype=np.float32)])
+
+    def regist(self, fno: int, ratio: float):
+        idx = self.index(fno)
+        if idx < self.count and self.fno_arr[idx] == fno:
+            # 既存キーは上書き
+            self.ratio_arr[idx] = ratio
+            return
+
+        self.reserve(self.count + 1)
+
+        if idx < self.count:
+            # 後ろをずらして挿入
+            self.fno_arr[idx + 1:self.count + 1] = self.fno_arr[idx:self.count]
+            self.ratio_arr[idx + 1:self.count + 1] = self.ratio_arr[idx:self.count]
+
+        self.fno_arr[idx] = fno
+        self.ratio_arr[idx] = ratio
+        self.count += 1
+
+    # フレーム番号・値の配列を、並べ替えずに後ろに追加する
+    # 並べ替え(同じフレーム番号は後勝ち)は、次に読み出す時にまとめて1回だけ行う
+    def append(self, fnos, ratios):
+        fnos = np.asarray(fnos, dtype=np.int32).ravel()
+        start = self.count + self.pending_cnt
+        self.reserve(start + len(fnos))
+
+        self.fno_arr[start:start + len(fnos)] = fnos
+        self.ratio_arr[start:start + len(fnos)] = np.asarray(ratios, dtype=np.float32).ravel()
+        self.pending_cnt += len(fnos)
+
+    # 追加したままのキーを、登録済みキーに並べて入れる
+    def flush(self):
+        if self.pending_cnt == 0:
+            return
+
+        end = self.count + self.pending_cnt
+        pending_fnos = self.fno_arr[self.count:end]
+        # 追加分より後ろにある登録済みキーだけを並べ直す(追加は大抵末尾なので、並べ直す範囲は短い)
+        start = int(np.searchsorted(self.fno_arr[:self.count], pending_fnos.min()))
+
+        # 逆順で安定ソートして、同じフレーム番号の最初(=元の並びの最後)だけ残す
+        fnos = self.fno_arr[start:end][::-1]
+        ratios = self.ratio_arr[start:end][::-1]
+        order = np.argsort(fnos, kind='stable')
+        sorted_fnos = fnos[order]
+        is_unique = np.ones(len(sorted_fnos), dtype=bool)
+        is_unique[1:] = sorted_fnos[1:] != sorted_fnos[:-1]
+
+        merged_fnos = sorted_fnos[is_unique]
+        merged_ratios = ratios[order][is_unique]
+        self.pending_cnt = 0
+        self.count = start + len(merged_fnos)
+        self.fno_arr[start:self.count] = merged_fnos
+        self.ratio_arr[start:self.count] = merged_ratios
+
+    # フレーム番号・値の配列をまとめて登録する(既存キーは置き換え、同じフレーム番号は後勝ち)
+    def assign(self, fnos, ratios):
+        fnos = np.asarray(fnos, dtype=np.int32)
+        ratios = np.asarray(ratios, dtype=np.float32)
+
+        # 逆順で安定ソートして、同じフレーム番号の最初(=元の並びの最後)だけ残す
+        order = np.argsort(fnos[::-1], kind='stable')
+        sorted_fnos = fnos[::-1][order]
+        is_unique = np.ones(len(sorted_fnos), dtype=bool)
+        is_unique[1:] = sorted_fnos[1:] != sorted_fnos[:-1]
+
+        self.fno_arr = np.array(sorted_fnos[is_unique], dtype=np.int32)
+        self.ratio_arr = np.array(ratios[::-1][order][is_unique], dtype=np.float32)
+        self.count = len(self.fno_arr)
+        self.pending_cnt = 0
+
+    # 指定フレーム番号のキーをまとめて削除する
+    def remove(self, fnos: list):
+        is_remain = ~np.isin(self.fnos, np.asarray(fnos, dtype=np.int32))
+        remain_cnt = int(np.count_nonzero(is_remain))
+        self.fno_arr[:remain_cnt] = self.fnos[is_remain]
+        self.ratio_arr[:remain_cnt] = self.ratios[is_remain]
+        self.count = remain_cnt
+
+    # 指定フレーム番号のモーフ(キーがない場合は線形補間)
+    def calc(self, fno: int, is_key=False, is_read=False):
+        idx = self.index(fno)
+
+        if idx < self.count and self.fno_arr[idx] == fno and not is_read:
+            return self.frame(idx)
+
+        if is_key or is_read:
+            # 既存キーのみ探している場合はNone
+            return None
+
+        fill_mf = VmdMorphFrame(fno)
+        fill_mf.name = self.name
+        fill_mf.bname = self.bname
+
+        if self.count == 0:
+            return fill_mf
+
+        if idx >= self.count:
+            # 番号より前があって、後のがない場合、前の値
+            fill_mf.ratio = float(self.ratio_arr[self.count - 1])
+        elif idx == 0:
+            # 番号より後があって、前がない場合、後の値
+            fill_mf.ratio = float(self.ratio_arr[0])
+        else:
+            # 線形で埋める
+            prev_fno, next_fno = int(self.fno_arr[idx - 1]), int(self.fno_arr[idx])
+            prev_ratio, next_ratio = float(self.ratio_arr[idx - 1]), float(self.ratio_arr[idx])
+            fill_mf.ratio = prev_ratio + ((next_ratio - prev_ratio) * ((fno - prev_fno) / (next_fno - prev_fno)))
+
+        return fill_mf
+
+    # 複数フレーム番号の値をまとめて線形補間で求める
+    def interp(self, fnos):
+        return interp_ratios(self.fnos, self.ratios, fnos)
+
+    def keys(self):
+        return self.fnos.tolist()
+
+    def values(self):
+        self.flush()
+        return [self.frame(idx) for idx in range(self.count)]
+
+    def items(self):
+        self.flush()
+        return [(int(self.fno_arr[idx]), self.frame(idx)) for idx in range(self.count)]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        self.flush()
+        return self.count
+
+    def __contains__(self, fno):
+        return self.find(fno) >= 0
+
+    def __getitem__(self, fno):
+        idx = self.find(fno)
+        if idx < 0:
+            raise KeyError(fno)
+
+        return self.frame(idx)
+
+    def __setitem__(self, fno, mf: VmdMorphFrame):
+        self.regist(fno, mf.ratio)
+
+    def __delitem__(self, fno):
+        idx = self.find(fno)
+        if idx < 0:
+            raise KeyError(fno)
+
+        self.fno_arr[idx:self.count - 1] = self.fno_arr[idx + 1:self.count]
+        self.ratio_arr[idx:self.count - 1] = self.ratio_arr[idx + 1:self.count]
+        self.count -= 1
+
+
 class VmdCameraFrame:
     def __init__(self):
         self.fno = 0
@@ -255,7 +649,7 @@ class VmdShadowFrame:
 
     def write(self, fout):
         fout.write(struct.pack('<L', self.fno))
-        fout.write(struct.pack('<f', self.type))
+        fout.write(struct.pack('<b', self.type))
         fout.write(struct.pack('<f', self.distance))
 
 
@@ -288,7 +682,7 @@ class VmdShowIkFrame:
 # https://blog.goo.ne.jp/torisu_tetosuki/e/bc9f1c4d597341b394bd02b64597499d
 # https://w.atwiki.jp/kumiho_k/pages/15.html
 class VmdMotion:
-    def __init__(self):
+    def __init__(self, is_array_morph=False):
         self.path = ''
         self.signature = ''
         self.model_name = ''
@@ -313,7 +707,13 @@ class VmdMotion:
         self.showiks = []
         # ハッシュ値
         self.digest = None
+        # モーフキーフレを配列(VmdMorphTrack)で保持するか
+        self.is_array_morph = is_array_morph
     
+    # モーフ1つ分のキーフレの入れ物
+    def new_morph_track(self, morph_name: str):
+        return VmdMorphTrack(morph_name) if self.is_array_morph else {}
+
     def regist_full_bf(self, data_set_no: int, bone_name_list: list, offset=1, is_key=True):
         # 指定された全部のボーンのキーフレ取得
         fnos = self.get_bone_fnos(*bone_name_list)
@@ -450,22 +850,7 @@ class VmdMotion:
     # フィルターをかける
     def smooth_filter_bf(self, data_set_no: int, bone_name: str, is_rot: bool, is_mov: bool, loop=1, \
                          config={"freq": 30, "mincutoff": 0.3, "beta": 0.01, "dcutoff": 0.25}, start_fno=-1, end_fno=-1, is_show_log=True):
-        prev_sep_fno = 0
-
         for n in range(loop):
-            # 移動用フィルタ
-            pxfilter = OneEuroFilter(**config)
-            pyfilter = OneEuroFilter(**config)
-            pzfilter = OneEuroFilter(**config)
-
-            # 回転用フィルタ
-            rxfilter = OneEuroFilter(**config)
-            ryfilter = OneEuroFilter(**config)
-            rzfilter = OneEuroFilter(**config)
-
-            fnos = self.get_bone_fnos(bone_name)
-            prev_sep_fno = 0
-
             # キーフレを取得する
             if start_fno < 0 and end_fno < 0:
                 # 範囲指定がない場合、全範囲
@@ -474,31 +859,34 @@ class VmdMotion:
                 # 範囲指定がある場合はその範囲内だけ
                 fnos = self.get_bone_fnos(bone_name, start_fno=start_fno, end_fno=end_fno)
 
-            # 全区間をフィルタにかける
-            for fno in fnos:
-                now_bf = self.calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
+            if len(fnos) == 0:
+                continue
+
+            bfs = [self.calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False) for fno in fnos]
 
+            # 移動XYZ・回転XYZ(オイラー角)を1回でフィルターにかける
+            values = []
+            if is_mov:
+                values.extend(np.array([[bf.position.x(), bf.position.y(), bf.position.z()] for bf in bfs], dtype=np.float64).T)
+            if is_rot:
+                eulers = [bf.rotation.toEulerAngles() for bf in bfs]
+                values.extend(np.array([[r.x(), r.y(), r.z()] for r in eulers], dtype=np.float64).T)
+
+            if not values:
+                continue
+
+            filtered = one_euro(np.array(values), fnos, **config)
+
+            for fidx, bf in enumerate(bfs):
                 if is_mov:
-                    # 移動XYZそれぞれにフィルターをかける
-                    px = pxfilter(now_bf.position.x(), fno)
-                    py = pyfilter(now_bf.position.y(), fno)
-                    pz = pzfilter(now_bf.position.z(), fno)
-                    now_bf.position = MVector3D(px, py, pz)
-                
-                if is_rot:
-                    # 回転XYZそれぞれにフィルターをかける(オイラー角)
-                    r = now_bf.rotation.toEulerAngles()
-                    rx = rxfilter(r.x(), fno)
-                    ry = ryfilter(r.y(), fno)
-                    rz = rzfilter(r.z(), fno)
+                    bf.position = MVector3D(filtered[0, fidx], filtered[1, fidx], filtered[2, fidx])
 
+                if is_rot:
                     # クォータニオンに戻して保持
-                    new_qq = MQuaternion.fromEulerAngles(rx, ry, rz)
-                    now_bf.rotation = new_qq
+                    bf.rotation = MQuaternion.fromEulerAngles(filtered[-3, fidx], filtered[-2, fidx], filtered[-1, fidx])
 
-                if is_show_log and data_set_no > 0 and fno // 2000 > prev_sep_fno and fnos[-1] > 0:
-                    logger.info("-- %sフレーム目:終了(%s％)【No.%s - フィルタリング - %s(%s)】", fno, round((fno / fnos[-1]) * 100, 3), data_set_no, bone_name, (n + 1))
-                    prev_sep_fno = fno // 2000
+            if is_show_log and data_set_no > 0:
+                logger.info("-- フィルタリング終了【No.{0} - {1}({2})】", data_set_no, bone_name, (n + 1))
 
     # 無効なキーを物理削除する
     def remove_unkey_bf(self, data_set_no: int, bone_name: str):
@@ -1040,13 +1428,18 @@ class VmdMotion:
         if math.isnan(mf.ratio) or math.isinf(mf.ratio):
             logger.debug("** regist_mf: (%s)%s", mf.fno, mf.ratio)
 
+        if morph_name not in self.morphs:
+            self.morphs[morph_name] = self.new_morph_track(morph_name)
+
+        if isinstance(self.morphs[morph_name], VmdMorphTrack):
+            # 配列の場合、値だけ登録する
+            self.morphs[morph_name].regist(fno, get_effective_value(mf.ratio))
+            return
+
         regist_mf = VmdMorphFrame(mf.fno)
         regist_mf.set_name(mf.name)
         regist_mf.ratio = get_effective_value(mf.ratio)
 
-        if morph_name not in self.morphs:
-            self.morphs[morph_name] = {}
-
         if math.isnan(regist_mf.ratio) or math.isinf(regist_mf.ratio):
             logger.debug("*** c_regist_mf: (%s)%s", regist_mf.fno, regist_mf.ratio)
 
@@ -1054,15 +1447,46 @@ class VmdMotion:
         regist_mf.key = True
         self.morphs[morph_name][fno] = regist_mf
 
+    # モーフをまとめて登録(同じフレーム番号は後勝ち)
+    # 配列の場合は後ろに追加するだけで、並べ替えは次に読み出す時に1回だけ行う
+    def regist_mf_batch(self, morph_name: str, fnos, ratios):
+        ratios = np.asarray(ratios, dtype=np.float64).ravel()
+        # NaN・無限大は0にする(get_effective_value と同じ)
+        ratios = np.where(np.isfinite(ratios), ratios, 0)
+
+        if morph_name not in self.morphs:
+            self.morphs[morph_name] = self.new_morph_track(morph_name)
+
+        if isinstance(self.morphs[morph_name], VmdMorphTrack):
+            self.morphs[morph_name].append(fnos, ratios)
+            return
+
+        # 辞書の場合、名前のエンコードは1回だけ行う
+        name_mf = VmdMorphFrame()
+        name_mf.set_name(morph_name)
+
+        for fno, ratio in zip(np.asarray(fnos).ravel().tolist(), ratios.tolist()):
+            regist_mf = VmdMorphFrame(fno)
+            regist_mf.name = name_mf.name
+            regist_mf.bname = name_mf.bname
+            regist_mf.ratio = ratio
+            regist_mf.key = True
+            self.morphs[morph_name][fno] = regist_mf
+
     # 指定フレーム番号のモーフ
     def calc_mf(self, morph_name: str, fno: int, is_key=False, is_read=False):
         fill_mf = VmdMorphFrame(fno)
 
         if morph_name not in self.morphs:
             fill_mf.set_name(morph_name)
-            self.morphs[morph_name] = {fno: fill_mf}
+            self.morphs[morph_name] = self.new_morph_track(morph_name)
+            self.morphs[morph_name][fno] = fill_mf
             return fill_mf
         
+        if isinstance(self.morphs[morph_name], VmdMorphTrack):
+            # 配列の場合、二分探索で前後を探す
+            return self.morphs[morph_name].calc(fno, is_key=is_key, is_read=is_read)
+
         # 条件に合致するフレーム番号を探す
         # is_key: 登録対象のキーを探す
         # is_read: データ読み込み時のキーを探す
@@ -1128,14 +1552,7 @@ class VmdMotion:
 
     def smooth_filter_mf(self, data_set_no: int, morph_name: str, loop=1, \
                          config={"freq": 30, "mincutoff": 0.3, "beta": 0.01, "dcutoff": 0.25}, start_fno=-1, end_fno=-1, is_show_log=True):
-        prev_sep_fno = 0
-
         for n in range(loop):
-            rxfilter = OneEuroFilter(**config)
-
-            fnos = self.get_morph_fnos(morph_name)
-            prev_sep_fno = 0
-
             # キーフレを取得する
             if start_fno < 0 and end_fno < 0:
                 # 範囲指定がない場合、全範囲
@@ -1144,14 +1561,22 @@ class VmdMotion:
                 # 範囲指定がある場合はその範囲内だけ
                 fnos = self.get_morph_fnos(morph_name, start_fno=start_fno, end_fno=end_fno)
 
-            # 全区間をフィルタにかける
-            for fno in fnos:
-                now_mf = self.calc_mf(morph_name, fno, is_key=False, is_read=False)
-                now_mf.ratio = rxfilter(now_mf.ratio, fno)
+            if len(fnos) == 0:
+                continue
 
-                if is_show_log and data_set_no > 0 and fno // 2000 > prev_sep_fno and fnos[-1] > 0:
-                    logger.info("-- %sフレーム目:終了(%s％)【No.%s - フィルタリング - %s(%s)】", fno, round((fno / fnos[-1]) * 100, 3), data_set_no, morph_name, (n + 1))
-                    prev_sep_fno = fno // 2000
+            # 全区間をまとめてフィルタにかける
+            ratios = one_euro(self.calc_mf_ratios(morph_name, fnos), fnos, **config)
+
+            if isinstance(self.morphs[morph_name], VmdMorphTrack):
+                # 配列の場合、値だけ書き換える
+                track = self.morphs[morph_name]
+                track.ratio_arr[np.searchsorted(track.fnos, fnos)] = ratios
+            else:
+                for fno, ratio in zip(fnos, ratios):
+                    self.morphs[morph_name][fno].ratio = float(ratio)
+
+            if is_show_log and data_set_no > 0:
+                logger.info("-- フィルタリング終了【No.{0} - {1}({2})】", data_set_no, morph_name, (n + 1))
 
     # 無効なキーを物理削除する
     def remove_unkey_mf(self, data_set_no: int, morph_name: str):
@@ -1177,60 +1602,127 @@ class VmdMotion:
         if len(fnos) <= 1:
             return
         
-        reduce_fnos = self.reduce_morph_frame(morph_name, fnos, fnos[0], fnos[-1], threshold=threshold)
-        reduce_fnos.append(fnos[-1])
+        reduce_fnos = set(self.reduce_morph_frame(morph_name, fnos, fnos[0], fnos[-1], threshold=threshold))
+        reduce_fnos.add(fnos[-1])
+
+        self.remove_mf(morph_name, [f for f in fnos if f not in reduce_fnos])
+
+    # 指定フレーム番号のモーフキーを削除する
+    def remove_mf(self, morph_name: str, fnos: list):
+        if morph_name not in self.morphs:
+            return
+
+        if isinstance(self.morphs[morph_name], VmdMorphTrack):
+            # 配列の場合、まとめて削除
+            self.morphs[morph_name].remove(fnos)
+            return
 
         for f in fnos:
-            if f not in reduce_fnos and f in self.morphs[morph_name]:
+            if f in self.morphs[morph_name]:
                 # キーフレが残す対象でない場合、削除
                 del self.morphs[morph_name][f]
+
+    # 複数フレーム番号のモーフの値をまとめて求める(線形補間)
+    def calc_mf_ratios(self, morph_name: str, fnos: list):
+        if morph_name not in self.morphs:
+            return np.zeros(len(fnos), dtype=np.float64)
+
+        if isinstance(self.morphs[morph_name], VmdMorphTrack):
+            return self.morphs[morph_name].interp(fnos)
+
+        key_fnos = sorted(self.morphs[morph_name].keys())
+        key_ratios = [self.morphs[morph_name][f].ratio for f in key_fnos]
+
+        return interp_ratios(key_fnos, key_ratios, fnos)
         
     # キーフレームを間引く
     # オリジナル：https://github.com/errno-mmd/smoothvmd/blob/master/reducevmd.cc
     def reduce_morph_frame(self, morph_name: str, fnos: list, head: int, tail: int, threshold: float):
-        # ratioのエラー最大値
-        max_err = float(0.0)
-        # ratio：エラー最大値のindex
-        max_idx = 0
-
-        # 開始のモーフ
-        head_mf = self.calc_mf(morph_name, head, is_key=False, is_read=False)
-        # 終了のモーフ
-        tail_mf = self.calc_mf(morph_name, tail, is_key=False, is_read=False)
-        logger.test("head_mf: %s, %s tail_mf: %s, %s", head_mf.fno, head_mf.ratio, tail_mf.fno, tail_mf.ratio)
-        if math.isnan(head_mf.ratio) or math.isinf(head_mf.ratio):
-            logger.test("head_mf: %s, %s tail_mf: %s, %s", head_mf.fno, head_mf.ratio, tail_mf.fno, tail_mf.ratio)
-
-        for i in range(head + 1, tail, 1):
-            # rx, ry, rt = MBezierUtils.evaluate(MBezierUtils.LINEAR_MMD_INTERPOLATION[1].x(), MBezierUtils.LINEAR_MMD_INTERPOLATION[1].y(), \
-            #                                     MBezierUtils.LINEAR_MMD_INTERPOLATION[2].x(), MBezierUtils.LINEAR_MMD_INTERPOLATION[2].y(), \
-            #                                     head_mf.fno, i, tail_mf.fno)
-            # ip_ratio = head_mf.ratio + ((tail_mf.ratio - head_mf.ratio) * ry)
-            ip_ratio = head_mf.ratio + ((tail_mf.ratio - head_mf.ratio) * ((i - head_mf.fno) / (tail_mf.fno - head_mf.fno)))
-            # ip_ratio = head_mf.ratio + (tail_mf.ratio - head_mf.ratio) * (i - head) / total
-            now_mf = self.calc_mf(morph_name, i, is_key=False, is_read=False)
-            logger.test("morph_name: %s, i: %s ip_ratio: %s, now: %s, head: (%s)%s, tail: (%s)%s", morph_name, i, ip_ratio, now_mf.ratio, head_mf.fno, head_mf.ratio, tail_mf.fno, tail_mf.ratio)
-            pos_err = abs(ip_ratio - now_mf.ratio)
-
-            if pos_err > max_err:
-                max_idx = i
-                max_err = pos_err
-
-        logger.debug("max_err: {0} max_idx: {1}", max_err, max_idx)
-
-        v1 = []
-        if max_err > threshold:
-            v1 = self.reduce_morph_frame(morph_name, fnos, head, max_idx, threshold)
-            v2 = self.reduce_morph_frame(morph_name, fnos, max_idx, tail, threshold)
-            logger.debug("threshold v1: {0}", v1)
-            logger.debug("threshold v2: {0}", v2)
-
-            v1.extend(v2)
-        else:
-            v1.append(head_mf.fno)
-            logger.debug("not threshold v1: {0}", head_mf.fno)
+        # head～tailの全フレームの値を一度だけ求める(キーがないフレームは線形補間)
+        ratios = self.calc_mf_ratios(morph_name, range(head, tail + 1))
+        logger.test("head: %s, %s tail: %s, %s", head, ratios[0], tail, ratios[-1])
+
+        reduce_fnos = []
+        # 再帰の代わりに区間(開始, 終了)を積むスタック
+        # 長い区間は1つずつ、短い区間(細かい変動が多い場合に大量にできる)は同じ深さのものをまとめて処理する
+        stack = [(head, tail)]
+        short_s_fnos = []
+        short_e_fnos = []
+
+        while stack or short_s_fnos:
+            if not stack:
+                s_fnos, e_fnos = self.split_morph_frames(ratios, head, np.array(short_s_fnos, dtype=np.int64), \
+                                                         np.array(short_e_fnos, dtype=np.int64), threshold, reduce_fnos)
+                short_s_fnos = []
+                short_e_fnos = []
+                stack = list(zip(s_fnos.tolist(), e_fnos.tolist()))
+                continue
 
-        return v1
+            s_fno, e_fno = stack.pop()
+
+            if e_fno - s_fno <= 1:
+                # 間にフレームがない場合、そのまま残す
+                reduce_fnos.append(s_fno)
+                continue
+
+            if e_fno - s_fno <= REDUCE_SHORT_LEN:
+                short_s_fnos.append(s_fno)
+                short_e_fnos.append(e_fno)
+                continue
+
+            s_ratio = ratios[s_fno - head]
+            e_ratio = ratios[e_fno - head]
+
+            # 開始と終了の間を直線で結んだ時の誤差
+            ip_fnos = np.arange(s_fno + 1, e_fno, dtype=np.float64)
+            ip_ratios = s_ratio + ((e_ratio - s_ratio) * ((ip_fnos - s_fno) / (e_fno - s_fno)))
+            pos_errs = np.abs(ip_ratios - ratios[(s_fno + 1 - head):(e_fno - head)])
+            # NaNは誤差として扱わない
+            pos_errs[np.isnan(pos_errs)] = 0
+
+            # ratioのエラー最大値とそのフレーム番号(同値の場合は前側)
+            err_idx = int(np.argmax(pos_errs))
+            max_err = float(pos_errs[err_idx])
+            max_idx = s_fno + 1 + err_idx
+
+            if max_err > threshold:
+                # 誤差最大のフレームで分割する
+                stack.append((max_idx, e_fno))
+                stack.append((s_fno, max_idx))
+            else:
+                reduce_fnos.append(s_fno)
+
+        return sorted(reduce_fnos)
+
+    # 複数の区間(開始, 終了)の誤差をまとめて求め、残す開始フレームを reduce_fnos に追加する
+    # 戻り値は分割した後の区間(開始の配列, 終了の配列)
+    def split_morph_frames(self, ratios: np.ndarray, head: int, s_fnos: np.ndarray, e_fnos: np.ndarray, threshold: float, reduce_fnos: list):
+        # 全区間の間のフレームを1本の配列に並べる(区間番号・区間内の位置)
+        lengths = e_fnos - s_fnos - 1
+        starts = np.cumsum(lengths) - lengths
+        seg_idxs = np.repeat(np.arange(len(s_fnos)), lengths)
+        seg_s_fnos = s_fnos[seg_idxs]
+        seg_e_fnos = e_fnos[seg_idxs]
+        ip_fnos = seg_s_fnos + 1 + (np.arange(len(seg_idxs)) - starts[seg_idxs])
+
+        # 開始と終了の間を直線で結んだ時の誤差(1区間ずつ求める場合と同じ式)
+        s_ratios = ratios[seg_s_fnos - head]
+        e_ratios = ratios[seg_e_fnos - head]
+        ip_ratios = s_ratios + ((e_ratios - s_ratios) * ((ip_fnos.astype(np.float64) - seg_s_fnos) / (seg_e_fnos - seg_s_fnos)))
+        pos_errs = np.abs(ip_ratios - ratios[ip_fnos - head])
+        # NaNは誤差として扱わない
+        pos_errs[np.isnan(pos_errs)] = 0
+
+        # 区間毎のratioのエラー最大値とそのフレーム番号(同値の場合は前側)
+        max_errs = np.maximum.reduceat(pos_errs, starts)
+        max_poses = np.minimum.reduceat(np.where(pos_errs == max_errs[seg_idxs], np.arange(len(pos_errs)), len(pos_errs)), starts)
+        max_fnos = ip_fnos[max_poses]
+
+        # 誤差が閾値以下の区間は開始だけ残し、それ以外は誤差最大のフレームで分割する
+        is_split = max_errs > threshold
+        reduce_fnos.extend(s_fnos[~is_split].tolist())
+
+        return np.concatenate([s_fnos[is_split], max_fnos[is_split]]), np.concatenate([max_fnos[is_split], e_fnos[is_split]])
 
     # 有効なキーフレが入っているか
     def is_active_bones(self, bone_name: str):
@@ -1369,7 +1861,7 @@ class VmdMotion:
     def append_morph_frame(self, frame: VmdMorphFrame):
         if frame.name not in self.morphs:
             # まだ該当モーフ名がない場合、追加
-            self.morphs[frame.name] = {}
+            self.morphs[frame.name] = self.new_morph_track(frame.name)
         
         self.morphs[frame.name][frame.fno] = frame
 
@@ -1383,7 +1875,7 @@ class VmdMotion:
         return new_motion
 
     def copy(self):
-        motion = VmdMotion()
+        motion = VmdMotion(is_array_morph=self.is_array_morph)
 
         motion.path = cPickle.loads(cPickle.dumps(self.path, -1))
         motion.signature = cPickle.loads(cPickle.dumps(self.signature, -1))
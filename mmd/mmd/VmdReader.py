@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+#
+import mmap
+import struct
+import numpy as np
+from mmd.mmd.VmdData import VmdMotion, VmdBoneFrame, VmdMorphFrame, VmdMorphTrack, VmdCameraFrame, VmdLightFrame, VmdShadowFrame, VmdShowIkFrame, VmdInfoIk # noqa
+from mmd.module.MMath import MVector3D, MQuaternion # noqa
+from mmd.utils.MException import MParseException # noqa
+from mmd.utils.MLogger import MLogger # noqa
+
+logger = MLogger(__name__)
+
+# 各キーフレ1件分のレイアウト
+BONE_DTYPE = np.dtype([('name', 'S15'), ('fno', '<u4'), ('position', '<f4', (3,)), ('rotation', '<f4', (4,)), ('interpolation', 'u1', (64,))])
+MORPH_DTYPE = np.dtype([('name', 'S15'), ('fno', '<u4'), ('ratio', '<f4')])
+CAMERA_DTYPE = np.dtype([('fno', '<u4'), ('length', '<f4'), ('position', '<f4', (3,)), ('euler', '<f4', (3,)), ('interpolation', 'u1', (24,)), \
+                         ('angle', '<u4'), ('perspective', 'i1')])
+LIGHT_DTYPE = np.dtype([('fno', '<u4'), ('color', '<f4', (3,)), ('position', '<f4', (3,))])
+SHADOW_DTYPE = np.dtype([('fno', '<u4'), ('type', 'i1'), ('distance', '<f4')])
+
+COUNT_STRUCT = struct.Struct('<L')
+SHOW_IK_STRUCT = struct.Struct('<LbL')
+IK_STRUCT = struct.Struct('<20sb')
+
+# 署名と、それに続くモデル名のbyte数
+SIGNATURES = [(b'Vocaloid Motion Data 0002', 20), (b'Vocaloid Motion Data file', 10)]
+
+
+# 名前のbyte列(null以降は無視)を文字列にする
+def decode_name(bname: bytes):
+    return bname.split(b'\x00')[0].decode('shift_jis', errors='replace')
+
+
+# 構造化配列のままのVMDデータ
+class VmdArrays():
+    def __init__(self):
+        self.signature = b''
+        self.model_name = ''
+        # ボーン：BONE_DTYPEの配列(ファイル上の並び順)
+        self.bones = np.zeros(0, dtype=BONE_DTYPE)
+        # ボーン名の一覧と、各キーフレのボーン名のindex
+        self.bone_names = []
+        self.bone_name_idxs = np.zeros(0, dtype=np.int64)
+        # モーフ：MORPH_DTYPEの配列(ファイル上の並び順)
+        self.morphs = np.zeros(0, dtype=MORPH_DTYPE)
+        # モーフ名の一覧と、各キーフレのモーフ名のindex
+        self.morph_names = []
+        self.morph_name_idxs = np.zeros(0, dtype=np.int64)
+        self.cameras = np.zeros(0, dtype=CAMERA_DTYPE)
+        self.lights = np.zeros(0, dtype=LIGHT_DTYPE)
+        self.shadows = np.zeros(0, dtype=SHADOW_DTYPE)
+        # モデル表示・IK on/off：VmdShowIkFrameの配列(可変長なので配列にしない)
+        self.showiks = []
+
+    # 指定ボーンのキーフレのindex(ファイル上の並び順)
+    def bone_idxs(self, bone_name: str):
+        if bone_name not in self.bone_names:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.bone_name_idxs == self.bone_names.index(bone_name))
+
+    # 指定モーフのキーフレのindex(ファイル上の並び順)
+    def morph_idxs(self, morph_name: str):
+        if morph_name not in self.morph_names:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.morph_name_idxs == self.morph_names.index(morph_name))
+
+    def bone_frame(self, idx: int):
+        record = self.bones[idx]
+
+        bf = VmdBoneFrame(int(record['fno']))
+        bf.name = self.bone_names[self.bone_name_idxs[idx]]
+        bf.bname = bytes(record['name']).ljust(15, b'\x00')
+        bf.position = MVector3D(*[float(v) for v in record['position']])
+        x, y, z, w = [float(v) for v in record['rotation']]
+        bf.rotation = MQuaternion(w, x, y, z)
+        bf.org_rotation = MQuaternion(w, x, y, z)
+        bf.interpolation = record['interpolation'].tolist()
+        bf.org_interpolation = record['interpolation'].tolist()
+        bf.key = True
+        bf.read = True
+
+        return bf
+
+    def morph_frame(self, idx: int):
+        record = self.morphs[idx]
+
+        mf = VmdMorphFrame(int(record['fno']))
+        mf.name = self.morph_names[self.morph_name_idxs[idx]]
+        mf.bname = bytes(record['name']).ljust(15, b'\x00')
+        mf.ratio = float(record['ratio'])
+        mf.key = True
+
+        return mf
+
+    def camera_frame(self, idx: int):
+        record = self.cameras[idx]
+
+        cf = VmdCameraFrame()
+        cf.fno = int(record['fno'])
+        cf.length = float(record['length'])
+        cf.position = MVector3D(*[float(v) for v in record['position']])
+        cf.euler = MVector3D(*[float(v) for v in record['euler']])
+        cf.interpolation = record['interpolation'].tolist()
+        cf.angle = int(record['angle'])
+        cf.perspective = int(record['perspective'])
+        cf.org_length = cf.length
+        cf.org_position = cf.position.copy()
+
+        return cf
+
+    # 配列から必要な時にVmdBoneFrameを生成するモーション
+    def to_motion(self):
+        motion = VmdMotion(is_array_morph=True)
+        motion.signature = self.signature
+        motion.model_name = self.model_name
+
+        motion.motion_cnt = len(self.bones)
+        for name_idx, bone_name in enumerate(self.bone_names):
+            idxs = np.flatnonzero(self.bone_name_idxs == name_idx)
+            motion.bones[bone_name] = VmdBoneFrames(self, self.bones['fno'][idxs], idxs)
+
+        motion.morph_cnt = len(self.morphs)
+        for name_idx, morph_name in enumerate(self.morph_names):
+            idxs = np.flatnonzero(self.morph_name_idxs == name_idx)
+            track = VmdMorphTrack(morph_name)
+            track.assign(self.morphs['fno'][idxs], self.morphs['ratio'][idxs])
+            motion.morphs[morph_name] = track
+
+        motion.camera_cnt = len(self.cameras)
+        for idx in range(len(self.cameras)):
+            motion.cameras[int(self.cameras[idx]['fno'])] = self.camera_frame(idx)
+
+        motion.light_cnt = len(self.lights)
+        for record in self.lights:
+            lf = VmdLightFrame()
+            lf.fno = int(record['fno'])
+            lf.color = MVector3D(*[float(v) for v in record['color']])
+            lf.position = MVector3D(*[float(v) for v in record['position']])
+            motion.lights.append(lf)
+
+        motion.shadow_cnt = len(self.shadows)
+        for record in self.shadows:
+            sf = VmdShadowFrame()
+            sf.fno = int(record['fno'])
+            sf.type = int(record['type'])
+            sf.distance = float(record['distance'])
+            motion.shadows.append(sf)
+
+        motion.ik_cnt = len(self.showiks)
+        motion.showiks = self.showiks
+
+        return motion
+
+
+# 1ボーン分のキーフレ(key:フレーム番号)
+# 読み込み直後は構造化配列のindexだけを持ち、参照された時にVmdBoneFrameを生成する
+class VmdBoneFrames(dict):
+    def __init__(self, arrays: VmdArrays, fnos, idxs):
+        # 同じフレーム番号がある場合は後勝ち
+        super().__init__(zip(fnos.tolist(), idxs.tolist()))
+        self.arrays = arrays
+
+    def __getitem__(self, fno):
+        bf = super().__getitem__(fno)
+        if not isinstance(bf, VmdBoneFrame):
+            bf = self.arrays.bone_frame(bf)
+            super().__setitem__(fno, bf)
+        return bf
+
+    def get(self, fno, default=None):
+        return self[fno] if fno in self else default
+
+    def values(self):
+        return [self[fno] for fno in self.keys()]
+
+    def items(self):
+        return [(fno, self[fno]) for fno in self.keys()]
+
+
+class VmdReader():
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    # VmdMotionとして読み込む(ボーンキーフレは参照時に生成、モーフは配列のまま保持)
+    def read_data(self):
+        motion = self.read_arrays().to_motion()
+        motion.path = self.file_path
+
+        return motion
+
+    # 構造化配列のまま読み込む
+    def read_arrays(self):
+        with open(self.file_path, "rb") as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # 空ファイルはmmapできない
+                raise MParseException("VMDファイルが空です: {0}".format(self.file_path))
+
+        # 読み込んだ値はすべてコピーして、ファイルのマップはここで閉じる(開いたままだとWindowsで上書き・削除できない)
+        try:
+            arrays = VmdArrays()
+            offset = 30
+
+            arrays.signature = bytes(buffer[:offset])
+            model_name_len = next((name_len for signature, name_len in SIGNATURES if arrays.signature.startswith(signature)), 0)
+            if not model_name_len:
+                raise MParseException("VMDファイルの署名が不正です: {0}".format(arrays.signature))
+
+            arrays.model_name = decode_name(bytes(buffer[offset:(offset + model_name_len)]))
+            offset += model_name_len
+
+            arrays.bones, offset = self.read_records(buffer, offset, BONE_DTYPE)
+            arrays.bone_names, arrays.bone_name_idxs = self.read_names(arrays.bones)
+            logger.debug("bones: %s", len(arrays.bones))
+
+            arrays.morphs, offset = self.read_records(buffer, offset, MORPH_DTYPE)
+            arrays.morph_names, arrays.morph_name_idxs = self.read_names(arrays.morphs)
+            logger.debug("morphs: %s", len(arrays.morphs))
+
+            # カメラ以降は古いファイルだと省略されている場合がある
+            arrays.cameras, offset = self.read_records(buffer, offset, CAMERA_DTYPE)
+            arrays.lights, offset = self.read_records(buffer, offset, LIGHT_DTYPE)
+            arrays.shadows, offset = self.read_records(buffer, offset, SHADOW_DTYPE)
+            arrays.showiks, offset = self.read_show_iks(buffer, offset)
+
+            return arrays
+        finally:
+            buffer.close()
+
+    # 件数 + 固定長レコードのセクションを読み込む(マップを閉じられるように、レコードはまとめてコピーする)
+    def read_records(self, buffer, offset: int, dtype: np.dtype):
+        if offset + COUNT_STRUCT.size > len(buffer):
+            return np.zeros(0, dtype=dtype), offset
+
+        count = COUNT_STRUCT.unpack_from(buffer, offset)[0]
+        offset += COUNT_STRUCT.size
+
+        if offset + count * dtype.itemsize > len(buffer):
+            raise MParseException("VMDファイルが途中で切れています: offset={0}, count={1}".format(offset, count))
+
+        records = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).copy()
+
+        return records, offset + count * dtype.itemsize
+
+    # 名前の一覧(出現順)と、各レコードの名前のindex
+    def read_names(self, records: np.ndarray):
+        if len(records) == 0:
+            return [], np.zeros(0, dtype=np.int64)
+
+        unique_bnames, first_idxs, name_idxs = np.unique(records['name'], return_index=True, return_inverse=True)
+
+        # 出現順に名前を振り直す(null以降のゴミだけが違う名前は同じ名前として扱う)
+        names = []
+        unique_name_idxs = np.zeros(len(unique_bnames), dtype=np.int64)
+        for idx in np.argsort(first_idxs, kind='stable'):
+            name = decode_name(bytes(unique_bnames[idx]))
+            if name not in names:
+                names.append(name)
+            unique_name_idxs[idx] = names.index(name)
+
+        return names, unique_name_idxs[name_idxs]
+
+    # モデル表示・IK on/offは可変長なので1件ずつ読み込む
+    def read_show_iks(self, buffer, offset: int):
+        if offset + COUNT_STRUCT.size > len(buffer):
+            return [], offset
+
+        count = COUNT_STRUCT.unpack_from(buffer, offset)[0]
+        offset += COUNT_STRUCT.size
+
+        show_iks = []
+        for _ in range(count):
+            self.check_size(buffer, offset, SHOW_IK_STRUCT.size, count)
+            sf = VmdShowIkFrame()
+            sf.fno, sf.show, sf.ik_count = SHOW_IK_STRUCT.unpack_from(buffer, offset)
+            offset += SHOW_IK_STRUCT.size
+
+            for _ in range(sf.ik_count):
+                self.check_size(buffer, offset, IK_STRUCT.size, sf.ik_count)
+                bname, onoff = IK_STRUCT.unpack_from(buffer, offset)
+                offset += IK_STRUCT.size
+
+                ik = VmdInfoIk(decode_name(bname), onoff)
+                ik.bname = bname
+                sf.ik.append(ik)
+
+            show_iks.append(sf)
+
+        return show_iks, offset
+
+    # 残りのbyte数が足りなければ、途中で切れているファイル
+    def check_size(self, buffer, offset: int, size: int, count: int):
+        if offset + size > len(buffer):
+            raise MParseException("VMDファイルが途中で切れています: offset={0}, count={1}".format(offset, count))
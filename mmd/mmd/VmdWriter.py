@@ -1,66 +1,158 @@
 # -*- coding: utf-8 -*-
 #
 import struct
+import numpy as np
 from mmd.mmd.PmxData import PmxModel
-from mmd.mmd.VmdData import VmdMotion
+from mmd.mmd.VmdData import VmdMotion, VmdMorphTrack
 from mmd.utils.MLogger import MLogger # noqa
 
 logger = MLogger(__name__)
 
+# 各キーフレの固定長部分のレイアウト(名前・補間曲線以外)
+COUNT_STRUCT = struct.Struct('<L')
+BONE_STRUCT = struct.Struct('<L7f')
+MORPH_STRUCT = struct.Struct('<Lf')
+CAMERA_STRUCT = struct.Struct('<L7f')
+CAMERA_TAIL_STRUCT = struct.Struct('<Lb')
+LIGHT_STRUCT = struct.Struct('<L6f')
+# セルフ影はモードが1byte(VmdReader.SHADOW_DTYPE と同じ9byte)
+SHADOW_STRUCT = struct.Struct('<Lbf')
+SHOW_IK_STRUCT = struct.Struct('<LbL')
+IK_ONOFF_STRUCT = struct.Struct('b')
+
+# モーフキーフレ1件分(名前15byte + フレーム番号 + 値)
+MORPH_DTYPE = np.dtype([('name', 'S15'), ('fno', '<u4'), ('ratio', '<f4')])
+
 
 class VmdWriter():
     def __init__(self, model: PmxModel, motion: VmdMotion, output_vmd_path: str):
         self.model = model
         self.motion = motion
         self.output_vmd_path = output_vmd_path
+        # 名前のエンコード結果(key: (名前, byte数))
+        self.bnames = {}
+        # 補間曲線のbyte列(key: 補間曲線のtuple)
+        self.binterpolations = {}
 
     def write(self):
         """Write VMD data to a file"""
-        fout = open(self.output_vmd_path, "wb")
-
-        # header
-        fout.write(b'Vocaloid Motion Data 0002\x00\x00\x00\x00\x00')
-
-        bone_frames = self.motion.get_bone_frames()
-        morph_frames = self.motion.get_morph_frames()
-        camera_frames = self.motion.get_camera_frames()
-            
-        if len(bone_frames) > 0 or len(morph_frames) > 0:
-            try:
-                # モデル名を20byteで切る
-                model_bname = self.model.name.encode('cp932').decode('shift_jis').encode('shift_jis')[:20]
-            except Exception:
-                logger.warning("モデル名に日本語・英語で判読できない文字が含まれているため、仮モデル名を設定します。 %s", self.model.name, decoration=MLogger.DECORATION_BOX)
-                model_bname = "Vmd Sized Model".encode('shift_jis')[:20]
-
-            # 20文字に満たなかった場合、埋める
-            model_bname = model_bname.ljust(20, b'\x00')
-                
-            fout.write(model_bname)
-        else:
-            # カメラ・照明
-            fout.write(b'\x83J\x83\x81\x83\x89\x81E\x8f\xc6\x96\xbe\x00on Data')
-        
-        # bone frames
-        fout.write(struct.pack('<L', len(bone_frames)))  # ボーンフレーム数
+        with open(self.output_vmd_path, "wb") as fout:
+            # header
+            fout.write(b'Vocaloid Motion Data 0002\x00\x00\x00\x00\x00')
+
+            bone_frames = self.motion.get_bone_frames()
+            camera_frames = self.motion.get_camera_frames()
+            morph_bytes, morph_cnt = self.pack_morph_frames()
+
+            if len(bone_frames) > 0 or morph_cnt > 0:
+                try:
+                    # モデル名を20byteで切る
+                    model_bname = self.model.name.encode('cp932').decode('shift_jis').encode('shift_jis')[:20]
+                except Exception:
+                    logger.warning("モデル名に日本語・英語で判読できない文字が含まれているため、仮モデル名を設定します。 %s", self.model.name, decoration=MLogger.DECORATION_BOX)
+                    model_bname = "Vmd Sized Model".encode('shift_jis')[:20]
+
+                # 20文字に満たなかった場合、埋める
+                model_bname = model_bname.ljust(20, b'\x00')
+
+                fout.write(model_bname)
+            else:
+                # カメラ・照明
+                fout.write(b'\x83J\x83\x81\x83\x89\x81E\x8f\xc6\x96\xbe\x00on Data')
+
+            # セクションごとに1回で書き込む
+            fout.write(self.pack_bone_frames(bone_frames))
+            fout.write(morph_bytes)
+            fout.write(self.pack_camera_frames(camera_frames))
+            fout.write(self.pack_light_frames(self.motion.lights))
+            fout.write(self.pack_shadow_frames(self.motion.shadows))
+
+            if len(camera_frames) == 0:
+                fout.write(self.pack_show_ik_frames(self.motion.showiks))
+
+    # 名前を指定byte数のShift-JISに変換する(名前ごとに1回だけ変換)
+    def encode_name(self, name: str, length: int):
+        key = (name, length)
+        if key not in self.bnames:
+            self.bnames[key] = name.encode('cp932').decode('shift_jis').encode('shift_jis')[:length].ljust(length, b'\x00')
+        return self.bnames[key]
+
+    # 補間曲線をbyte列に変換する(同じ補間曲線は1回だけ変換)
+    def encode_interpolation(self, interpolation: list):
+        key = tuple(interpolation)
+        if key not in self.binterpolations:
+            self.binterpolations[key] = bytes([int(min(127, max(0, x))) for x in interpolation])
+        return self.binterpolations[key]
+
+    def pack_bone_frames(self, bone_frames: list):
+        buf = bytearray(COUNT_STRUCT.pack(len(bone_frames)))  # ボーンフレーム数
         for bf in bone_frames:
-            bf.write(fout)
-        fout.write(struct.pack('<L', len(morph_frames)))  # 表情キーフレーム数
-        for mf in morph_frames:
-            mf.write(fout)
-        fout.write(struct.pack('<L', len(camera_frames)))  # カメラキーフレーム数
+            v = bf.rotation.normalized().toVector4D()
+            buf += bf.bname or self.encode_name(bf.name, 15)   # 15文字制限
+            buf += BONE_STRUCT.pack(int(bf.fno), float(bf.position.x()), float(bf.position.y()), float(bf.position.z()), \
+                                    float(v.x()), float(v.y()), float(v.z()), float(v.w()))
+            buf += self.encode_interpolation(bf.interpolation)
+        return buf
+
+    # モーフキーフレのbyte列と件数
+    def pack_morph_frames(self):
+        if not all(isinstance(morph_frames, VmdMorphTrack) for morph_frames in self.motion.morphs.values()):
+            morph_frames = self.motion.get_morph_frames()
+
+            buf = bytearray(COUNT_STRUCT.pack(len(morph_frames)))  # 表情キーフレーム数
+            for mf in morph_frames:
+                buf += mf.bname or self.encode_name(mf.name, 15)   # 15文字制限
+                buf += MORPH_STRUCT.pack(int(mf.fno), float(mf.ratio))
+            return buf, len(morph_frames)
+
+        # 配列で保持している場合、構造化配列にまとめて変換する
+        # 並び順は get_morph_frames と同じ(各モーフの最終キー → 各モーフの残りのキー)
+        tracks = [track for track in self.motion.morphs.values() if len(track) > 0]
+        records = np.zeros(sum(len(track) for track in tracks), dtype=MORPH_DTYPE)
+
+        last_idx = 0
+        rest_idx = len(tracks)
+        for track in tracks:
+            bname = track.bname or self.encode_name(track.name, 15)
+
+            records[last_idx] = (bname, track.fnos[-1], track.ratios[-1])
+            last_idx += 1
+
+            rest_cnt = len(track) - 1
+            rest_records = records[rest_idx:(rest_idx + rest_cnt)]
+            rest_records['name'] = bname
+            rest_records['fno'] = track.fnos[:-1]
+            rest_records['ratio'] = track.ratios[:-1]
+            rest_idx += rest_cnt
+
+        return bytearray(COUNT_STRUCT.pack(len(records))) + records.tobytes(), len(records)
+
+    def pack_camera_frames(self, camera_frames: list):
+        buf = bytearray(COUNT_STRUCT.pack(len(camera_frames)))  # カメラキーフレーム数
         for cf in camera_frames:
-            cf.write(fout)
-        fout.write(struct.pack('<L', len(self.motion.lights)))  # 照明キーフレーム数
-        for cf in self.motion.lights:
-            cf.write(fout)
-        fout.write(struct.pack('<L', len(self.motion.shadows)))  # セルフ影キーフレーム数
-        for cf in self.motion.shadows:
-            cf.write(fout)
-            
-        if len(camera_frames) == 0:
-            fout.write(struct.pack('<L', len(self.motion.showiks)))  # モデル表示・IK on/offキーフレーム数
-            for sf in self.motion.showiks:
-                sf.write(fout)
-        
-        fout.close()
+            buf += CAMERA_STRUCT.pack(int(cf.fno), float(cf.length), float(cf.position.x()), float(cf.position.y()), float(cf.position.z()), \
+                                      float(cf.euler.x()), float(cf.euler.y()), float(cf.euler.z()))
+            buf += self.encode_interpolation(cf.interpolation)
+            buf += CAMERA_TAIL_STRUCT.pack(int(cf.angle), cf.perspective)
+        return buf
+
+    def pack_light_frames(self, light_frames: list):
+        buf = bytearray(COUNT_STRUCT.pack(len(light_frames)))  # 照明キーフレーム数
+        for lf in light_frames:
+            buf += LIGHT_STRUCT.pack(lf.fno, lf.color.x(), lf.color.y(), lf.color.z(), lf.position.x(), lf.position.y(), lf.position.z())
+        return buf
+
+    def pack_shadow_frames(self, shadow_frames: list):
+        buf = bytearray(COUNT_STRUCT.pack(len(shadow_frames)))  # セルフ影キーフレーム数
+        for sf in shadow_frames:
+            buf += SHADOW_STRUCT.pack(int(sf.fno), int(sf.type), float(sf.distance))
+        return buf
+
+    def pack_show_ik_frames(self, show_ik_frames: list):
+        buf = bytearray(COUNT_STRUCT.pack(len(show_ik_frames)))  # モデル表示・IK on/offキーフレーム数
+        for sf in show_ik_frames:
+            buf += SHOW_IK_STRUCT.pack(sf.fno, sf.show, len(sf.ik))
+            for k in sf.ik:
+                buf += k.bname or self.encode_name(k.name, 20)   # 20文字制限
+                buf += IK_ONOFF_STRUCT.pack(k.onoff)
+        return buf
@@ -48,3 +48,42 @@ class FFMPEGMonauralProcessAudioAdapter(FFMPEGProcessAudioAdapter):
             raise SpleeterError(f'FFMPEG error: {process.stderr.read()}')
         get_logger().info('File %s written succesfully', path)
     
+
+
+class FFMPEGMonauralStreamWriter:
+    """ Write waveform data chunk by chunk to a 16kHz mono PCM16 wav file
+    through a single FFMPEG process.
+    """
+
+    def __init__(self, path, sample_rate, channels):
+        _check_ffmpeg_install()
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            raise SpleeterError(f'output directory does not exists: {directory}')
+        get_logger().debug('Writing file %s', path)
+        self.path = path
+        self.process = (
+            ffmpeg
+            .input('pipe:', format='f32le', ar=sample_rate, ac=channels)
+            .output(path, ar=16000, ac=1, acodec='pcm_s16le')
+            .overwrite_output()
+            .global_args('-loglevel', 'error')
+            .run_async(pipe_stdin=True))
+
+    def write(self, data):
+        try:
+            self.process.stdin.write(data.astype('<f4').tobytes())
+        except IOError:
+            raise SpleeterError(f'FFMPEG error: {self.path}')
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise SpleeterError(f'FFMPEG error: {self.path}')
+        get_logger().info('File %s written succesfully', self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
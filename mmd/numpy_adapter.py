@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+
+from mmd.utils.MAudioUtils import PCM16WavWriter, PolyphaseResampler, mmap_wav, pcm_to_float32, to_channels, to_frames, to_monaural, resample_poly
+from mmd.utils.MLogger import MLogger
+
+logger = MLogger(__name__)
+
+# 一度に読み込むサンプル数(ストリーム読み込み時)
+READ_BLOCK_SIZE = 65536
+
+
+# 音声読み込み・保存のアダプタ(ffmpeg: spleeterのffmpegアダプタ, numpy: WAVはNumPyだけで処理)
+def get_audio_adapter(name: str):
+    if name == "numpy":
+        return NumpyAudioAdapter()
+
+    from spleeter.audio.adapter import get_default_audio_adapter
+    return get_default_audio_adapter()
+
+
+class NumpyAudioAdapter:
+    """ Audio adapter that reads and writes RIFF/WAV with NumPy only.
+    Compressed formats are delegated to spleeter's FFMPEG adapter.
+    """
+
+    def load(self, path, offset=None, duration=None, sample_rate=44100, dtype=np.float32):
+        raw, layout = mmap_wav(path)
+        if raw is None:
+            # 圧縮形式などはffmpegに任せる
+            from spleeter.audio.adapter import get_default_audio_adapter
+            return get_default_audio_adapter().load(path, offset=offset, duration=duration, sample_rate=sample_rate, dtype=dtype)
+
+        # 必要な範囲だけfloatにする
+        start = int(round((offset or 0) * layout["sample_rate"]))
+        end = len(raw) if duration is None else start + int(round(duration * layout["sample_rate"]))
+        waveform = pcm_to_float32(raw[start:end], layout)
+
+        if sample_rate and int(sample_rate) != layout["sample_rate"]:
+            waveform = resample_poly(waveform, layout["sample_rate"], int(sample_rate))
+
+        return waveform.astype(dtype), (int(sample_rate) if sample_rate else layout["sample_rate"])
+
+    def save(self, path, data, sample_rate, codec=None, bitrate=None):
+        if codec is not None and codec != 'wav':
+            from spleeter.audio.adapter import get_default_audio_adapter
+            return get_default_audio_adapter().save(path, data, sample_rate, codec, bitrate)
+
+        waveform = to_frames(data)
+        with PCM16WavWriter(path, sample_rate, waveform.shape[1]) as writer:
+            writer.write(waveform)
+
+
+class NumpyMonauralStreamWriter:
+    """ Write waveform data chunk by chunk to a 16kHz mono PCM16 wav file
+    (NumPy version of FFMPEGMonauralStreamWriter).
+    """
+
+    def __init__(self, path, sample_rate, channels):
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            raise IOError(f'output directory does not exists: {directory}')
+        self.resampler = PolyphaseResampler(sample_rate, 16000, 1)
+        self.writer = PCM16WavWriter(path, 16000, 1)
+
+    def write(self, data):
+        self.writer.write(self.resampler.process(to_monaural(data)))
+
+    def close(self):
+        self.writer.write(self.resampler.flush())
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class WavStreamReader:
+    """ Read a WAV file through a memory map, converted to the given sample rate
+    and channel count, a few samples at a time.
+    """
+
+    def __init__(self, path, sample_rate, channels):
+        self.raw, self.layout = mmap_wav(path)
+        self.channels = channels
+        self.resampler = PolyphaseResampler(self.layout["sample_rate"], sample_rate, channels) if self.raw is not None else None
+        self.read_cnt = 0
+        self.buf = np.zeros((0, channels), dtype=np.float32)
+
+    # 非圧縮のWAVとして読めるか
+    def is_valid(self):
+        return self.raw is not None
+
+    def read(self, sample_cnt: int):
+        while len(self.buf) < sample_cnt and self.resampler:
+            if self.read_cnt < len(self.raw):
+                block = to_channels(pcm_to_float32(self.raw[self.read_cnt:(self.read_cnt + READ_BLOCK_SIZE)], self.layout), self.channels)
+                self.read_cnt += READ_BLOCK_SIZE
+                converted = self.resampler.process(block)
+            else:
+                converted = self.resampler.flush()
+                self.resampler = None
+            self.buf = np.concatenate([self.buf, converted])
+
+        data, self.buf = self.buf[:sample_cnt], self.buf[sample_cnt:]
+        return data
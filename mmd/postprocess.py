@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# リップモーフの後処理(平滑化・範囲制限・母音の排他・キー削減)
+# 各モーフを曲全体の密な配列にして、まとめて処理する
+#
+import numpy as np
+
+from mmd.mmd.VmdData import VmdMotion, VmdMorphTrack, interp_ratios, one_euro_tracks
+from mmd.utils.MLogger import MLogger
+
+logger = MLogger(__name__)
+
+VOWEL_MORPH_NAMES = ['あ', 'い', 'う', 'え', 'お']
+
+# 平滑化(OneEuroFilter)の設定(VmdMotion.smooth_filter_mf と同じ)
+SMOOTH_CONFIG = {"freq": 30, "mincutoff": 0.3, "beta": 0.01, "dcutoff": 0.25}
+
+
+class MorphCurves:
+    """ Ratios of several morphs as dense float32 arrays over the whole timeline
+    (one row per morph), with a mask of the frames that hold a key.
+    """
+
+    def __init__(self, motion: VmdMotion, morph_names: list, end_fno: int):
+        self.motion = motion
+        self.morph_names = morph_names
+
+        key_fnos_list = [np.asarray(sorted(motion.morphs[morph_name].keys()) if morph_name in motion.morphs else [], dtype=np.int64) \
+                         for morph_name in morph_names]
+        self.frame_cnt = max([end_fno] + [int(key_fnos[-1]) for key_fnos in key_fnos_list if len(key_fnos) > 0]) + 1
+
+        self.ratios = np.zeros((len(morph_names), self.frame_cnt), dtype=np.float32)
+        self.is_keys = np.zeros((len(morph_names), self.frame_cnt), dtype=bool)
+        # 値を変更したモーフ
+        self.is_changed = np.zeros(len(morph_names), dtype=bool)
+
+        for midx, (morph_name, key_fnos) in enumerate(zip(morph_names, key_fnos_list)):
+            key_fnos = key_fnos[key_fnos >= 0]
+            self.is_keys[midx, key_fnos] = True
+            self.ratios[midx] = motion.calc_mf_ratios(morph_name, np.arange(self.frame_cnt))
+
+    # 各モーフのキーの値を時系列にOneEuroFilterにかけ(全モーフを1回で処理)、キーの間は線形補間し直す
+    def smooth(self, config=SMOOTH_CONFIG):
+        key_fnos_list = [np.flatnonzero(self.is_keys[midx]) for midx in range(len(self.morph_names))]
+        key_ratios_list = one_euro_tracks([self.ratios[midx, key_fnos] for midx, key_fnos in enumerate(key_fnos_list)], key_fnos_list, **config)
+
+        for midx, (key_fnos, key_ratios) in enumerate(zip(key_fnos_list, key_ratios_list)):
+            if len(key_fnos) == 0:
+                continue
+
+            self.ratios[midx] = interp_ratios(key_fnos, key_ratios, np.arange(self.frame_cnt))
+            self.is_changed[midx] = True
+
+    # 0～1に収める
+    def clamp(self):
+        before_ratios = self.ratios.copy()
+        np.clip(self.ratios, 0, 1, out=self.ratios)
+        self.mark_changes(before_ratios)
+
+    # 同じフレームで複数の母音が開いている場合、一番大きい母音だけ残す
+    def exclude(self):
+        before_ratios = self.ratios.copy()
+        max_idxs = np.argmax(self.ratios, axis=0)
+        is_loser = np.arange(len(self.morph_names))[:, np.newaxis] != max_idxs[np.newaxis, :]
+        self.ratios[is_loser] = 0
+        self.mark_changes(before_ratios)
+
+    # 値が変わったフレームと、その前後のフレームにキーを打つ(補間で形が崩れないようにする)
+    def mark_changes(self, before_ratios: np.ndarray):
+        is_diff = before_ratios != self.ratios
+        if not np.any(is_diff):
+            return
+
+        self.is_keys |= is_diff
+        self.is_keys[:, 1:] |= is_diff[:, :-1]
+        self.is_keys[:, :-1] |= is_diff[:, 1:]
+        self.is_changed |= np.any(is_diff, axis=1)
+
+    # 変更したモーフのキーを、配列から作り直す
+    def write_back(self):
+        for midx, morph_name in enumerate(self.morph_names):
+            if not self.is_changed[midx]:
+                continue
+
+            key_fnos = np.flatnonzero(self.is_keys[midx])
+            track = VmdMorphTrack(morph_name)
+            track.assign(key_fnos, self.ratios[midx, key_fnos])
+
+            if isinstance(self.motion.morphs.get(morph_name), VmdMorphTrack):
+                self.motion.morphs[morph_name] = track
+            else:
+                # 辞書で保持している場合はフレームを登録し直す
+                self.motion.morphs[morph_name] = {}
+                for mf in track.values():
+                    self.motion.regist_mf(mf, morph_name, mf.fno)
+
+
+# 母音モーフの後処理
+# 平滑化・排他は全モーフをまとめて行い、キー削減はモーフ毎に順に行う
+# (キー削減は短いNumPy処理の繰り返しでGILをほとんど手放さないので、スレッドにしても速くならない)
+def process_morphs(motion: VmdMotion, end_fno: int, threshold=0, is_smooth=False, is_exclusive=False, morph_names=VOWEL_MORPH_NAMES):
+    if is_smooth or is_exclusive:
+        logger.info("モーフ後処理(平滑化: {0}, 母音の排他: {1})", is_smooth, is_exclusive, decoration=MLogger.DECORATION_LINE)
+
+        curves = MorphCurves(motion, morph_names, end_fno)
+        if is_smooth:
+            curves.smooth()
+        curves.clamp()
+        if is_exclusive:
+            curves.exclude()
+        curves.write_back()
+
+    if 0 < threshold < 1:
+        logger.info("不要モーフキー削除処理", decoration=MLogger.DECORATION_LINE)
+
+        for morph_name in morph_names:
+            motion.remove_unnecessary_mf(-1, morph_name, threshold=threshold)
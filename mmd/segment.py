@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import numpy as np
+
+from mmd.utils.MLogger import MLogger
+from mmd.utils.MAudioUtils import load_monaural_16k
+from mmd.lyrics import read_lyrics, IGNORE_TABLE
+
+logger = MLogger(__name__)
+
+# 音量を測る単位(秒)
+VAD_FRAME_SEC = 0.01
+# これより短い有音は雑音として無視する(秒)
+VAD_MIN_VOICE_SEC = 0.1
+# 区間の前後に付ける余白(秒)
+VAD_PADDING_SEC = 0.2
+
+
+# 音声の無音部分で歌詞を区切り、区間付きの歌詞ファイルを出力する
+def execute(args):
+    try:
+        logger.info('歌詞区間推定処理開始: {0}', args.lyrics_file, decoration=MLogger.DECORATION_BOX)
+
+        if not os.path.exists(args.audio_dir):
+            logger.error("指定された音声ディレクトリパスが存在しません。\n{0}", args.audio_dir, decoration=MLogger.DECORATION_BOX)
+            return False
+
+        if not os.path.exists(args.lyrics_file):
+            logger.error("指定された歌詞ファイルパスが存在しません。\n{0}", args.lyrics_file, decoration=MLogger.DECORATION_BOX)
+            return False
+
+        # 区間指定のないブロックも許容して読み込む
+        lyrics_blocks, lyrics_errors = read_lyrics(args.lyrics_file, is_timed=False)
+        if lyrics_errors:
+            logger.error("歌詞ファイルに誤りがあります。\n{0}\n{1}", "\n".join([str(e) for e in lyrics_errors]), args.lyrics_file, decoration=MLogger.DECORATION_BOX)
+            return False
+
+        timed_cnt = len([b for b in lyrics_blocks if b.is_timed()])
+        if 0 < timed_cnt < len(lyrics_blocks):
+            logger.error("区間指定のある段落とない段落が混在しています。すべて指定するか、すべて外してください。\n{0}", args.lyrics_file, decoration=MLogger.DECORATION_BOX)
+            return False
+
+        data, rate = load_monaural_16k(args.audio_dir, args.audio_adapter)
+        voices = detect_voices(data, rate, args.vad_threshold_db, args.vad_min_silence)
+        logger.info("有音区間: {0}箇所", len(voices))
+
+        blocks = []
+        if timed_cnt == 0:
+            # 全体の有音区間に、歌詞を文字数の比率で割り当てる
+            pieces = [piece for b in lyrics_blocks for piece in split_lines(b.lines, args.block_max_len)]
+            blocks = assign_pieces(pieces, voices, 0, len(data) / rate)
+        else:
+            # 指定区間の中で、長い段落だけ分割する
+            for b in lyrics_blocks:
+                pieces = split_lines(b.lines, args.block_max_len)
+                if len(pieces) == 1:
+                    blocks.append((b.start_sec, b.end_sec, pieces[0]))
+                else:
+                    blocks.extend(assign_pieces(pieces, clip_voices(voices, b.start_sec, b.end_sec), b.start_sec, b.end_sec))
+
+        timed_lyrics_file = os.path.join(args.audio_dir, "lyrics_timed.txt")
+        with open(timed_lyrics_file, "w", encoding='utf-8') as f:
+            f.write("\n\n".join(["{0}-{1}\n{2}".format(format_sec(start), format_sec(end), "\n".join(lines)) for (start, end, lines) in blocks]))
+            f.write("\n")
+
+        logger.info('歌詞区間推定処理終了: {0}ブロック\n{1}\n内容を確認してから、リップ生成の歌詞ファイルとして指定してください。', \
+                    len(blocks), timed_lyrics_file, decoration=MLogger.DECORATION_BOX)
+
+        # 続けてリップ生成する場合は、推定した歌詞ファイルを使う
+        args.lyrics_file = timed_lyrics_file
+
+        return True
+    except Exception as e:
+        logger.critical("歌詞区間推定で予期せぬエラーが発生しました。", e, decoration=MLogger.DECORATION_BOX)
+        return False
+
+
+# リップ生成時と同じ数え方の文字数(記号・空白を除く)
+def count_chars(text: str):
+    return len(text.translate(IGNORE_TABLE))
+
+
+# 段落の行を、上限文字数以内のかたまりに分ける(行の途中では区切らない。1行で超える場合は空白・記号の位置で区切る)
+def split_lines(lines: list, max_len: int):
+    units = []
+    for line in lines:
+        units.extend(split_line(line, max_len))
+
+    pieces = []
+    piece = []
+    piece_len = 0
+    for unit in units:
+        unit_len = count_chars(unit)
+        if piece and piece_len + unit_len > max_len:
+            pieces.append(piece)
+            piece = []
+            piece_len = 0
+        piece.append(unit)
+        piece_len += unit_len
+
+    if piece:
+        pieces.append(piece)
+
+    return pieces
+
+
+def split_line(line: str, max_len: int):
+    if count_chars(line) <= max_len:
+        return [line]
+
+    units = []
+    unit = ""
+    # 空白・記号の後ろで区切れるようにする
+    for word in re.split(r'(?<=[ 　、。！？\!\?])', line):
+        while count_chars(word) > max_len:
+            # 区切れる位置がない場合は上限で切る
+            cut_idx = cut_index(word, max_len)
+            if unit:
+                units.append(unit)
+                unit = ""
+            units.append(word[:cut_idx])
+            word = word[cut_idx:]
+
+        if unit and count_chars(unit + word) > max_len:
+            units.append(unit)
+            unit = ""
+        unit += word
+
+    if unit:
+        units.append(unit)
+
+    return [u.strip() for u in units if u.strip()]
+
+
+# 数える文字がmax_len文字になる位置
+def cut_index(text: str, max_len: int):
+    cnt = 0
+    for idx, c in enumerate(text):
+        if c.translate(IGNORE_TABLE):
+            cnt += 1
+            if cnt > max_len:
+                return idx
+    return len(text)
+
+
+# 有音区間[(開始秒, 終了秒)]
+# フレームごとの音量(dB)が、上位5%の音量 + threshold_db を下回るところを無音とし、min_silence秒以上続く無音で区切る
+def detect_voices(data: np.ndarray, rate: int, threshold_db: float, min_silence: float):
+    frame_size = max(1, int(rate * VAD_FRAME_SEC))
+    frame_cnt = len(data) // frame_size
+    if frame_cnt == 0:
+        return []
+
+    frames = np.asarray(data[:(frame_cnt * frame_size)], dtype=np.float32).reshape(frame_cnt, frame_size)
+    rms_db = 20 * np.log10(np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1)) + 1e-10)
+    is_voice = rms_db > np.percentile(rms_db, 95) + threshold_db
+
+    # 有音の開始・終了フレーム
+    edges = np.diff(np.concatenate([[0], is_voice.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    voices = []
+    for start, end in zip(starts, ends):
+        if voices and (start - voices[-1][1]) * VAD_FRAME_SEC < min_silence:
+            # 短い無音は繋げる
+            voices[-1][1] = end
+        else:
+            voices.append([start, end])
+
+    return [(start * VAD_FRAME_SEC, end * VAD_FRAME_SEC) for start, end in voices if (end - start) * VAD_FRAME_SEC >= VAD_MIN_VOICE_SEC]
+
+
+# 指定範囲内の有音区間
+def clip_voices(voices: list, start_sec: float, end_sec: float):
+    return [(max(start_sec, s), min(end_sec, e)) for s, e in voices if e > start_sec and s < end_sec]
+
+
+# 歌詞のかたまりを有音区間に割り当てる。区切りは、文字数の比率に一番近い有音時間の位置にある無音
+# 戻り値は [(開始秒, 終了秒, 行のリスト)]
+def assign_pieces(pieces: list, voices: list, range_start: float, range_end: float):
+    if not voices:
+        # 有音区間がない場合は範囲を文字数で按分する
+        voices = [(range_start, range_end)]
+
+    piece_lens = np.array([max(1, sum(count_chars(line) for line in piece)) for piece in pieces], dtype=np.float64)
+    durations = np.array([e - s for s, e in voices])
+    # 各無音(有音区間の間)までの有音時間の累計
+    gap_durations = np.cumsum(durations)[:-1]
+    # 各かたまりの終わりまでの、文字数比率での有音時間の目安
+    targets = np.cumsum(piece_lens)[:-1] / np.sum(piece_lens) * np.sum(durations)
+
+    # 区切りの秒数(前の無音の終わり, 次の有音の始まり)。単調増加で、無音を使い切るまでは無音で区切る
+    boundaries = []
+    prev_idx = -1
+    for pidx, target in enumerate(targets):
+        if prev_idx + 1 >= len(gap_durations):
+            # 無音を使い切った場合、残りの区切りは最後の無音以降の有音時間を文字数で按分した位置
+            prev_duration = gap_durations[prev_idx] if prev_idx >= 0 else 0
+            rest_lens = np.cumsum(piece_lens[pidx:])
+            for rest_len in rest_lens[:-1]:
+                sec = voice_time(voices, prev_duration + (np.sum(durations) - prev_duration) * rest_len / rest_lens[-1])
+                boundaries.append((sec, sec))
+            break
+
+        # 残りのかたまりの分の無音を残す(無音の方が少ない場合は、近い無音から使う)
+        last_idx = max(prev_idx + 1, len(gap_durations) - (len(targets) - pidx))
+        candidates = np.arange(prev_idx + 1, last_idx + 1)
+        prev_idx = int(candidates[np.argmin(np.abs(gap_durations[candidates] - target))])
+        boundaries.append((voices[prev_idx][1], voices[prev_idx + 1][0]))
+
+    blocks = []
+    for pidx, piece in enumerate(pieces):
+        # 前後の無音の中点までの範囲で、有音の前後に余白を付ける
+        prev_end, next_start = (boundaries[pidx - 1] if pidx > 0 else (range_start, range_start))
+        start = max((prev_end + next_start) / 2 if pidx > 0 else range_start, next_start - VAD_PADDING_SEC)
+        this_end, after_start = (boundaries[pidx] if pidx < len(boundaries) else (range_end, range_end))
+        end = min((this_end + after_start) / 2 if pidx < len(boundaries) else range_end, this_end + VAD_PADDING_SEC)
+
+        if pidx == 0:
+            start = max(range_start, voices[0][0] - VAD_PADDING_SEC)
+        if pidx == len(pieces) - 1:
+            end = min(range_end, voices[-1][1] + VAD_PADDING_SEC)
+
+        blocks.append((start, max(start, end), piece))
+
+    return blocks
+
+
+# 有音時間の累計がdurationになる時刻
+def voice_time(voices: list, duration: float):
+    for s, e in voices:
+        if duration <= e - s:
+            return s + duration
+        duration -= e - s
+    return voices[-1][1]
+
+
+# 秒数を m:ss.fff にする
+def format_sec(sec: float):
+    msec = int(round(max(0, sec) * 1000))
+    return "{0}:{1:02d}.{2:03d}".format(msec // 60000, (msec // 1000) % 60, msec % 1000)
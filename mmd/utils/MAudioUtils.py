@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+#
+import os
+import math
+import json
+import struct
+import wave
+import numpy as np
+
+from mmd.utils.MLogger import MLogger # noqa
+
+logger = MLogger(__name__)
+
+# 音声分離結果の形式を記録するファイル名
+STEM_MANIFEST_FILE = "vocals.json"
+
+# WAVの形式
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# 1回のリサンプリングで計算する出力サンプル数(メモリ使用量の上限)
+RESAMPLE_BLOCK_SIZE = 32768
+
+
+# float波形をPCM16bitのWAVとして保存する(ffmpegを経由しない)
+def write_pcm16_wav(path: str, data: np.ndarray, sample_rate: int):
+    waveform = to_frames(data)
+
+    with PCM16WavWriter(path, sample_rate, waveform.shape[1]) as writer:
+        writer.write(waveform)
+
+
+# float波形を少しずつPCM16bitのWAVに書き込む(全体をメモリに持たない)
+class PCM16WavWriter:
+    def __init__(self, path: str, sample_rate: int, channels: int):
+        self.file = wave.open(path, 'wb')
+        self.file.setnchannels(channels)
+        self.file.setsampwidth(2)
+        self.file.setframerate(int(sample_rate))
+
+    def write(self, data: np.ndarray):
+        self.file.writeframes(to_pcm16(to_frames(data)).tobytes())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# (サンプル数, チャンネル数)のfloat32配列にする
+def to_frames(data: np.ndarray):
+    waveform = np.asarray(data, dtype=np.float32)
+    if waveform.ndim == 1:
+        # モノラルは1chとして扱う
+        waveform = waveform.reshape(-1, 1)
+    return waveform
+
+
+# ffmpeg(f32le -> s16le)と同じく 32768倍して丸め、範囲外は切り詰める
+def to_pcm16(waveform: np.ndarray):
+    return np.clip(np.rint(waveform * 32768), -32768, 32767).astype('<i2')
+
+
+# PCM16bitのWAVを読み込む
+# 指定サンプリングレートと異なる場合やPCM16bit以外の場合、(None, None)を返す（呼び出し元でffmpegに任せる）
+def read_pcm16_wav(path: str, sample_rate=None):
+    if not os.path.exists(path):
+        return None, None
+
+    try:
+        with wave.open(path, 'rb') as f:
+            if f.getsampwidth() != 2 or (sample_rate and f.getframerate() != int(sample_rate)):
+                return None, None
+
+            channels = f.getnchannels()
+            rate = f.getframerate()
+            frames = f.readframes(f.getnframes())
+    except (wave.Error, EOFError):
+        # 非PCM(float, 圧縮形式など)はここで弾く
+        return None, None
+
+    waveform = np.frombuffer(frames, dtype='<i2').reshape(-1, channels).astype(np.float32) / 32768
+
+    return waveform, rate
+
+
+# 多チャンネル波形をモノラル(1次元)にする
+def to_monaural(data: np.ndarray):
+    waveform = np.asarray(data, dtype=np.float32)
+    if waveform.ndim == 1:
+        return waveform
+
+    # ffmpegのダウンミックス(ac=1)と同じく各チャンネルの平均
+    return waveform.mean(axis=1, dtype=np.float32)
+
+
+# PCM整数の波形をfloat32にする(float波形はそのまま)
+def to_float32(data: np.ndarray):
+    if data.dtype == np.int16:
+        return data.astype(np.float32) / 32768
+    return np.asarray(data, dtype=np.float32)
+
+
+# WAVのチャンクを辿って、形式と波形データの位置を取得する
+def read_wav_layout(path: str):
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            return None
+
+        layout = {}
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+
+            chunk_id, chunk_size = chunk_header[:4], struct.unpack('<L', chunk_header[4:])[0]
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                format_tag, channels, sample_rate, _, _, bits = struct.unpack('<HHLLHH', fmt[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    # 拡張形式の場合、実際の形式はサブフォーマットの先頭2byte
+                    format_tag = struct.unpack('<H', fmt[24:26])[0]
+                layout.update({"format_tag": format_tag, "channels": channels, "sample_rate": sample_rate, "sample_width": (bits + 7) // 8})
+            elif chunk_id == b'data':
+                if "channels" not in layout or layout["channels"] == 0 or layout["sample_width"] == 0:
+                    return None
+                layout["data_offset"] = f.tell()
+                # サイズ未確定(ストリーム出力途中など)の場合はファイル末尾まで
+                data_size = min(chunk_size, os.path.getsize(path) - layout["data_offset"])
+                layout["frames"] = data_size // (layout["channels"] * layout["sample_width"])
+                return layout
+            else:
+                f.seek(chunk_size, os.SEEK_CUR)
+
+            if chunk_size % 2 == 1:
+                # チャンクは2byte境界
+                f.seek(1, os.SEEK_CUR)
+
+
+# PCM16bitのWAVをメモリマップで開く(int16の(サンプル数, チャンネル数)配列)
+def mmap_pcm16_wav(path: str, layout=None):
+    layout = layout or read_wav_layout(path)
+    if not layout or layout["format_tag"] != 1 or layout["sample_width"] != 2 or layout["frames"] == 0:
+        return None, None
+
+    waveform = np.memmap(path, dtype='<i2', mode='r', offset=layout["data_offset"], shape=(layout["frames"], layout["channels"]))
+
+    return waveform, layout["sample_rate"]
+
+
+# 非圧縮のWAV(PCM 8/16/24/32bit, float 32/64bit)をメモリマップで開く
+# 戻り値はファイル上の形式のままの配列と形式。float化は pcm_to_float32 で必要な範囲だけ行う
+def mmap_wav(path: str, layout=None):
+    layout = layout or read_wav_layout(path)
+    if not layout or layout["frames"] == 0:
+        return None, None
+
+    width = layout["sample_width"]
+    shape = (layout["frames"], layout["channels"])
+
+    if layout["format_tag"] == WAVE_FORMAT_PCM and width in [1, 2, 4]:
+        dtype = {1: 'u1', 2: '<i2', 4: '<i4'}[width]
+    elif layout["format_tag"] == WAVE_FORMAT_PCM and width == 3:
+        # 24bitはbyte単位で持っておく
+        dtype = 'u1'
+        shape = (layout["frames"], layout["channels"], 3)
+    elif layout["format_tag"] == WAVE_FORMAT_IEEE_FLOAT and width in [4, 8]:
+        dtype = {4: '<f4', 8: '<f8'}[width]
+    else:
+        return None, None
+
+    return np.memmap(path, dtype=dtype, mode='r', offset=layout["data_offset"], shape=shape), layout
+
+
+# mmap_wavの配列(の一部)をfloat32の(サンプル数, チャンネル数)配列にする
+def pcm_to_float32(raw: np.ndarray, layout: dict):
+    width = layout["sample_width"]
+
+    if layout["format_tag"] == WAVE_FORMAT_IEEE_FLOAT:
+        return np.asarray(raw, dtype=np.float32)
+
+    if width == 1:
+        # 8bitは符号なし
+        return (raw.astype(np.float32) - 128) / 128
+
+    if width == 3:
+        # 下位byteから組み立てて、符号付き24bitにする
+        raw = raw.astype(np.int32)
+        values = raw[..., 0] | (raw[..., 1] << 8) | (raw[..., 2] << 16)
+        values = np.where(values >= (1 << 23), values - (1 << 24), values)
+        return values.astype(np.float32) / (1 << 23)
+
+    return raw.astype(np.float32) / float(1 << (width * 8 - 1))
+
+
+# チャンネル数を揃える(モノラルへは平均、モノラルからは複製、それ以外は先頭から)
+def to_channels(data: np.ndarray, channels: int):
+    waveform = to_frames(data)
+
+    if waveform.shape[1] == channels:
+        return waveform
+    if channels == 1:
+        return to_monaural(waveform).reshape(-1, 1)
+    if waveform.shape[1] == 1:
+        return np.tile(waveform, (1, channels))
+    if waveform.shape[1] > channels:
+        return waveform[:, :channels]
+
+    # 足りないチャンネルは無音
+    return np.concatenate([waveform, np.zeros((len(waveform), channels - waveform.shape[1]), dtype=np.float32)], axis=1)
+
+
+# 波形全体をリサンプリングする
+def resample_poly(data: np.ndarray, src_rate: int, dst_rate: int):
+    resampler = PolyphaseResampler(src_rate, dst_rate, to_frames(data).shape[1])
+    return np.concatenate([resampler.process(data), resampler.flush()])
+
+
+# ポリフェーズフィルタによるリサンプリング(少しずつ入力できる)
+# フィルタは窓関数法(Kaiser窓, beta=5.0)の低域通過フィルタ。出力長は ceil(入力長 * 変換後 / 変換前)
+class PolyphaseResampler:
+    def __init__(self, src_rate: int, dst_rate: int, channels: int):
+        g = math.gcd(int(src_rate), int(dst_rate))
+        self.up = int(dst_rate) // g
+        self.down = int(src_rate) // g
+        self.channels = channels
+
+        # 遮断周波数は変換前後の低い方のナイキスト周波数
+        max_rate = max(self.up, self.down)
+        self.half_len = 10 * max_rate
+        n = np.arange(2 * self.half_len + 1) - self.half_len
+        h = np.sinc(n / max_rate) * np.kaiser(2 * self.half_len + 1, 5.0)
+        h = h / np.sum(h) * self.up
+
+        # 位相ごとの係数(up, taps_cnt)。h[p + j * up] = coefficients[p, j]
+        self.taps_cnt = int(math.ceil(len(h) / self.up))
+        self.coefficients = np.ascontiguousarray(np.append(h, np.zeros(self.taps_cnt * self.up - len(h))).reshape(self.taps_cnt, self.up).T)
+
+        # まだ使う入力(先頭の入力上の位置)。先頭より前は無音として埋めておく
+        self.buf = np.zeros((self.taps_cnt, channels), dtype=np.float64)
+        self.buf_start = -self.taps_cnt
+        self.in_cnt = 0
+        self.out_cnt = 0
+
+    def process(self, data: np.ndarray):
+        waveform = to_frames(data)
+        if self.up == self.down:
+            return waveform.copy()
+
+        self.buf = np.concatenate([self.buf, waveform])
+        self.in_cnt += len(waveform)
+
+        # 必要な入力が全部揃っている出力まで計算する
+        return self.render(max(self.out_cnt, (self.in_cnt * self.up - 1 - self.half_len) // self.down + 1))
+
+    # 残りの入力(末尾は無音扱い)から最後まで出力する
+    def flush(self):
+        if self.up == self.down:
+            return np.zeros((0, self.channels), dtype=np.float32)
+
+        # 末尾より後ろを無音で埋める
+        self.buf = np.concatenate([self.buf, np.zeros((self.half_len // self.up + 2, self.channels))])
+
+        return self.render(-(-self.in_cnt * self.up // self.down))
+
+    def render(self, end_cnt: int):
+        outputs = []
+        taps = np.arange(self.taps_cnt)
+
+        for start_cnt in range(self.out_cnt, end_cnt, RESAMPLE_BLOCK_SIZE):
+            qs = np.arange(start_cnt, min(end_cnt, start_cnt + RESAMPLE_BLOCK_SIZE)) * self.down + self.half_len
+            # 各出力に使う入力のbuf上の位置と、その係数
+            idxs = (qs // self.up).reshape(-1, 1) - taps - self.buf_start
+            coefficients = self.coefficients[qs % self.up]
+
+            output = np.empty((len(qs), self.channels), dtype=np.float32)
+            for ch in range(self.channels):
+                output[:, ch] = np.sum(self.buf[:, ch][idxs] * coefficients, axis=1)
+            outputs.append(output)
+
+        self.out_cnt = max(self.out_cnt, end_cnt)
+
+        # 次の出力で使わない入力は捨てる
+        next_start = (self.out_cnt * self.down + self.half_len) // self.up - self.taps_cnt + 1
+        if next_start > self.buf_start:
+            self.buf = self.buf[(next_start - self.buf_start):]
+            self.buf_start = next_start
+
+        return np.concatenate(outputs) if outputs else np.zeros((0, self.channels), dtype=np.float32)
+
+
+# 音声分離結果の形式を記録する
+def write_stem_manifest(process_dir: str, manifest: dict):
+    with open(os.path.join(process_dir, STEM_MANIFEST_FILE), "w", encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+
+
+# 記録済みの音声分離結果のうち、指定ステムをメモリマップで開く
+# 記録がない場合や、ファイルが記録と異なる場合は(None, None)を返す
+def mmap_stem(process_dir: str, stem_name: str, sample_rate=None, channels=None):
+    manifest_path = os.path.join(process_dir, STEM_MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None, None
+
+    with open(manifest_path, "r", encoding='utf-8') as f:
+        stem = json.load(f).get("stems", {}).get(stem_name)
+
+    if not stem or (sample_rate and stem["sample_rate"] != sample_rate) or (channels and stem["channels"] != channels):
+        return None, None
+
+    stem_path = os.path.join(process_dir, stem["file"])
+    layout = read_wav_layout(stem_path)
+    if not layout or any(layout.get(k) != stem[k] for k in ["sample_rate", "channels", "sample_width", "data_offset", "frames"]):
+        logger.warning("音声分離結果が記録と異なるため、再度読み込みます: {0}", stem_path)
+        return None, None
+
+    return mmap_pcm16_wav(stem_path, layout)
+
+
+# 音声分離結果のボーカル(16kHzモノラル)を1次元の配列で読み込む
+# 記録済みのステム → 16kHzのPCM WAV → 音声アダプタ(リサンプリング)の順に試す
+def load_monaural_16k(process_dir: str, adapter_name: str):
+    # 音声分離で記録済みの16kHzモノラルであれば、デコードせずにメモリマップで開く
+    data, org_rate = mmap_stem(process_dir, "vocals", sample_rate=16000, channels=1)
+    if data is not None:
+        return data[:, 0], int(org_rate)
+
+    # wavを読み込み(16kHzのPCM WAVであればffmpegを経由しない)
+    vocal_audio_file = os.path.join(process_dir, 'vocals.wav')
+    data, org_rate = read_pcm16_wav(vocal_audio_file, sample_rate=16000)
+    if data is None:
+        if adapter_name == "numpy":
+            # WAVはNumPyでリサンプリング(圧縮形式のみffmpeg)
+            from mmd.numpy_adapter import NumpyAudioAdapter
+            audio_adapter = NumpyAudioAdapter()
+        else:
+            # リサンプリングが必要な場合のみffmpeg(spleeterのアダプタ)で読み込む
+            from mmd.monaural_adapter import FFMPEGMonauralProcessAudioAdapter
+            audio_adapter = FFMPEGMonauralProcessAudioAdapter()
+        data, org_rate = audio_adapter.load(vocal_audio_file, sample_rate=16000)
+
+    # モノラルに変換
+    return to_monaural(data), int(org_rate)
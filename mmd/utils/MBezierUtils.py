@@ -3,7 +3,6 @@
 from mmd.module.MMath import MRect, MVector2D, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
 from mmd.utils.MLogger import MLogger # noqa
 import numpy as np
-import bezier
 
 logger = MLogger(__name__)
 
@@ -129,6 +128,9 @@ def calc_value_from_catmullrom(bone_name: str, fnos: list, values: list):
 
 # 指定したすべての値を通るカトマル曲線からベジェ曲線を計算し、MMD補間曲線範囲内に収められた場合、そのベジェ曲線を返す
 def join_value_2_bezier(fno: int, bone_name: str, values: list, offset=0, diff_limit=0.01):
+    # bezierはベジェ曲線を扱う時だけ読み込む
+    import bezier
+
     if len(values) <= 2 or abs(np.max(values) - np.min(values)) < 1e-8:
         # 次数が1か変化がほぼない場合、線形補間
         logger.debug("次数1: values: {0}", values)
@@ -321,6 +323,9 @@ def convert_catmullrom_2_bezier(xs: np.ndarray, ys: np.ndarray):
 
 # 指定された複数のXと交わるそれぞれのYを返す
 def intersect_by_x(curve, xs: np.ndarray):
+    # bezierはベジェ曲線を扱う時だけ読み込む
+    import bezier
+
     ys = []
 
     for x in xs:
@@ -390,6 +395,9 @@ def evaluate(x1v: int, y1v: int, x2v: int, y2v: int, start: int, now: int, end:
 
 # 指定されたtになるフレーム番号を取得する
 def evaluate_by_t(x1v: int, y1v: int, x2v: int, y2v: int, start: int, end: int, t: float):
+    # bezierはベジェ曲線を扱う時だけ読み込む
+    import bezier
+
     if (end - start) <= 1:
         # 差が1以内の場合、終了
         return start, 0, t
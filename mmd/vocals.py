@@ -1,26 +1,26 @@
 # -*- coding: utf-8 -*-
 import os
-import argparse
-import glob
-import sys
-import json
+import time
 import pathlib
-import _pickle as cPickle
-
-# import vision essentials
-import cv2
-import numpy as np
-import tensorflow as tf
-from tqdm import tqdm
 import datetime
 import shutil
 
-from spleeter.separator import Separator
-from spleeter.audio.adapter import get_default_audio_adapter
+import numpy as np
+
+# spleeter(tensorflow)・ffmpegは使う時だけ読み込む
+from mmd.utils.MAudioUtils import PCM16WavWriter, read_wav_layout, write_stem_manifest
+from mmd.numpy_adapter import get_audio_adapter, WavStreamReader, NumpyMonauralStreamWriter
 from mmd.utils.MLogger import MLogger
 
 logger = MLogger(__name__)
 
+# 分割分離時の読み込み形式(spleeterの既定と同じ)
+STREAM_SAMPLE_RATE = 44100
+STREAM_CHANNELS = 2
+
+# 音声ファイルとして扱う拡張子(ディレクトリ一括処理時)
+AUDIO_EXTENSIONS = [".wav", ".mp3", ".m4a", ".flac", ".ogg", ".aac", ".mp4"]
+
 def execute(args):
     try:
         logger.info('音声分離処理開始: {0}', args.audio_file, decoration=MLogger.DECORATION_BOX)
@@ -37,18 +37,110 @@ def execute(args):
         else:
             process_audio_dir = os.path.join(base_path, "{0}_{1:%Y%m%d_%H%M%S}".format(os.path.basename(args.audio_file).replace('.', '_'), datetime.datetime.now()))
 
-        # 既存は削除
-        if os.path.exists(process_audio_dir):
-            shutil.rmtree(process_audio_dir)
+        # 音声と曲に分離
+        separator = create_separator(args.separator)
 
-        # フォルダ生成
-        os.makedirs(process_audio_dir)
+        separate_file(args, separator, args.audio_file, process_audio_dir)
 
-        audio_adapter = get_default_audio_adapter()
-        waveform, sample_rate = audio_adapter.load(args.audio_file)
+        logger.info('音声分離処理終了: {0}', process_audio_dir, decoration=MLogger.DECORATION_BOX)
 
-        # 音声と曲に分離
-        separator = Separator('spleeter:2stems')
+        return True, process_audio_dir
+    except Exception as e:
+        logger.critical("音声分離で予期せぬエラーが発生しました。", e, decoration=MLogger.DECORATION_BOX)
+        return False, None
+
+
+# ディレクトリ内、もしくは一覧ファイルに記載された複数の音声ファイルを、同じ分離器で続けて分離する
+def execute_batch(args):
+    try:
+        logger.info('一括音声分離処理開始: {0}', args.audio_batch, decoration=MLogger.DECORATION_BOX)
+
+        audio_files = list_batch_audio_files(args.audio_batch)
+        if not audio_files:
+            logger.error("指定された一括処理対象に音声ファイルがありません。\n{0}", args.audio_batch, decoration=MLogger.DECORATION_BOX)
+            return False, []
+
+        # 分離器(TFのグラフと重み)は1回だけ生成する
+        start = time.time()
+        separator = create_separator(args.separator)
+        if args.separator_warmup:
+            warmup_separator(separator)
+        setup_sec = time.time() - start
+        logger.info("分離器準備完了: {0:.2f}秒", setup_sec)
+
+        process_audio_dirs = []
+        total_audio_sec = 0
+        total_separate_sec = 0
+        for aidx, audio_file in enumerate(audio_files):
+            if not os.path.exists(audio_file):
+                logger.warning("【No.{0}】音声ファイルが存在しないため、スキップします。\n{1}", f'{aidx:03}', audio_file, decoration=MLogger.DECORATION_BOX)
+                continue
+
+            # 親パスの指定があればその下に、なければ音声ファイルの隣に出力する
+            dir_name = "{0}_{1:%Y%m%d_%H%M%S}".format(os.path.basename(audio_file).replace('.', '_'), datetime.datetime.now())
+            process_audio_dir = os.path.join(args.parent_dir if args.parent_dir else str(pathlib.Path(audio_file).parent), dir_name)
+
+            start = time.time()
+            audio_sec = separate_file(args, separator, audio_file, process_audio_dir)
+            separate_sec = time.time() - start
+
+            total_audio_sec += audio_sec
+            total_separate_sec += separate_sec
+            process_audio_dirs.append(process_audio_dir)
+
+            logger.info("【No.{0}】音声分離: {1}\n　音声長: {2:.1f}秒, 処理時間: {3:.1f}秒, 速度: {4:.1f}倍速", \
+                        f'{aidx:03}', audio_file, audio_sec, separate_sec, audio_sec / max(separate_sec, 1e-6))
+
+        # 分離器の準備時間も含めて、1ファイルあたりに均した値
+        total_sec = setup_sec + total_separate_sec
+        logger.info('一括音声分離処理終了: {0}ファイル\n　音声長合計: {1:.1f}秒, 処理時間合計: {2:.1f}秒(準備 {3:.1f}秒)\n　1ファイルあたり: {4:.1f}秒, 速度: {5:.1f}倍速', \
+                    len(process_audio_dirs), total_audio_sec, total_sec, setup_sec, total_sec / max(1, len(process_audio_dirs)), \
+                    total_audio_sec / max(total_sec, 1e-6), decoration=MLogger.DECORATION_BOX)
+
+        return True, process_audio_dirs
+    except Exception as e:
+        logger.critical("一括音声分離で予期せぬエラーが発生しました。", e, decoration=MLogger.DECORATION_BOX)
+        return False, []
+
+
+# 一括処理対象の音声ファイル一覧
+# ディレクトリの場合は直下の音声ファイル、ファイルの場合は1行1パスの一覧(#始まりはコメント)
+def list_batch_audio_files(audio_batch: str):
+    if os.path.isdir(audio_batch):
+        return sorted([os.path.join(audio_batch, file_name) for file_name in os.listdir(audio_batch) \
+                       if os.path.splitext(file_name)[1].lower() in AUDIO_EXTENSIONS])
+
+    if not os.path.exists(audio_batch):
+        return []
+
+    audio_files = []
+    with open(audio_batch, "r", encoding='utf-8') as f:
+        for line in f.readlines():
+            audio_file = line.strip()
+            if audio_file and not audio_file.startswith('#'):
+                # 相対パスは一覧ファイルからの位置
+                audio_files.append(os.path.join(os.path.dirname(os.path.abspath(audio_batch)), audio_file))
+
+    return audio_files
+
+
+# 音声ファイル1件を分離して、指定ディレクトリに出力する。分離した音声の秒数を返す
+def separate_file(args, separator, audio_file: str, process_audio_dir: str):
+    # 既存は削除
+    if os.path.exists(process_audio_dir):
+        shutil.rmtree(process_audio_dir)
+
+    # フォルダ生成
+    os.makedirs(process_audio_dir)
+
+    if args.chunk_sec > 0:
+        # 一定区間ごとに分離して、そのままwavに書き込む
+        sample_rate = STREAM_SAMPLE_RATE
+        with StemWriter(process_audio_dir, STREAM_SAMPLE_RATE, STREAM_CHANNELS, args.vocals_full, args.audio_adapter) as writer:
+            separate_audio_stream(separator, audio_file, writer, args.chunk_sec, args.chunk_overlap_sec, args.audio_adapter)
+    else:
+        audio_adapter = get_audio_adapter(args.audio_adapter)
+        waveform, sample_rate = audio_adapter.load(audio_file)
 
         # Perform the separation :
         prediction = separator.separate(waveform)
@@ -56,17 +148,149 @@ def execute(args):
         # 音声データ
         vocals = prediction['vocals']
 
-        vocals_wav_path = f"{process_audio_dir}/vocals.wav"
+        # 音素分解用の16kHzモノラルで保存
+        with StemWriter(process_audio_dir, sample_rate, vocals.shape[-1], args.vocals_full, args.audio_adapter) as writer:
+            writer.write(vocals)
 
-        # 一旦wavとして保存
-        audio_adapter.save(vocals_wav_path, vocals, sample_rate, "wav")
+    # リップ生成時に再デコードしなくて済むよう、出力形式を記録する
+    write_stem_manifest(process_audio_dir, {"source": audio_file, "separator": args.separator, "stems": writer.stems()})
 
-        logger.info('音声分離処理終了: {0}', process_audio_dir, decoration=MLogger.DECORATION_BOX)
+    return writer.frame_cnt / sample_rate
 
-        return True, process_audio_dir
-    except Exception as e:
-        logger.critical("音声分離で予期せぬエラーが発生しました。", e, decoration=MLogger.DECORATION_BOX)
-        return False, None
- 
 
- 
\ No newline at end of file
+# 短い無音で一度分離して、TFのグラフ構築・重み読み込みを先に済ませておく
+def warmup_separator(separator):
+    separator.separate(np.zeros((STREAM_SAMPLE_RATE, STREAM_CHANNELS), dtype=np.float32))
+
+
+# 分離器の生成
+def create_separator(name: str):
+    if name == "identity":
+        return IdentitySeparator()
+
+    from spleeter.separator import Separator
+    return Separator(name)
+
+
+# 入力をそのまま音声として返す分離器(モデルの重みなしで分割・重ね合わせ処理を確認する用)
+class IdentitySeparator:
+    def separate(self, waveform: np.ndarray):
+        return {'vocals': waveform, 'accompaniment': np.zeros_like(waveform)}
+
+
+# 分離した音声の書き込み先
+# 音素分解用の16kHzモノラル(vocals.wav)と、必要に応じて元のサンプリングレートのまま(vocals_full.wav)を同時に書き込む
+class StemWriter:
+    def __init__(self, process_audio_dir: str, sample_rate: int, channels: int, is_full: int, audio_adapter="ffmpeg"):
+        self.process_audio_dir = process_audio_dir
+        # 書き込んだサンプル数
+        self.frame_cnt = 0
+        self.stem_files = {"vocals": "vocals.wav"}
+        if audio_adapter == "numpy":
+            # ffmpegを使わずにリサンプリング・モノラル化する
+            self.writers = [NumpyMonauralStreamWriter(os.path.join(process_audio_dir, "vocals.wav"), sample_rate, channels)]
+        else:
+            from mmd.monaural_adapter import FFMPEGMonauralStreamWriter
+            self.writers = [FFMPEGMonauralStreamWriter(os.path.join(process_audio_dir, "vocals.wav"), sample_rate, channels)]
+
+        if is_full:
+            self.stem_files["vocals_full"] = "vocals_full.wav"
+            self.writers.append(PCM16WavWriter(os.path.join(process_audio_dir, "vocals_full.wav"), sample_rate, channels))
+
+    def write(self, data: np.ndarray):
+        for writer in self.writers:
+            writer.write(data)
+        self.frame_cnt += len(data)
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+    # 書き込んだファイルの形式
+    def stems(self):
+        stems = {}
+        for stem_name, stem_file in self.stem_files.items():
+            stems[stem_name] = {"file": stem_file}
+            stems[stem_name].update(read_wav_layout(os.path.join(self.process_audio_dir, stem_file)) or {})
+        return stems
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# 音声ファイルを一定区間ごとに分離して、重なり部分をクロスフェードしながら書き込む
+def separate_audio_stream(separator, audio_file: str, writer, chunk_sec: float, overlap_sec: float, audio_adapter="ffmpeg"):
+    chunk_size = max(1, int(round(chunk_sec * STREAM_SAMPLE_RATE)))
+    overlap_size = min(chunk_size - 1, max(0, int(round(overlap_sec * STREAM_SAMPLE_RATE))))
+
+    reader = WavStreamReader(audio_file, STREAM_SAMPLE_RATE, STREAM_CHANNELS) if audio_adapter == "numpy" else None
+    if reader and reader.is_valid():
+        # 非圧縮のWAVはメモリマップから読み込む
+        chunk_cnt = separate_chunks(separator, iter_overlapped_chunks(reader.read, chunk_size, overlap_size), writer, overlap_size)
+    else:
+        import ffmpeg
+
+        process = (
+            ffmpeg
+            .input(audio_file)
+            .output('pipe:', format='f32le', ar=STREAM_SAMPLE_RATE, ac=STREAM_CHANNELS)
+            .global_args('-loglevel', 'error')
+            .run_async(pipe_stdout=True))
+
+        def read_audio(sample_cnt: int):
+            buf = process.stdout.read(sample_cnt * STREAM_CHANNELS * 4)
+            return np.frombuffer(buf[:(len(buf) // (STREAM_CHANNELS * 4) * STREAM_CHANNELS * 4)], dtype='<f4').reshape(-1, STREAM_CHANNELS)
+
+        try:
+            chunk_cnt = separate_chunks(separator, iter_overlapped_chunks(read_audio, chunk_size, overlap_size), writer, overlap_size)
+        finally:
+            process.stdout.close()
+            process.wait()
+
+    logger.info("分割分離終了: 区間数 {0}, 区間 {1}秒, 重なり {2}秒", chunk_cnt, chunk_size / STREAM_SAMPLE_RATE, overlap_size / STREAM_SAMPLE_RATE)
+
+
+# read_audio(サンプル数)で読み込んだ音声を、前の区間の末尾overlap_sizeを先頭に含めた区間ごとに返す
+def iter_overlapped_chunks(read_audio, chunk_size: int, overlap_size: int):
+    chunk = read_audio(chunk_size)
+    if len(chunk) == 0:
+        return
+
+    yield chunk
+
+    while True:
+        # 重なり分は前の区間から引き継ぐ
+        audio = read_audio(chunk_size - overlap_size)
+        if len(audio) == 0:
+            return
+
+        chunk = np.concatenate([chunk[-overlap_size:] if overlap_size > 0 else chunk[:0], audio])
+        yield chunk
+
+
+# 区間ごとに分離し、前の区間との重なりをクロスフェードして書き込む
+# 各区間の末尾overlap_sizeは次の区間と混ぜるまで保留する
+def separate_chunks(separator, chunks, writer, overlap_size: int):
+    tail = None
+    chunk_cnt = 0
+
+    for chunk in chunks:
+        vocals = np.array(separator.separate(chunk)['vocals'][:len(chunk)], dtype=np.float32)
+
+        if tail is not None and len(tail) > 0:
+            # 前の区間の末尾から今の区間へ線形に切り替える
+            fade = ((np.arange(len(tail), dtype=np.float32) + 0.5) / len(tail)).reshape(-1, 1)
+            vocals[:len(tail)] = tail * (1 - fade) + vocals[:len(tail)] * fade
+
+        split_idx = max(0, len(vocals) - overlap_size)
+        writer.write(vocals[:split_idx])
+        tail = vocals[split_idx:]
+        chunk_cnt += 1
+
+    if tail is not None:
+        writer.write(tail)
+
+    return chunk_cnt
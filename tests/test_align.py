@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+
+import pytest
+
+from mmd.align import JuliusAligner, JuliusServer, JuliusServerPool, parse_palign
+
+# 記録しておいた julius -palign の出力(歌詞「かき」)
+PALIGN_OUTPUT = """STAT: include config: dummy
+### read waveform input
+Stat: adin_file: input speechfile: block.wav
+=== begin forced alignment ===
+-- phoneme alignment --
+ id: from  to    n_score    unit
+ ----------------------------------------
+[   0   14]  -1.432617  silB
+[  15   22] -22.184570  k
+[  23   41] -19.706543  a
+[  42   47] -23.440918  k
+[  48   70] -20.137695  i
+[  71   90]  -1.119141  silE
+re-computed AM score: -2035.123047
+=== end forced alignment ===
+"""
+
+EXPECTED = [(0.0, 0.1625, "silB"), (0.1625, 0.2425, "k"), (0.2425, 0.4325, "a"), (0.4325, 0.4925, "k"),
+            (0.4925, 0.7225, "i"), (0.7225, 0.9225, "silE")]
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="stub executable needs a shebang")
+
+
+# 標準入力から音声ファイル名を読み、記録した出力を返すだけのJulius
+def write_stub(tmp_path, output: str, sleep_sec=0):
+    path = tmp_path / "julius"
+    path.write_text("#!{0}\nimport sys, time\nsys.stdin.readline()\ntime.sleep({1})\nsys.stdout.write({2!r})\n".format(sys.executable, sleep_sec, output))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def as_tuples(segments):
+    return [tuple(s) for s in segments]
+
+
+def test_parse_palign():
+    assert as_tuples(parse_palign(PALIGN_OUTPUT.splitlines(), ["k a", "k i"])) == EXPECTED
+    # 終了行がない場合は失敗
+    assert parse_palign(PALIGN_OUTPUT.splitlines()[:-1], ["k a", "k i"]) is None
+
+
+def test_run_with_stub(tmp_path):
+    aligner = JuliusAligner(julius_path=write_stub(tmp_path, PALIGN_OUTPUT), hmmdefs="dummy")
+
+    assert as_tuples(aligner.align(str(tmp_path / "block.wav"), "か\nき\n")) == EXPECTED
+
+
+def test_run_failure(tmp_path):
+    aligner = JuliusAligner(julius_path=write_stub(tmp_path, "<search failed>\n"), hmmdefs="dummy")
+    assert aligner.align(str(tmp_path / "block.wav"), "かき") is None
+
+    # 実行ファイルがない
+    aligner = JuliusAligner(julius_path=str(tmp_path / "none"), hmmdefs="dummy")
+    assert aligner.align(str(tmp_path / "block.wav"), "かき") is None
+
+
+def test_run_timeout(tmp_path):
+    aligner = JuliusAligner(julius_path=write_stub(tmp_path, PALIGN_OUTPUT, sleep_sec=30), hmmdefs="dummy", timeout=0.5)
+
+    start = time.time()
+    assert aligner.align(str(tmp_path / "block.wav"), "かき") is None
+    assert time.time() - start < 10
+
+
+# モジュールモード(-module ポート)に対応したJulius
+# 文法は無視し、標準入力から受け取った音声ファイル名を音素名にした結果を返す(結果の取り違えを検出する)
+MODULE_STUB = """
+import os, socket, sys, threading, time
+args = sys.argv[1:]
+if "-module" not in args:
+    sys.stdin.readline()
+    sys.stdout.write({palign!r})
+    sys.exit(0)
+
+port = int(args[args.index("-module") + 1])
+time.sleep(0.2)
+server = socket.socket()
+try:
+    server.bind(("localhost", port))
+except OSError:
+    sys.exit(1)
+server.listen(1)
+conn, _ = server.accept()
+
+def watch():
+    for line in conn.makefile("r"):
+        if line.startswith("DIE"):
+            os._exit(0)
+
+threading.Thread(target=watch, daemon=True).start()
+for line in sys.stdin:
+    name = os.path.basename(line.strip())
+    time.sleep(0.01)
+    conn.sendall(("<STARTRECOG/>\\n.\\n<ALIGN>\\n<PHONEME BEGINFRAME=\\"0\\" ENDFRAME=\\"9\\" PHONE=\\"" + name + "\\"/>\\n</ALIGN>\\n.\\n").encode("utf-8"))
+"""
+
+
+def write_module_stub(tmp_path):
+    path = tmp_path / "julius_module"
+    path.write_text("#!{0}\n".format(sys.executable) + MODULE_STUB.format(palign=PALIGN_OUTPUT))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def run_pool(pool, names, results):
+    for name in names:
+        results.append((name, [tuple(s) for s in pool.align(os.path.join("blocks", name), "かき")]))
+
+
+def test_server_pools_do_not_share_ports(tmp_path):
+    aligner = JuliusAligner(julius_path=write_module_stub(tmp_path), hmmdefs="dummy", timeout=10)
+    # 同時に動く2つのリップ生成
+    pools = [JuliusServerPool(aligner, 2), JuliusServerPool(aligner, 2)]
+    results = [[], []]
+    threads = [threading.Thread(target=run_pool, args=(pool, ["p{0}_{1}.wav".format(pidx, n) for n in range(10)], result)) \
+               for pidx, (pool, result) in enumerate(zip(pools, results))]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        for pool in pools:
+            pool.close()
+
+    for result in results:
+        assert len(result) == 10
+        for name, segments in result:
+            assert segments == [(0.0, 0.1125, name)]
+
+
+def test_server_refuses_taken_port(tmp_path):
+    aligner = JuliusAligner(julius_path=write_module_stub(tmp_path), hmmdefs="dummy", timeout=10)
+
+    # 別のプロセスが待ち受けているポート
+    other = socket.socket()
+    other.bind(("localhost", 0))
+    other.listen(1)
+    server = JuliusServer(aligner, other.getsockname()[1])
+    try:
+        # 常駐できないので、ワンショットで処理される
+        assert [tuple(s) for s in server.align(str(tmp_path / "block.wav"), "か\nき\n")] == EXPECTED
+        assert not server.is_available
+    finally:
+        server.close()
+        other.close()
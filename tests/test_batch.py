@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import argparse
+import os
+
+from mmd.batch import list_jobs, preflight_audio_dirs
+
+
+def make_args(manifest: str, process: str):
+    return argparse.Namespace(manifest=manifest, audio_dir_glob="", parent_dir="", process=process)
+
+
+def write_manifest(tmp_path, lines: list):
+    manifest = tmp_path / "songs.csv"
+    manifest.write_text("\n".join(["audio,lyrics,output"] + lines) + "\n", encoding="utf-8")
+    return str(manifest)
+
+
+def make_separated_dir(tmp_path, dir_name: str):
+    audio_dir = tmp_path / dir_name
+    audio_dir.mkdir()
+    (audio_dir / "vocals.wav").write_bytes(b"")
+    return str(audio_dir)
+
+
+# 音声分離しない場合、出力先の指定がなければ一番新しい分離済みディレクトリを使う
+def test_list_jobs_resolves_separated_dir(tmp_path):
+    make_separated_dir(tmp_path, "song1_wav_20240101_000000")
+    latest_dir = make_separated_dir(tmp_path, "song1_wav_20240301_120000")
+    # 分離済みの音声がないディレクトリ・別の曲のディレクトリは使わない
+    (tmp_path / "song1_wav_20240401_000000").mkdir()
+    make_separated_dir(tmp_path, "song10_wav_20240501_000000")
+    output_dir = make_separated_dir(tmp_path, "out2")
+
+    manifest = write_manifest(tmp_path, ["song1.wav,song1.txt,", "song2.wav,song2.txt,out2", "song3.wav,song3.txt,"])
+    jobs = list_jobs(make_args(manifest, "lip"))
+
+    assert [job.audio_dir for job in jobs] == [latest_dir, output_dir, ""]
+
+    preflight_audio_dirs(jobs)
+    assert [job.result for job in jobs] == [True, True, False]
+
+
+# 出力先に分離済みの音声がなければ、曲毎の処理の前に失敗にする
+def test_preflight_audio_dirs_missing_vocals(tmp_path):
+    (tmp_path / "empty").mkdir()
+
+    manifest = write_manifest(tmp_path, ["song1.wav,song1.txt,empty", "song2.wav,song2.txt,missing"])
+    jobs = list_jobs(make_args(manifest, "segment,lip"))
+
+    preflight_audio_dirs(jobs)
+    assert [job.result for job in jobs] == [False, False]
+
+
+# 音声分離する場合は、これまで通り新しい日時付きのディレクトリに出力する
+def test_list_jobs_new_dir_for_vocals(tmp_path):
+    make_separated_dir(tmp_path, "song1_wav_20240101_000000")
+
+    manifest = write_manifest(tmp_path, ["song1.wav,song1.txt,"])
+    jobs = list_jobs(make_args(manifest, "vocals,lip"))
+
+    assert os.path.dirname(jobs[0].audio_dir) == str(tmp_path)
+    assert os.path.basename(jobs[0].audio_dir).startswith("song1_wav_")
+    assert not os.path.exists(jobs[0].audio_dir)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import itertools
+
+from mmd.exo import EXO_TEXT_LEN, encode_exo_text, iter_lab_labels, iter_lab_syllables
+from mmd.kana import PHONEME2KANA
+
+# 「かん」「あい」の音素解析結果(.lab)
+LAB_TXTS = [
+    ("0.0000", "0.2000", "silB"),
+    ("0.2000", "0.3000", "k"),
+    ("0.3000", "0.6000", "a"),
+    ("0.6000", "0.8000", "N"),
+    ("0.8000", "1.1000", "a"),
+    ("1.1000", "1.4000", "i"),
+    ("1.4000", "1.6000", "silE"),
+]
+
+
+# 母音と「ん」だけが音節になり、前が母音以外の場合は繋がる(区間は前の音素の開始から)
+def test_iter_lab_labels():
+    assert list(iter_lab_labels(LAB_TXTS, 100)) == [
+        (100 + 5, 100 + 20, "ka"),
+        (100 + 8, 100 + 26, "N"),
+        (100 + 16, 100 + 35, "Na"),
+        (100 + 22, 100 + 44, "i"),
+    ]
+
+
+# 音素毎の区間は前後に0.05秒の余白を付け、0秒～音素数秒に収める
+def test_iter_lab_syllables_clamp():
+    labs = list(iter_lab_syllables([("0.0200", "2.5000", "a"), ("2.5000", "3.0000", "i")], 0))
+
+    assert [(lab.start_s, lab.end_s) for lab in labs] == [(0, 2), (2, 2)]
+    assert [(lab.prev_syllable, lab.prev_start_s) for lab in labs] == [("", 0), ("a", 0)]
+    assert [(lab.start_fno, lab.end_fno, lab.chara) for lab in labs] == [(0, 60, "a"), (0, 60, "i")]
+
+
+# 以前のリップ生成で使っていた変換(unicode_escapeの16進を入れ替えて、"0"で埋める)
+def legacy_encode_exo_text(txt: str):
+    escape_txt = ""
+    for c in txt:
+        escape_chara = c.encode('unicode_escape').decode('utf-8')
+        escape_txt += escape_chara[4:6]
+        escape_txt += escape_chara[2:4]
+
+    return escape_txt.ljust(4096, '0')
+
+
+# ひらがな・カタカナ・記号(ー、゛など)
+KANA_CHARS = [chr(code) for code in itertools.chain(range(0x3041, 0x3097), range(0x3099, 0x30A0), range(0x30A1, 0x30FB), range(0x30FC, 0x3100))]
+
+
+def test_encode_exo_text_matches_legacy():
+    txts = KANA_CHARS + ["".join(pair) for pair in itertools.product(KANA_CHARS, repeat=2)]
+    # リップ生成で出力する音節と、英字混じり(英字は出力しない)
+    txts += list(PHONEME2KANA.values()) + ["", "あa", "Nん", "か:"]
+
+    for txt in txts:
+        encoded_txt = encode_exo_text(txt)
+        assert len(encoded_txt) == EXO_TEXT_LEN
+        assert encoded_txt == legacy_encode_exo_text(txt), txt
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import itertools
+import os
+import random
+import shutil
+import subprocess
+
+import pytest
+
+import mmd.kana
+from mmd.kana import YOMI2VOCA_RULES, yomi2voca
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 前の文字と組み合わさって変換が変わる文字(小さいカナ・濁点・長音)
+MODIFIER_CHARS = "ぁぃぅぇぉゃゅょゎっ゛ー"
+
+
+# segment_julius.pl の yomi2voca を1行ずつ呼ぶ
+def perl_yomi2voca(tmp_path, texts: list):
+    with open(os.path.join(ROOT_DIR, "segment_julius.pl"), "r", encoding="utf-8") as f:
+        script = f.read()
+    sub_source = script[script.index("sub yomi2voca {"):]
+    sub_source = sub_source[:(sub_source.index("\n}\n") + 3)]
+
+    script_path = tmp_path / "yomi2voca.pl"
+    script_path.write_text(sub_source + 'while (<STDIN>) { print &yomi2voca($_), "\\n"; }\n', encoding="utf-8")
+
+    result = subprocess.run(["perl", str(script_path)], input="".join([text + "\n" for text in texts]).encode("utf-8"),
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    return result.stdout.decode("utf-8").split("\n")[:len(texts)]
+
+
+def make_inputs():
+    chars = sorted(set(c for kana, _ in YOMI2VOCA_RULES for c in kana))
+
+    texts = ["".join(pair) for pair in itertools.product(chars, repeat=2)]
+    # 2文字目か3文字目が小さいカナ・濁点・長音の3文字
+    texts += [a + b + c for a in chars for b in MODIFIER_CHARS for c in chars]
+    texts += [a + b + c for a in chars for b in chars if b not in MODIFIER_CHARS for c in MODIFIER_CHARS]
+
+    rng = random.Random(0)
+    texts += ["".join(rng.choice(chars) for _ in range(rng.randint(1, 20))) for _ in range(5000)]
+
+    return texts
+
+
+# 最長一致の変換表で、s///g を順番に適用する元のperlスクリプトと同じ結果になる
+@pytest.mark.skipif(shutil.which("perl") is None, reason="perl is not installed")
+def test_yomi2voca_matches_perl(tmp_path, monkeypatch):
+    # 変換できない文字を含む入力も比べるので、警告は出さない
+    monkeypatch.setattr(mmd.kana.logger, "warning", lambda *args, **kwargs: None)
+
+    texts = make_inputs()
+    expected = perl_yomi2voca(tmp_path, texts)
+
+    mismatches = [(text, voca, perl_voca) for text, voca, perl_voca in zip(texts, [yomi2voca(text) for text in texts], expected) if voca != perl_voca]
+    assert mismatches[:10] == []
+
+
+# カタカナはひらがなと同じ音素になる
+def test_yomi2voca_katakana():
+    assert yomi2voca("キャット") == yomi2voca("きゃっと") == "ky a q t o"
+    assert yomi2voca("カード") == yomi2voca("かーど") == "k a: d o"
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from mmd.numpy_adapter import NumpyAudioAdapter, NumpyMonauralStreamWriter, WavStreamReader
+from mmd.utils.MAudioUtils import read_pcm16_wav
+
+SRC_RATE = 44100
+DST_RATE = 16000
+FREQ = 440
+AMPLITUDE = 0.5
+PHASES = [0, 0.3]
+# 先頭・末尾はフィルタが無音を含むので、比較から外すサンプル数(16kHz)
+EDGE_CNT = 100
+
+
+# 各チャンネルで位相をずらした正弦波(サンプル数, チャンネル数)
+def make_sine(sample_rate: int, sample_cnt: int, phases=PHASES):
+    t = np.arange(sample_cnt).reshape(-1, 1) / sample_rate
+    return (AMPLITUDE * np.sin(2 * np.pi * FREQ * t + np.array(phases).reshape(1, -1))).astype(np.float32)
+
+
+def read_in_pieces(reader: WavStreamReader, sample_cnt: int):
+    pieces = []
+    while True:
+        piece = reader.read(sample_cnt)
+        if len(piece) == 0:
+            return np.concatenate(pieces)
+        pieces.append(piece)
+
+
+@pytest.fixture
+def sine_wav(tmp_path):
+    path = str(tmp_path / "sine.wav")
+    NumpyAudioAdapter().save(path, make_sine(SRC_RATE, SRC_RATE), SRC_RATE)
+    return path
+
+
+# 同じサンプリングレートで読めば、PCM16の量子化誤差の範囲で元に戻る
+def test_save_load_same_rate(sine_wav):
+    waveform, sample_rate = NumpyAudioAdapter().load(sine_wav, sample_rate=SRC_RATE)
+
+    assert sample_rate == SRC_RATE
+    assert waveform.shape == (SRC_RATE, len(PHASES))
+    np.testing.assert_allclose(waveform, make_sine(SRC_RATE, SRC_RATE), atol=1 / 32768)
+
+
+# 16kHzで読めば、16kHzで作った正弦波と一致する
+def test_load_resampled(sine_wav):
+    waveform, sample_rate = NumpyAudioAdapter().load(sine_wav, sample_rate=DST_RATE)
+
+    assert sample_rate == DST_RATE
+    assert waveform.shape == (DST_RATE, len(PHASES))
+    np.testing.assert_allclose(waveform[EDGE_CNT:-EDGE_CNT], make_sine(DST_RATE, DST_RATE)[EDGE_CNT:-EDGE_CNT], atol=1e-3)
+
+
+# 少しずつ読んでも、全体を一度に読んでモノラルにした場合と同じになる
+@pytest.mark.parametrize("sample_cnt", [1, 777, 16000, 100000])
+def test_stream_reader_matches_load(sine_wav, sample_cnt):
+    waveform, _ = NumpyAudioAdapter().load(sine_wav, sample_rate=DST_RATE)
+
+    reader = WavStreamReader(sine_wav, DST_RATE, 1)
+    assert reader.is_valid()
+
+    streamed = read_in_pieces(reader, sample_cnt)
+    assert streamed.shape == (DST_RATE, 1)
+    np.testing.assert_allclose(streamed[:, 0], waveform.mean(axis=1), atol=1e-6)
+
+
+# 少しずつ書き込んだ16kHzモノラルを読み直すと、正弦波の平均(ダウンミックス)と一致する
+def test_monaural_stream_writer(tmp_path):
+    path = str(tmp_path / "vocals.wav")
+    waveform = make_sine(SRC_RATE, SRC_RATE)
+
+    with NumpyMonauralStreamWriter(path, SRC_RATE, len(PHASES)) as writer:
+        for start in range(0, len(waveform), 4410):
+            writer.write(waveform[start:(start + 4410)])
+
+    written, sample_rate = read_pcm16_wav(path)
+    assert sample_rate == DST_RATE
+    assert written.shape == (DST_RATE, 1)
+
+    expected = make_sine(DST_RATE, DST_RATE).mean(axis=1)
+    np.testing.assert_allclose(written[EDGE_CNT:-EDGE_CNT, 0], expected[EDGE_CNT:-EDGE_CNT], atol=1e-3)
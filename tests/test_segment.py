@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+pytest.importorskip("quaternion")
+
+from mmd.lyrics import parse_lyrics  # noqa: E402
+from mmd.segment import assign_pieces, format_sec  # noqa: E402
+
+
+def check_blocks(blocks: list, pieces: list, range_start: float, range_end: float):
+    assert [lines for (_, _, lines) in blocks] == pieces
+
+    for bidx, (start, end, _) in enumerate(blocks):
+        # 長さ0の区間は作らない
+        assert range_start <= start < end <= range_end
+        if bidx > 0:
+            # 前の区間と重ならない
+            assert blocks[bidx - 1][1] <= start
+
+    # 区間付きの歌詞ファイルとしてそのまま読める
+    text = "\n\n".join(["{0}-{1}\n{2}".format(format_sec(start), format_sec(end), "\n".join(lines)) for (start, end, lines) in blocks])
+    lyrics_blocks, errors = parse_lyrics((text + "\n").splitlines(keepends=True), is_timed=True)
+    assert errors == []
+    assert len(lyrics_blocks) == len(blocks)
+
+
+# 無音(3箇所)よりかたまりの区切り(5箇所)が多い場合も、区切りは単調に増える
+def test_assign_pieces_more_pieces_than_silences():
+    pieces = [["あいうえお"], ["かきくけこ"], ["さしすせそ"], ["たちつてと"], ["なにぬねの"], ["はひふへほ"]]
+    voices = [(1, 4), (5, 8), (9, 12), (14, 18)]
+
+    blocks = assign_pieces(pieces, voices, 0, 20)
+    check_blocks(blocks, pieces, 0, 20)
+
+    # 無音はすべて区切りに使う
+    ends = [end for (_, end, _) in blocks]
+    for (_, voice_end), (next_start, _) in zip(voices[:-1], voices[1:]):
+        assert any(voice_end <= end <= next_start for end in ends)
+
+
+# 無音が十分ある場合は、文字数の比率に近い無音で区切る
+def test_assign_pieces_uses_nearest_silence():
+    pieces = [["あいうえお"], ["かきくけこ"]]
+    voices = [(0, 1), (2, 3), (4, 5), (6, 7)]
+
+    blocks = assign_pieces(pieces, voices, 0, 8)
+    check_blocks(blocks, pieces, 0, 8)
+    # 有音時間2秒の位置にある無音(3～4秒)
+    assert 3 <= blocks[0][1] <= blocks[1][0] <= 4
+
+
+# 有音区間がなければ、範囲を文字数で按分する
+def test_assign_pieces_without_voices():
+    pieces = [["あ"], ["かきくけこ"], ["さしすせそ"]]
+
+    blocks = assign_pieces(pieces, [], 10, 21)
+    check_blocks(blocks, pieces, 10, 21)
+    assert blocks[0][1] == pytest.approx(11)
+    assert blocks[1][1] == pytest.approx(16)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_assign_pieces_random(seed):
+    rng = np.random.default_rng(seed)
+
+    edges = np.cumsum(rng.uniform(0.2, 3, rng.integers(1, 12) * 2)) + 1
+    voices = [(float(s), float(e)) for s, e in edges.reshape(-1, 2)]
+    range_end = float(edges[-1] + 1)
+    pieces = [["あ" * int(rng.integers(1, 30))] for _ in range(rng.integers(2, 15))]
+
+    check_blocks(assign_pieces(pieces, voices, 0, range_end), pieces, 0, range_end)
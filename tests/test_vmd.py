@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+pytest.importorskip("quaternion")
+
+from mmd.mmd.PmxData import PmxModel  # noqa: E402
+from mmd.mmd.VmdData import VmdMotion, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame, VmdInfoIk  # noqa: E402
+from mmd.mmd.VmdReader import VmdReader  # noqa: E402
+from mmd.mmd.VmdWriter import VmdWriter  # noqa: E402
+from mmd.utils.MException import MParseException  # noqa: E402
+
+
+def write_motion(path, motion: VmdMotion):
+    model = PmxModel()
+    model.name = "リップモデル"
+    VmdWriter(model, motion, str(path)).write()
+
+
+def build_motion():
+    motion = VmdMotion(is_array_morph=True)
+    for fno, ratio in [(0, 0), (10, 0.5), (20, 1)]:
+        mf = VmdMorphFrame(fno)
+        mf.set_name("あ")
+        mf.ratio = ratio
+        motion.regist_mf(mf, mf.name, mf.fno)
+
+    sf = VmdShadowFrame()
+    sf.fno = 5
+    sf.type = 1
+    sf.distance = 0.25
+    motion.shadows.append(sf)
+
+    ikf = VmdShowIkFrame()
+    ikf.fno = 3
+    ikf.show = 1
+    ikf.ik.append(VmdInfoIk("左足ＩＫ", 0))
+    motion.showiks.append(ikf)
+
+    return motion
+
+
+def test_shadow_and_show_ik_round_trip(tmp_path):
+    path = tmp_path / "motion.vmd"
+    write_motion(path, build_motion())
+
+    motion = VmdReader(str(path)).read_data()
+
+    assert motion.morphs["あ"].keys() == [0, 10, 20]
+    assert [(sf.fno, sf.type, sf.distance) for sf in motion.shadows] == [(5, 1, 0.25)]
+    assert [(sf.fno, sf.show, [(ik.name, ik.onoff) for ik in sf.ik]) for sf in motion.showiks] == [(3, 1, [("左足ＩＫ", 0)])]
+
+
+def test_truncated_show_ik(tmp_path):
+    path = tmp_path / "motion.vmd"
+    write_motion(path, build_motion())
+
+    data = path.read_bytes()
+    for cut in [3, 10, 25]:
+        path.write_bytes(data[:-cut])
+        with pytest.raises(MParseException):
+            VmdReader(str(path)).read_data()
+
+
+def test_file_released_after_read(tmp_path):
+    path = tmp_path / "motion.vmd"
+    write_motion(path, build_motion())
+
+    arrays = VmdReader(str(path)).read_arrays()
+
+    # ファイルのマップが残っていない(Windowsでは上書き・削除できなくなる)
+    if os.path.exists("/proc/self/maps"):
+        with open("/proc/self/maps") as f:
+            assert str(path) not in f.read()
+
+    # 読み込んだ後にファイルを書き換えても、読み込んだ値は変わらない
+    path.write_bytes(b"\xff" * len(path.read_bytes()))
+    path.unlink()
+    assert arrays.morphs["ratio"].tolist() == [1, 0, 0.5]
+    assert arrays.shadows["distance"].tolist() == [0.25]
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from mmd.numpy_adapter import WavStreamReader
+from mmd.utils.MAudioUtils import PCM16WavWriter
+from mmd.vocals import STREAM_CHANNELS, STREAM_SAMPLE_RATE, IdentitySeparator, iter_overlapped_chunks, separate_audio_stream, separate_chunks
+
+
+# 書き込まれた音声をメモリに溜めるだけの書き込み先
+class ListWriter:
+    def __init__(self):
+        self.blocks = []
+
+    def write(self, data: np.ndarray):
+        self.blocks.append(np.array(data))
+
+    def result(self):
+        return np.concatenate(self.blocks) if self.blocks else np.zeros((0, STREAM_CHANNELS), dtype=np.float32)
+
+
+def make_reader(waveform: np.ndarray):
+    pos = [0]
+
+    def read_audio(sample_cnt: int):
+        data = waveform[pos[0]:(pos[0] + sample_cnt)]
+        pos[0] += len(data)
+        return data
+
+    return read_audio
+
+
+# 入力をそのまま返す分離器なら、区間に分けて重ね合わせても元の音声に戻る
+@pytest.mark.parametrize("sample_cnt, chunk_size, overlap_size", [
+    (10000, 1000, 0),
+    (10000, 1000, 100),
+    (10000, 999, 998),
+    (10007, 1024, 333),
+    (500, 1000, 100),
+    (1000, 1000, 100),
+    (1, 7, 3),
+])
+def test_separate_chunks_identity(sample_cnt, chunk_size, overlap_size):
+    waveform = np.random.default_rng(0).uniform(-1, 1, (sample_cnt, STREAM_CHANNELS)).astype(np.float32)
+
+    writer = ListWriter()
+    chunk_cnt = separate_chunks(IdentitySeparator(), iter_overlapped_chunks(make_reader(waveform), chunk_size, overlap_size), writer, overlap_size)
+
+    assert chunk_cnt == 1 + max(0, -(-(sample_cnt - chunk_size) // (chunk_size - overlap_size)))
+    result = writer.result()
+    assert result.shape == waveform.shape
+    # 重なりが長いと同じサンプルを何度もクロスフェードするので、float32の丸め誤差の分だけ許容する
+    np.testing.assert_allclose(result, waveform, atol=1e-5)
+
+
+def test_separate_chunks_empty():
+    writer = ListWriter()
+    empty = np.zeros((0, STREAM_CHANNELS), dtype=np.float32)
+
+    assert separate_chunks(IdentitySeparator(), iter_overlapped_chunks(make_reader(empty), 100, 10), writer, 10) == 0
+    assert len(writer.result()) == 0
+
+
+# WAVファイルからの分割分離(秒指定)でも、全体を一度に読んだ場合と同じになる
+@pytest.mark.parametrize("chunk_sec, overlap_sec", [
+    (1.0, 0),
+    (0.5, 0.1),
+    (0.37, 0.2),
+    (0.05, 0.049),
+    (5.0, 1.0),
+])
+def test_separate_audio_stream_identity(tmp_path, chunk_sec, overlap_sec):
+    audio_path = str(tmp_path / "audio.wav")
+    waveform = np.random.default_rng(1).uniform(-0.9, 0.9, (int(STREAM_SAMPLE_RATE * 2.3), STREAM_CHANNELS)).astype(np.float32)
+    with PCM16WavWriter(audio_path, STREAM_SAMPLE_RATE, STREAM_CHANNELS) as wav_writer:
+        wav_writer.write(waveform)
+
+    expected = WavStreamReader(audio_path, STREAM_SAMPLE_RATE, STREAM_CHANNELS).read(len(waveform) * 2)
+
+    writer = ListWriter()
+    separate_audio_stream(IdentitySeparator(), audio_path, writer, chunk_sec, overlap_sec, audio_adapter="numpy")
+
+    result = writer.result()
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result, expected, atol=1e-6)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# VMD出力(VmdWriter)の処理時間を、キーフレ毎に書き込む場合と比べる
+# 例: python vmd_benchmark.py --keys 100000
+import argparse
+import os
+import struct
+import tempfile
+import time
+
+import numpy as np
+
+from mmd.mmd.PmxData import PmxModel
+from mmd.mmd.VmdData import VmdMotion, VmdMorphFrame, VmdMorphTrack
+from mmd.mmd.VmdWriter import VmdWriter
+
+MORPH_NAMES = ['あ', 'い', 'う', 'え', 'お']
+
+
+def build_motion(key_cnt: int, is_array_morph: bool):
+    motion = VmdMotion(is_array_morph=is_array_morph)
+    rng = np.random.default_rng(0)
+    fnos = np.arange(key_cnt // len(MORPH_NAMES))
+
+    for morph_name in MORPH_NAMES:
+        ratios = rng.random(len(fnos)).astype(np.float32)
+        if is_array_morph:
+            track = VmdMorphTrack(morph_name)
+            track.assign(fnos, ratios)
+            motion.morphs[morph_name] = track
+        else:
+            motion.morphs[morph_name] = {}
+            for fno, ratio in zip(fnos.tolist(), ratios.tolist()):
+                mf = VmdMorphFrame(fno)
+                mf.set_name(morph_name)
+                mf.ratio = ratio
+                mf.key = True
+                motion.morphs[morph_name][fno] = mf
+
+    return motion
+
+
+# キーフレ毎に write を呼んでいた頃の書き方(モーフのみ)
+def write_per_frame(motion: VmdMotion, model: PmxModel, path: str):
+    with open(path, "wb") as fout:
+        fout.write(b'Vocaloid Motion Data 0002\x00\x00\x00\x00\x00')
+        fout.write(model.name.encode('shift_jis')[:20].ljust(20, b'\x00'))
+        fout.write(struct.pack('<L', 0))
+
+        morph_frames = motion.get_morph_frames()
+        fout.write(struct.pack('<L', len(morph_frames)))
+        for mf in morph_frames:
+            mf.write(fout)
+
+        # カメラ・照明・セルフ影・モデル表示
+        for _ in range(4):
+            fout.write(struct.pack('<L', 0))
+
+
+def measure(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keys', type=int, dest='keys', default=100000, help='Number of morph keys (split over the five vowel morphs)')
+
+    args = parser.parse_args()
+
+    model = PmxModel()
+    model.name = "リップモデル"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reference_path = os.path.join(tmp_dir, "reference.vmd")
+        dict_motion = build_motion(args.keys, False)
+        elapsed_sec = measure(write_per_frame, dict_motion, model, reference_path)
+        print(f"per-frame write (dict): {args.keys} keys: {elapsed_sec:.3f}s")
+
+        for is_array_morph in [False, True]:
+            path = os.path.join(tmp_dir, f"bulk_{int(is_array_morph)}.vmd")
+            motion = dict_motion if not is_array_morph else build_motion(args.keys, True)
+            elapsed_sec = measure(VmdWriter(model, motion, path).write)
+
+            with open(path, "rb") as f, open(reference_path, "rb") as rf:
+                is_same = f.read() == rf.read()
+            print(f"VmdWriter ({'array' if is_array_morph else 'dict'}): {args.keys} keys: {elapsed_sec:.3f}s, same bytes: {is_same}")